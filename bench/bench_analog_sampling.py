@@ -0,0 +1,153 @@
+# Host-side benchmark for WaterLevelReaderAnalog on a simulated resistive level sensor.
+#   legacy   - previous get_water_level: enable, two immediate reads, disable, on every state query
+#   pipeline - one enable cycle per tick (SAMPLES reads into array('H'), trimmed mean), cached for the tick
+# Both read right after powering the sensor (settle_ms defaults to 0), so neither sleeps in the loop.
+# The simulated sensor settles within the first read after being powered, has gaussian noise and occasional spikes.
+# Reports sensor power-on time and enable cycles per tick, the spread of the reported level at a constant true
+# level, and wet/dry flips with the true level just off the threshold (should be none).
+# Run from the repo root: python bench/bench_analog_sampling.py
+import math
+import random
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import board  # noqa: E402
+
+from util.debug import Debug  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.water_level import WaterLevelReaderAnalog  # noqa: E402
+
+TICKS = 2000
+QUERIES_PER_TICK = 3  # state action, display refresh, status/debug line
+LOOP_SECONDS = 1.0
+READ_US = 40  # One AnalogIn.value read
+SETTLE_TAU_US = 10  # Sensor output rise time constant after power on, the previous reader's immediate read is valid
+NOISE = 600
+SPIKE_CHANCE = 0.02
+SPIKE = 8000
+DRY_LEVEL = 30000
+TRUE_LEVELS = (DRY_LEVEL - 1500, DRY_LEVEL + 1500)  # Just wet and just dry
+
+
+class Clock:
+    def __init__(self):
+        self.ns = 0
+
+    def monotonic_ns(self):
+        return self.ns
+
+    def monotonic(self):
+        return self.ns / 1e9
+
+    def sleep(self, seconds):
+        self.ns += int(seconds * 1e9)
+
+
+class SimulatedSensor:
+    # AnalogIn stand-in, value depends on how long the enable pin has been high
+    def __init__(self, clock, enable, true_level):
+        self.clock = clock
+        self.enable = enable
+        self.true_level = true_level
+        self.reference_voltage = 3.3
+        self.enabled_at = None
+        self.random = random.Random(7)
+
+    @property
+    def value(self):
+        self.clock.ns += READ_US * 1000
+        if not self.enable.value:
+            return 0
+        settled = 1 - math.exp(-(self.clock.ns - self.enabled_at) / 1000 / SETTLE_TAU_US)
+        value = self.true_level * settled + self.random.gauss(0, NOISE)
+        if self.random.random() < SPIKE_CHANCE:
+            value += self.random.choice((-SPIKE, SPIKE))
+        return max(0, min(65535, int(value)))
+
+
+class Enable:
+    # DigitalInOut stand-in that tells the sensor when it was powered
+    def __init__(self, clock, sensor_holder):
+        self.clock = clock
+        self.holder = sensor_holder
+        self._value = False
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value and not self._value and self.holder:
+            self.holder[0].enabled_at = self.clock.ns
+        self._value = value
+
+    def switch_to_output(self, value=False):
+        self._value = value
+
+
+# The previous WaterLevelReaderAnalog.get_water_level, kept here for comparison
+def legacy_get_water_level(reader):
+    reader.water_enable.value = True
+    reader.legacy_on_ns = reader.clock.ns
+    millivolts = int(reader.water_level_sensor.value * (reader.water_level_sensor.reference_voltage * 1000 / 65535))
+    reader.water_level = reader.water_level_sensor.value
+    reader.water_enable.value = False
+    reader.power_on_ns += reader.clock.ns - reader.legacy_on_ns
+    reader.enable_cycles += 1
+    return reader.water_level
+
+
+def build(clock, true_level, legacy):
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    properties.config.water_levels = {"Bottom": {"dry": DRY_LEVEL}}
+    reader = WaterLevelReaderAnalog("Bottom", properties, board.D5, board.A0, debug)
+    holder = []
+    reader.water_enable = Enable(clock, holder)
+    reader.water_level_sensor = SimulatedSensor(clock, reader.water_enable, true_level)
+    holder.append(reader.water_level_sensor)
+    reader.clock = clock
+    if legacy:
+        reader.get_water_level = lambda: legacy_get_water_level(reader)
+    return reader
+
+
+def run(true_level, legacy):
+    clock = Clock()
+    time.monotonic_ns = clock.monotonic_ns
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    reader = build(clock, true_level, legacy)
+    levels = []
+    flips = 0
+    last_state = None
+    for _ in range(TICKS):
+        for query in range(QUERIES_PER_TICK):
+            state = reader.get_water_state()
+            if last_state is not None and state != last_state:
+                flips += 1
+            last_state = state
+        levels.append(reader.water_level)
+        clock.sleep(LOOP_SECONDS)
+    mean = sum(levels) / len(levels)
+    spread = math.sqrt(sum([(level - mean) ** 2 for level in levels]) / len(levels))
+    return reader.power_on_ns / TICKS / 1000, reader.enable_cycles / TICKS, mean, spread, flips
+
+
+def main():
+    print("%d ticks, %d state queries per tick, dry threshold %d" % (TICKS, QUERIES_PER_TICK, DRY_LEVEL))
+    for true_level in TRUE_LEVELS:
+        print("true level %d" % true_level)
+        for mode, legacy in (("legacy", True), ("pipeline", False)):
+            power_us, cycles, mean, spread, flips = run(true_level, legacy)
+            print("  %-8s power-on %6.0f us/tick, %.1f enable cycles/tick, level mean %6.0f sd %5.0f, %4d flips" %
+                  (mode, power_us, cycles, mean, spread, flips))
+
+
+if __name__ == "__main__":
+    main()
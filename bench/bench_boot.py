@@ -0,0 +1,163 @@
+# Host-side benchmark: time from power on until the floats are first checked, with a slow or absent access point.
+#   legacy    - the previous boot: socket pool and a blocking hello (connect retries included) before the main loop
+#   step-wise - the main loop starts right away and HttpFunctions.bring_up_network() does one step per loop
+# Runs on a simulated clock: every Wi-Fi connect attempt costs CONNECT_SECONDS, time.sleep() advances the clock.
+# Also lists the repo modules code.py loads before the first float check (its module level imports, in a fresh
+# interpreter) and their source size, the board compiles all of it before the pump can run.
+# Exits 1 if one of the feature modules the pump doesn't need (LAZY_MODULES) is among them.
+# Run from the repo root: python bench/bench_boot.py
+import ast
+import os
+import subprocess
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import board  # noqa: E402
+import wifi  # noqa: E402
+
+import util.simple_timer  # noqa: E402
+from pumping_controller import PumpingController  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.pump_motor_controller import PumpMotorController  # noqa: E402
+from util.pumping_display import PumpingDisplay  # noqa: E402
+from util.water_level import WaterLevelReader  # noqa: E402
+
+CONNECT_SECONDS = 4.0  # A failed association on the ESP32-S2 takes a few seconds
+HELLO_SECONDS = 0.5
+LOOP_SECONDS = 1.0
+RUN_SECONDS = 120
+LAZY_MODULES = ("util.metrics_server", "util.environment_sensor", "util.serial_console", "util.mqtt_functions")
+
+# Prints "<module> <source bytes>" for each repo module the imports given as arguments load
+LIST_MODULES = """
+import os, sys
+import hardware_stubs
+hardware_stubs.install()
+for name in sys.argv[1:]:
+    __import__(name)
+for name, module in sorted(sys.modules.items()):
+    path = getattr(module, "__file__", None) or ""
+    if path.startswith(hardware_stubs.REPO_ROOT) and "bench" not in path:
+        print(name, os.path.getsize(path))
+"""
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SlowAccessPoint:
+    # The access point only accepts the accept_on-th association attempt (None: never)
+    def __init__(self, clock, accept_on):
+        self.clock = clock
+        self.accept_on = accept_on
+        self.attempts = 0
+
+    def connect(self, ssid, password, **kwargs):
+        self.attempts += 1
+        self.clock.sleep(CONNECT_SECONDS)
+        if self.accept_on is None or self.attempts < self.accept_on:
+            raise ConnectionError("No network with that ssid")
+
+
+def build(clock, accept_on):
+    time.monotonic = clock.monotonic
+    time.time = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.monotonic
+    wifi.radio = hardware_stubs.Radio()
+    wifi.radio.connect = SlowAccessPoint(clock, accept_on).connect
+
+    def backend(method, url, headers, data):
+        clock.sleep(HELLO_SECONDS)
+        return hardware_stubs.Response(200, "{}")
+    hardware_stubs.Session.handler = backend
+
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    readers = [WaterLevelReader("Bottom", properties, board.D5, board.D5, debug),
+               WaterLevelReader("Top", properties, board.D6, board.D6, debug)]
+    return PumpingController(PumpingDisplay(debug, properties), properties, board.LED,
+                             PumpMotorController(board.D12, debug), readers, debug)
+
+
+def run(accept_on, legacy):
+    clock = Clock()
+    start = clock.now
+    pumping = build(clock, accept_on)
+    http = pumping.remote_notifier.http
+    if legacy:
+        http.get_pool()
+        http.do_hello()
+        http.network_ready = True
+
+    first_check = None
+    network_up = None
+    checks = 0
+    while clock.now - start < RUN_SECONDS:
+        pumping.check_water_level_state()
+        checks += 1
+        if first_check is None:
+            first_check = clock.now - start
+        if network_up is None and http.bring_up_network():
+            network_up = clock.now - start
+        clock.sleep(LOOP_SECONDS)
+    return first_check, network_up, checks, http.boot_timings
+
+
+# The modules code.py imports at module level (including the if for the display), not the ones inside functions
+def boot_imports():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "code.py")) as f:
+        tree = ast.parse(f.read())
+    names = []
+    statements = list(tree.body)
+    while statements:
+        statement = statements.pop(0)
+        if isinstance(statement, ast.Import):
+            names.extend([alias.name for alias in statement.names])
+        elif isinstance(statement, ast.ImportFrom):
+            names.append(statement.module)
+        elif isinstance(statement, ast.If):
+            statements.extend(statement.body + statement.orelse)
+    output = subprocess.run([sys.executable, "-c", LIST_MODULES] + names, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+    return [(line.split()[0], int(line.split()[1])) for line in output.stdout.splitlines()]
+
+
+def show(value):
+    return "never" if value is None else "%5.1f s" % value
+
+
+def main():
+    print("simulated boot, %.0f s per connect attempt, %.0f s run" % (CONNECT_SECONDS, RUN_SECONDS))
+    for label, accept_on in (("AP up", 1), ("AP accepts 3rd try", 3), ("AP down", None)):
+        print(label)
+        for mode, legacy in (("legacy", True), ("step-wise", False)):
+            first_check, network_up, checks, timings = run(accept_on, legacy)
+            print("  %-9s first float check %s, network ready %s, %3d float checks%s" %
+                  (mode, show(first_check), show(network_up), checks,
+                   "" if legacy else ", steps(ms) " + str(timings)))
+
+    modules = boot_imports()
+    eager = [name for name, size in modules if name in LAZY_MODULES]
+    print("before the first float check: %d repo modules, %d bytes of source, feature modules %s  %s" %
+          (len(modules), sum([size for name, size in modules]), eager or "none", "FAIL" if eager else "OK"))
+    sys.exit(1 if eager else 0)
+
+
+if __name__ == "__main__":
+    main()
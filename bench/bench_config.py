@@ -0,0 +1,65 @@
+# Host-side benchmark: the typed PumpConfig against the raw secrets.json dict.
+#   lookups - the values the main loop reads every tick (display_interval, sleep_time)
+#   startup - reading secrets.json: json.load only vs json.load + parse/validate into PumpConfig
+# Run from the repo root: python bench/bench_config.py
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.properties import PumpConfig, SECRETS_FILE  # noqa: E402
+
+# The repo's secrets.json whatever directory the bench is run from, as on the board it sits next to code.py
+SECRETS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", SECRETS_FILE))
+LOOKUPS = 200000
+LOADS = 2000
+
+
+def per_call_us(function, count):
+    begin = time.perf_counter()
+    function(count)
+    return (time.perf_counter() - begin) / count * 1e6
+
+
+def dict_lookups(count):
+    with open(SECRETS_PATH) as f:
+        defaults = json.load(f)
+    defaults.setdefault("sleep_time", 1)
+    for _ in range(count):
+        defaults["display_interval"]
+        defaults["sleep_time"]
+
+
+def config_lookups(count):
+    with open(SECRETS_PATH) as f:
+        config = PumpConfig.parse(json.load(f))
+    for _ in range(count):
+        config.display_interval
+        config.sleep_time
+
+
+def raw_load(count):
+    for _ in range(count):
+        with open(SECRETS_PATH) as f:
+            json.load(f)
+
+
+def typed_load(count):
+    for _ in range(count):
+        with open(SECRETS_PATH) as f:
+            PumpConfig.parse(json.load(f))
+
+
+def main():
+    print("per tick lookups (2 values)")
+    print("  dict[\"key\"]:       %6.3f us" % per_call_us(dict_lookups, LOOKUPS))
+    print("  config.attribute:  %6.3f us" % per_call_us(config_lookups, LOOKUPS))
+    print("startup read of %s" % SECRETS_PATH)
+    print("  json.load:                 %6.1f us" % per_call_us(raw_load, LOADS))
+    print("  json.load + PumpConfig:    %6.1f us" % per_call_us(typed_load, LOADS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Host-side benchmark: per-tick cost of noticing the "debug" flag file.
+#   legacy  - os.listdir() of the root every tick (the previous Debug.check_debug_enable)
+#   watcher - ConfigWatcher.check() every tick: os.stat of debug + secrets.json, throttled to every 2 s
+# Timed against directories with a growing number of files, like a CIRCUITPY drive collecting logs.
+# Run from the repo root: python bench/bench_config_watch.py
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.config_watcher import ConfigWatcher  # noqa: E402
+
+TICKS = 5000
+TICK_SECONDS = 0.5  # Simulated loop period, the watcher is throttled on time.monotonic()
+
+
+def legacy_tick():
+    return "debug" in os.listdir()
+
+
+def main():
+    real_monotonic = time.monotonic
+    cwd = os.getcwd()
+    print("per tick cost, %d ticks at %.1f s" % (TICKS, TICK_SECONDS))
+    for file_count in (10, 100, 1000):
+        with tempfile.TemporaryDirectory() as root:
+            os.chdir(root)
+            for n in range(file_count):
+                open("file%d.txt" % n, "w").close()
+            open("secrets.json", "w").close()
+
+            begin = time.perf_counter()
+            for _ in range(TICKS):
+                legacy_tick()
+            legacy = (time.perf_counter() - begin) / TICKS * 1e6
+
+            clock = [0.0]
+            time.monotonic = lambda: clock[0]
+            watcher = ConfigWatcher(2)
+            watcher.watch("debug", lambda path, exists: None)
+            watcher.watch("secrets.json", lambda path, exists: None)
+            begin = time.perf_counter()
+            for _ in range(TICKS):
+                watcher.check()
+                clock[0] += TICK_SECONDS
+            watched = (time.perf_counter() - begin) / TICKS * 1e6
+            time.monotonic = real_monotonic
+            os.chdir(cwd)
+
+        print("  %5d files: listdir %8.2f us/tick, watcher %6.2f us/tick (%d stats instead of %d listdirs)" %
+              (file_count, legacy, watched, watcher.stat_count, TICKS))
+
+
+if __name__ == "__main__":
+    main()
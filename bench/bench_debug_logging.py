@@ -0,0 +1,73 @@
+# Host-side benchmark: cost of the main loop's debug lines with debugging off.
+# "legacy" reproduces the eager string building the call sites did before the lazy logging API,
+# "lazy" is the current call style. Run from the repo root: python bench/bench_debug_logging.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from util.debug import Debug  # noqa: E402
+from util.common import CommonFunctions  # noqa: E402
+
+TICKS = 20000
+
+
+class FakeReader:
+    def __init__(self, name):
+        self.name = name
+        self.value = True
+
+    def print_water_state(self):
+        return self.name[0:1] + " " + ("+WET+" if self.value else "dry")
+
+
+def legacy_tick(debug, readers, state, post_body, start):
+    debug.print_debug("controller", "check_state: pump_state[%s], last_pump_state[%s], pumping_started_flag[%s], pumping_verified[%s]" %
+                      (state, state, False, False))
+    debug.print_debug("display", "pump_state " + state +
+                      " levels " + readers[1].print_water_state() + " - " +
+                      readers[0].print_water_state())
+    debug.print_debug("display", "start_elapsed " + CommonFunctions.format_elapsed_ms(start))
+    debug.print_debug("-->http", "Post " + "debug_action_post" + " url: " + "http://x/component/mission" +
+                      ", post_body " + str(post_body))
+    debug.print_debug("-->http", "post reply elapsed " + CommonFunctions.format_elapsed_ms(start))
+
+
+def lazy_tick(debug, readers, state, post_body, start):
+    debug.print_debug("controller", "check_state: pump_state[%s], last_pump_state[%s], pumping_started_flag[%s], pumping_verified[%s]",
+                      state, state, False, False)
+    debug.print_debug("display", "pump_state %s levels %s - %s", state,
+                      readers[1].print_water_state, readers[0].print_water_state)
+    debug.print_debug("display", "start_elapsed %s", lambda: CommonFunctions.format_elapsed_ms(start))
+    debug.print_debug("-->http", "Post %s url: %s, post_body %s", "debug_action_post", "http://x/component/mission",
+                      post_body)
+    debug.print_debug("-->http", "post reply elapsed %s", lambda: CommonFunctions.format_elapsed_ms(start))
+
+
+def run(tick, debug):
+    readers = [FakeReader("Bottom"), FakeReader("Top")]
+    post_body = {"action": "status_handshake", "eventId": "None", "pumpState": "idle", "componentId": "1",
+                 "miscStatus": {"pump_event_count": 3, "last_http_code": 200}, "errorCount": "0"}
+    start = time.monotonic() - 3725
+    begin = time.perf_counter()
+    for _ in range(TICKS):
+        tick(debug, readers, "idle", post_body, start)
+    return (time.perf_counter() - begin) / TICKS * 1e6
+
+
+def main():
+    debug = Debug()
+    debug.debug = False
+    debug.remote_set = False
+
+    legacy = run(legacy_tick, debug)
+    lazy = run(lazy_tick, debug)
+    print("debug off, %d ticks" % TICKS)
+    print("  legacy eager formatting: %8.2f us/tick" % legacy)
+    print("  lazy templates:          %8.2f us/tick" % lazy)
+    print("  saved:                   %8.2f us/tick (%.0f%%)" % (legacy - lazy, 100.0 * (legacy - lazy) / legacy))
+
+
+if __name__ == "__main__":
+    main()
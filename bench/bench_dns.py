@@ -0,0 +1,145 @@
+# Host-side benchmark for the DnsCache in front of the socket pool, on a virtual clock with a stand-in resolver.
+# The loop posts a status every POST_SECONDS, every request looks up the remote host like adafruit_requests does
+# for a new socket. A lookup takes LOOKUP_MS, a failing one TIMEOUT_MS.
+#   outage    - HOURS of posts, the resolver doesn't answer (EAI_AGAIN) for OUTAGE_MINUTES in the middle
+#   nxdomain  - NXDOMAIN_MINUTES of posts every second to a host that doesn't resolve (EAI_NONAME)
+#   removed   - HOURS of posts, the host stops existing (EAI_NONAME) half way through
+# each without and with the cache. Reports the lookups sent to the resolver, the time spent in them, the hit rate,
+# the posts that went out and failed, the posts not sent because the host didn't resolve a moment ago, the addresses
+# served stale and the reboots of the recovery ladder.
+# Exits 1 if, with the cache, a scenario has more lookups, resolving time, failed posts or reboots than without, the
+# cache hits less than 95% in the outage run or a post fails because of the outage, a name that doesn't resolve is
+# looked up more than once per NEGATIVE_SECONDS, or the address of a name that doesn't exist is served stale.
+# Run from the repo root: python bench/bench_dns.py
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.dns_cache import EAI_NONAME, NEGATIVE_SECONDS, DnsCache  # noqa: E402
+from util.http_functions import HttpFunctions  # noqa: E402
+from util.properties import Properties, PumpConfig  # noqa: E402
+
+POST_SECONDS = 10
+HOURS = 6
+OUTAGE_MINUTES = 20
+NXDOMAIN_MINUTES = 10
+LOOKUP_MS = 120
+TIMEOUT_MS = 2000
+EAI_AGAIN = -3
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class Resolver:
+    def __init__(self, clock, failing):
+        self.clock = clock
+        self.failing = failing  # failing(now) is the gaierror code while lookups fail, else None
+        self.lookups = 0
+        self.ms = 0
+
+    def __call__(self, host, port):
+        self.lookups += 1
+        code = self.failing(self.clock.seconds)
+        if code == EAI_AGAIN:
+            self.clock.sleep(TIMEOUT_MS / 1000)
+            self.ms += TIMEOUT_MS
+            raise OSError(code, "Temporary failure in name resolution")
+        if code is not None:
+            self.clock.sleep(LOOKUP_MS / 1000)
+            self.ms += LOOKUP_MS
+            raise OSError(code, "Name or service not known")
+        self.clock.sleep(LOOKUP_MS / 1000)
+        self.ms += LOOKUP_MS
+        return [(2, 1, 0, "", ("192.168.1.10", port))]
+
+
+class NoCache(DnsCache):
+    # What the sessions did before: a lookup for every socket
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        return self.pool.getaddrinfo(host, port, family, type, proto, flags)
+
+
+def run(cached, seconds, post_seconds, failing):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    hardware_stubs.SocketPool.resolver = None
+    hardware_stubs.Session.handler = hardware_stubs.ok_handler
+    debug = Debug()
+    debug.debug = False
+    http = HttpFunctions(Properties(debug), debug)
+    if not cached:
+        http.dns = NoCache(http.properties, debug)
+    while not http.bring_up_network():
+        clock.sleep(1)
+    http.dns.flush()  # Nothing from the bring-up, the runs start without an address
+    start = clock.seconds
+    resolver = Resolver(clock, lambda now: failing(now - start))
+    hardware_stubs.SocketPool.resolver = resolver
+    resets = hardware_stubs.Microcontroller.reset_count
+    failed = 0
+    skipped = 0
+    while clock.seconds - start < seconds:
+        response = http.do_action_post("status", "IDLE", {})
+        if response["text"] == "Unresolved":
+            skipped += 1
+        elif not http.success(response):
+            failed += 1
+        clock.sleep(post_seconds)
+    return resolver, failed, skipped, http.dns.summary(), hardware_stubs.Microcontroller.reset_count - resets
+
+
+def main():
+    print("Lookups %d ms, failing %d ms, %d s dns_ttl" % (LOOKUP_MS, TIMEOUT_MS, PumpConfig().dns_ttl))
+    outage_start = HOURS * 3600 / 2
+    scenarios = (
+        ("outage", HOURS * 3600, POST_SECONDS,
+         lambda elapsed: EAI_AGAIN if outage_start <= elapsed < outage_start + OUTAGE_MINUTES * 60 else None),
+        ("nxdomain", NXDOMAIN_MINUTES * 60, 1, lambda elapsed: EAI_NONAME),
+        ("removed", HOURS * 3600, POST_SECONDS, lambda elapsed: EAI_NONAME if elapsed >= outage_start else None))
+    failed = False
+    for name, seconds, post_seconds, failing in scenarios:
+        for cached in (False, True):
+            resolver, posts_failed, skipped, summary, reboots = run(cached, seconds, post_seconds, failing)
+            print("  %-8s %-8s %5d lookups %7.1f s resolving, hit rate %5.1f%%, %4d posts failed, %4d not sent, "
+                  "%4d stale, %d reboots" %
+                  (name, "cache" if cached else "no cache", resolver.lookups, resolver.ms / 1000,
+                   summary["hit_rate"] * 100 if cached else 0, posts_failed, skipped,
+                   summary["stale"] if cached else 0, reboots), end="")
+            if not cached:
+                print()
+                uncached = (resolver.lookups, resolver.ms, posts_failed, reboots)
+                continue
+            ok = resolver.lookups <= uncached[0] and resolver.ms <= uncached[1] and posts_failed <= uncached[2] and \
+                reboots <= uncached[3]
+            if name == "outage":
+                ok = ok and summary["hit_rate"] >= 0.95 and posts_failed == 0
+            elif name == "nxdomain":
+                ok = ok and resolver.lookups <= seconds // NEGATIVE_SECONDS + 1
+            else:
+                ok = ok and summary["stale"] == 0
+            failed = failed or not ok
+            print("  %s" % ("OK" if ok else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
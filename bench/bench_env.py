@@ -0,0 +1,140 @@
+# Host-side benchmark for the environmental telemetry (EnvironmentSensor), on a virtual clock.
+# The loop_harness controller runs HOURS of its fill/pump cycle with the stand-in BME280 reading a synthetic
+# enclosure: a daily temperature swing, humidity following it, a slow pressure drift.
+# Reports the readings taken and how many fell while a pump ran, the I2C traffic per hour, the host time of a loop's
+# sensor step (nothing due / reading), the RAM of the rolling aggregate, and the bytes the summary adds to a status
+# handshake next to what the raw readings of the same window would add.
+# Exits 1 if a reading is taken while a pump runs, fewer than 90% of the expected readings are taken, the summary is
+# off by more than the int16 rounding, the status object doesn't carry it, or it adds more than 200 bytes to a
+# handshake.
+# Run from the repo root: python bench/bench_env.py
+import json
+import math
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from loop_harness import Harness  # noqa: E402
+from util.environment_sensor import QUANTITIES, SCALES, WINDOW, EnvironmentSensor  # noqa: E402
+
+HOURS = 6
+TICK_SECONDS = 1
+MAX_STATUS_BYTES = 200
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def monotonic_ns(self):
+        return int(self.seconds * 1000000000)
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class Enclosure:
+    def __init__(self, clock, harness):
+        self.clock = clock
+        self.harness = harness
+        self.taken = []  # (temperature, humidity, pressure) of every reading
+        self.current = {}
+        self.while_pumping = 0
+
+    def __call__(self, quantity):
+        day = 2 * math.pi * self.clock.seconds / 86400
+        value = {
+            "temperature": 22 + 8 * math.sin(day),
+            "humidity": 55 - 15 * math.sin(day),
+            "pressure": 1013 + 4 * math.sin(day / 3)
+        }[quantity]
+        self.current[quantity] = value
+        if quantity == "pressure":
+            # The last of a reading
+            self.taken.append(tuple([self.current[name] for name in QUANTITIES]))
+            if self.harness.pump.running:
+                self.while_pumping += 1
+        return value
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    harness = Harness()
+    enclosure = Enclosure(clock, harness)
+    hardware_stubs.BME280.reading = enclosure
+    environment = EnvironmentSensor(harness.properties, harness.debug)
+    harness.environment = environment
+    harness.pumping.environment = environment
+    seconds = harness.properties.config.env_sample_seconds
+    idle_us = []
+    read_us = []
+    tick = environment.tick
+
+    # The harness's call of the sensor step, timed
+    def timed_tick(busy):
+        count = environment.count
+        begin = time.perf_counter()
+        tick(busy)
+        took = (time.perf_counter() - begin) * 1000000
+        (read_us if environment.count != count else idle_us).append(took)
+    environment.tick = timed_tick
+    start = clock.seconds
+    while clock.seconds - start < HOURS * 3600:
+        harness.tick()
+        clock.sleep(TICK_SECONDS)
+
+    readings = len(enclosure.taken)
+    expected = HOURS * 3600 // (seconds + 1)  # The timer is in whole seconds and times out after seconds + 1
+    i2c_per_hour = hardware_stubs.BME280.i2c_bytes / HOURS
+    summary = environment.summary()
+    ok_pump = enclosure.while_pumping == 0
+    ok_count = readings >= expected * 0.9
+    print("%d h, a reading every %d s: %d readings (expected %d), %d while a pump ran  %s" %
+          (HOURS, seconds, readings, expected, enclosure.while_pumping, "OK" if ok_pump and ok_count else "FAIL"))
+    print("  I2C %d transfers, %d bytes per hour" % (hardware_stubs.BME280.i2c_reads / HOURS, i2c_per_hour))
+    print("  sensor step: nothing due p50 %.1f us p99 %.1f us, reading p50 %.1f us p99 %.1f us (host)" %
+          (percentile(idle_us, 0.5), percentile(idle_us, 0.99), percentile(read_us, 0.5),
+           percentile(read_us, 0.99)))
+
+    window = enclosure.taken[-WINDOW:]
+    ok_values = True
+    for i in range(len(QUANTITIES)):
+        values = [reading[i] for reading in window]
+        exact = [values[-1], min(values), sum(values) / len(values), max(values)]
+        error = max([abs(summary[QUANTITIES[i]][j] - exact[j]) for j in range(4)])
+        ok = error <= 1 / SCALES[i]
+        ok_values = ok_values and ok
+        print("  %-11s last/min/mean/max %s, largest error %.3f  %s" %
+              (QUANTITIES[i], summary[QUANTITIES[i]], error, "OK" if ok else "FAIL"))
+
+    ok_bytes = harness.pumping.create_status_object()["env"] == summary
+    summary_bytes = len(json.dumps({"env": summary}))
+    raw_bytes = len(json.dumps({"env": [[round(value, 2) for value in reading] for reading in window]}))
+    ok_bytes = ok_bytes and summary_bytes <= MAX_STATUS_BYTES
+    print("  aggregate %d bytes of RAM, status handshake +%d bytes (the raw window would be +%d)  %s" %
+          (sum([len(readings) * readings.itemsize for readings in environment.readings]), summary_bytes, raw_bytes,
+           "OK" if ok_bytes else "FAIL"))
+    sys.exit(0 if ok_pump and ok_count and ok_values and ok_bytes else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Host-side benchmark for the error reporting (ErrorReporter), on a virtual clock where every request takes POST_MS
+# and the retry sleeps in do_post take their time.
+# An error storm: every tick the main loop handler reports an exception, a station reports a stuck sensor, and every
+# STATUS_TICKS a status handshake fails and do_post reports it. The link is down for the first DOWN_TICKS, then the
+# server answers 500 for ERROR_TICKS, then everything works.
+# Reports the error calls, what reached the server, and the loop time spent on error reporting (do_error_post and
+# the per loop send), which before was a ping and up to 3 tries 2 s apart per call.
+# Exits 1 if an error kind never reaches the server, the counts don't add up (reported = sent + pending + dropped),
+# or error reporting costs a tick more than one request.
+# Run from the repo root: python bench/bench_error_reports.py
+import json
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.error_reporter import ERROR_LIMIT, SUMMARY_SECONDS  # noqa: E402
+from util.outbound_queue import OutboundQueue  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+POST_MS = 120
+TICK_MS = 1000
+STATUS_TICKS = 10
+DOWN_TICKS = 120
+ERROR_TICKS = 60
+UP_TICKS = 300
+MAIN_LOOP_ERROR = ("['Traceback (most recent call last):\\n', '  File \"code.py\", line 210, in <module>\\n', "
+                   "'OSError: [Errno 113] ECONNABORTED\\n']")
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class Server:
+    def __init__(self, clock):
+        self.clock = clock
+        self.mode = "up"  # "down", "error" or "up"
+        self.errors = []  # bodies of the error posts received
+
+    def __call__(self, method, url, headers, data):
+        self.clock.sleep(POST_MS / 1000)
+        if self.mode == "down":
+            raise OSError("[Errno 113] ECONNABORTED")
+        if self.mode == "error":
+            return hardware_stubs.Response(500, "{}")
+        if "/error" in url:
+            self.errors.append(json.loads(data))
+        return hardware_stubs.Response(200, json.dumps({"eventId": "7"}))
+
+
+def main():
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    server = Server(clock)
+    hardware_stubs.Session.handler = server
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    notifier = RemoteEventNotifier(properties, debug, outbound=OutboundQueue(debug, (None, None, None)))
+    http = notifier.http
+    radio = sys.modules["wifi"].radio
+    radio.ping_result = 0.01
+    while not http.bring_up_network():
+        pass
+    north = notifier.for_station("North")
+
+    calls = 0
+    report_ms = []
+    for tick in range(DOWN_TICKS + ERROR_TICKS + UP_TICKS):
+        if tick == 0:
+            server.mode = "down"
+            radio.ping_result = None
+        elif tick == DOWN_TICKS:
+            server.mode = "error"
+            radio.ping_result = 0.01
+        elif tick == DOWN_TICKS + ERROR_TICKS:
+            server.mode = "up"
+        storm = tick < DOWN_TICKS + ERROR_TICKS
+        spent = 0
+        if storm and tick % STATUS_TICKS == 0:
+            # The failing request costs its own time, only the error report is counted
+            before = http.errors.stats[0]
+            notifier.send_status_handshake("idle", {})
+            calls += http.errors.stats[0] - before
+        if storm:
+            start = clock.seconds
+            notifier.error_post("MAIN LOOP", "Error: " + MAIN_LOOP_ERROR)
+            north.error_post("sensor fault", "Top stuck wet (%d s)" % tick)
+            calls += 2
+            spent += clock.seconds - start
+        start = clock.seconds
+        if not http.last_http_status_success():
+            http.ping_default()
+        notifier.send_errors()
+        spent += clock.seconds - start
+        report_ms.append(int(spent * 1000))
+        clock.sleep(TICK_MS / 1000)
+
+    summary = http.errors.summary()
+    kinds = {}
+    for body in server.errors:
+        key = (body.get("station"), body["action"])
+        kinds[key] = kinds.get(key, 0) + body.get("count", 1)
+    print("%d ticks: link down %d, server 500 for %d, then up. Limit %.2f reports/s burst %d, summaries every %d s" %
+          (DOWN_TICKS + ERROR_TICKS + UP_TICKS, DOWN_TICKS, ERROR_TICKS, ERROR_LIMIT[0], ERROR_LIMIT[1],
+           SUMMARY_SECONDS))
+    print("  %d error calls, %d reports sent (%d bytes), %s" %
+          (calls, len(server.errors), len(json.dumps(server.errors)), summary))
+    for key, count in sorted(kinds.items(), key=lambda item: str(item[0])):
+        print("    station %-6s %-13s %4d occurrences" % (key[0], key[1], count))
+    print("  loop time on error reporting: max %d ms per tick, %d ms in all (before: a ping and up to 3 tries 2 s "
+          "apart per call)" % (max(report_ms), sum(report_ms)))
+
+    counted = summary["sent"] == len(server.errors) and \
+        summary["reported"] == sum(kinds.values()) + summary["pending"] + summary["dropped"]
+    all_kinds = ("None", "MAIN LOOP") in [(str(k[0]), k[1]) for k in kinds] and ("North", "sensor fault") in kinds \
+        and ("None", "post") in [(str(k[0]), k[1]) for k in kinds]
+    fast = max(report_ms) <= POST_MS * 2
+    print("  every kind delivered %s, counts add up %s, at most one request per tick %s" %
+          ("OK" if all_kinds else "FAIL", "OK" if counted else "FAIL", "OK" if fast else "FAIL"))
+    sys.exit(0 if all_kinds and counted and fast else 1)
+
+
+if __name__ == "__main__":
+    main()
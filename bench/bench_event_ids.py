@@ -0,0 +1,180 @@
+# Host-side benchmark for the device minted event ids (get_pumping_id), on a virtual clock with a slow stand-in
+# backend: every mission post takes SLOW_MS, or fails after it when the backend is timing out.
+# The loop_harness controller runs pumping cycles where the top float trips GAP seconds after the bottom one, one
+# cycle per gap:
+#   inline  - ready_to_pump posted in the tick the station got ready (the previous order)
+#   queued  - ready_to_pump queued with the minted id and sent on the next notify, after that tick's pump check
+# Reports the loop time of the tick the station got ready, and the time from the top float tripping until the pump
+# is on. Checks every cycle's posts carry one id that isn't "None" (before, the id came with the ready_to_pump
+# answer and pump_event went out with "None"), ready_to_pump and pump_event the same.
+# Exits 1 if the ids are wrong, or the queued pump start is later than inline (at the max, and against a timing out
+# backend at all).
+# Run from the repo root: python bench/bench_event_ids.py
+import json
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from loop_harness import Harness  # noqa: E402
+
+SLOW_MS = 2500
+TICK_MS = 1000
+GAPS = (0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0)
+FILL_SECONDS = 10  # From the start of a cycle to the bottom float
+DRAIN_SECONDS = 15  # Pumping until the bottom float goes dry
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def monotonic_ns(self):
+        return int(self.seconds * 1000000000)
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class SlowBackend:
+    def __init__(self, clock, failing):
+        self.clock = clock
+        self.failing = failing
+        self.missions = []  # (action, event id)
+
+    def __call__(self, method, url, headers, data):
+        if "/mission" not in url:
+            self.clock.sleep(0.1)
+            return hardware_stubs.Response(200, "{}")
+        self.clock.sleep(SLOW_MS / 1000)
+        if self.failing:
+            raise OSError("[Errno 116] ETIMEDOUT")
+        body = json.loads(data)
+        self.missions.append((body["action"], body["eventId"]))
+        # A remote that keeps its own ids and maps the device's to them
+        return hardware_stubs.Response(200, json.dumps({"eventId": "server-%d" % len(self.missions), "cmd": None}))
+
+
+class TimedHarness(Harness):
+    # The floats follow the clock: bottom at FILL_SECONDS, top GAP seconds later, the pump drains both
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.cycle_start = clock.seconds
+        self.gap = GAPS[0]
+        self.top_wet_at = None
+        self.pump_on_at = None
+        self.pump_off_at = None
+        pump_on = self.pump.pump_on
+        pump_off = self.pump.pump_off
+
+        def on():
+            if not self.pump.running:
+                self.pump_on_at = self.clock.seconds
+            pump_on()
+
+        def off():
+            if self.pump.running:
+                self.pump_off_at = self.clock.seconds
+            pump_off()
+        self.pump.pump_on = on
+        self.pump.pump_off = off
+
+    def drive_floats(self):
+        elapsed = self.clock.seconds - self.cycle_start
+        bottom = self.readers[0].water_level_sensor
+        top = self.readers[1].water_level_sensor
+        if self.pump_on_at is not None:
+            top.value = False
+            bottom.value = self.clock.seconds - self.pump_on_at < DRAIN_SECONDS
+        else:
+            bottom.value = elapsed >= FILL_SECONDS
+            top.value = elapsed >= FILL_SECONDS + self.gap
+            if top.value and self.top_wet_at is None:
+                # When the water got there, the tick only sees it when it samples
+                self.top_wet_at = self.cycle_start + FILL_SECONDS + self.gap
+
+
+def run(mode, failing):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    harness = TimedHarness(clock)
+    backend = SlowBackend(clock, failing)
+    hardware_stubs.Session.handler = backend
+    notifier = harness.pumping.remote_notifier
+    if mode == "inline":
+        notifier.queue_ready_to_pump = notifier.send_ready_to_pump
+    delays = []
+    ready_ticks = []
+    for gap in GAPS:
+        harness.gap = gap
+        harness.cycle_start = clock.seconds
+        harness.top_wet_at = None
+        harness.pump_on_at = None
+        harness.pump_off_at = None
+        while harness.pump_off_at is None or clock.seconds - harness.pump_off_at < 5:
+            start = clock.seconds
+            harness.tick()
+            if harness.pumping.pump_state == harness.pumping.READY_TO_PUMP and \
+                    harness.pumping.last_pump_state != harness.pumping.READY_TO_PUMP:
+                ready_ticks.append(clock.seconds - start)
+            clock.sleep(TICK_MS / 1000)
+            if clock.seconds - harness.cycle_start > 120:
+                break
+        delays.append(None if harness.pump_on_at is None else harness.pump_on_at - harness.top_wet_at)
+    return delays, ready_ticks, backend.missions
+
+
+def check_ids(missions):
+    # Every cycle is a ready_to_pump followed by its pump_event, with the same minted id
+    cycles = {}
+    for action, event_id in missions:
+        if action in ("ready_to_pump", "pump_event"):
+            cycles.setdefault(event_id, []).append(action)
+    good = [event_id for event_id, actions in cycles.items()
+            if event_id != "None" and not event_id.startswith("server") and actions == ["ready_to_pump", "pump_event"]]
+    return len(good), len(cycles)
+
+
+def main():
+    print("Mission posts take %d ms, ticks %d ms, top float %s s after the bottom one" %
+          (SLOW_MS, TICK_MS, ", ".join([str(gap) for gap in GAPS])))
+    failed = False
+    for failing in (False, True):
+        results = {}
+        for mode in ("inline", "queued"):
+            delays, ready_ticks, missions = run(mode, failing)
+            started = [delay for delay in delays if delay is not None]
+            results[mode] = (sum(started) / max(1, len(started)), max(started) if started else None)
+            print("  %-10s %-6s ready tick max %5.2f s, top float to pump on mean %5.2f s max %5.2f s, %d/%d cycles "
+                  "pumped" % ("timing out" if failing else "slow", mode, max(ready_ticks), results[mode][0],
+                              results[mode][1] or 0, len(started), len(delays)), end="")
+            if mode == "queued":
+                ok = len(started) == len(delays) and results[mode][1] <= results["inline"][1]
+                if failing:
+                    ok = ok and results[mode][1] < results["inline"][1]
+                else:
+                    good, cycles = check_ids(missions)
+                    ok = ok and good == cycles == len(GAPS)
+                    print(", %d/%d cycles with one minted id" % (good, cycles), end="")
+                failed = failed or not ok
+                print("  %s" % ("OK" if ok else "FAIL"))
+            else:
+                print()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
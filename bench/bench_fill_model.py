@@ -0,0 +1,80 @@
+# Host-side simulation for FillRateModel.
+# A reservoir fills at a noisy inflow; the pump drains it. From cycle DEGRADE_FROM the pump loses DEGRADE_STEP of its
+# capacity per cycle. Reports the error of the top float trip predicted when the bottom float trips, the cycle the
+# degrading pump is flagged, and false alarms with a healthy pump.
+# Run from the repo root: python bench/bench_fill_model.py
+import random
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from util.fill_rate_model import FillRateModel  # noqa: E402
+
+CYCLES = 60
+TICK_MS = 1000
+BAND = 100.0  # Volume between the bottom and top floats
+BELOW_BOTTOM = 20.0  # Volume still in the reservoir when the bottom float goes dry
+INFLOW = 2.0  # Volume per second, +-20% per cycle
+PUMP = 7.0  # Volume per second
+DEGRADE_FROM = 30
+DEGRADE_STEP = 0.03
+
+
+def simulate(degrade: bool, seed: int = 3):
+    rnd = random.Random(seed)
+    model = FillRateModel()
+    at_ms = 0
+    volume = 0.0
+    pump_rate = PUMP
+    pumping = False
+    flagged_at = None
+    false_alarms = 0
+    errors = []
+    prediction = None
+    for cycle in range(CYCLES):
+        inflow = INFLOW * rnd.uniform(0.8, 1.2)
+        if degrade and cycle >= DEGRADE_FROM:
+            pump_rate *= 1 - DEGRADE_STEP
+        while True:
+            at_ms += TICK_MS
+            volume += (inflow - (pump_rate if pumping else 0)) * TICK_MS / 1000
+            bottom_wet = volume >= BELOW_BOTTOM
+            top_wet = volume >= BELOW_BOTTOM + BAND
+            model.observe(bottom_wet, top_wet, pumping, at_ms)
+            if prediction is None and bottom_wet and not pumping:
+                trip = model.seconds_until_top_trip(at_ms)
+                if trip is not None:
+                    prediction = at_ms + trip * 1000
+            if top_wet and not pumping:
+                if prediction is not None:
+                    errors.append(abs(at_ms - prediction) / 1000)
+                prediction = None
+                pumping = True
+            elif pumping and not bottom_wet:
+                pumping = False
+                break
+        if model.degraded:
+            if not degrade or cycle < DEGRADE_FROM:
+                false_alarms += 1
+            elif flagged_at is None:
+                flagged_at = cycle
+    return model, errors, flagged_at, false_alarms
+
+
+def main():
+    model, errors, flagged_at, false_alarms = simulate(False)
+    fill_time = BAND / INFLOW
+    print("%d cycles, nominal fill %.0f s, drain %.0f s" % (CYCLES, fill_time, BAND / (PUMP - INFLOW)))
+    errors.sort()
+    print("  top trip prediction error: median %.1f s, worst %.1f s (%d predictions)" %
+          (errors[len(errors) // 2], errors[-1], len(errors)))
+    print("  healthy pump: %d false degraded flags, estimates %s" % (false_alarms, model.summary()))
+    model, errors, flagged_at, false_alarms = simulate(True)
+    print("  degrading pump (-%d%%/cycle from cycle %d): flagged at cycle %s, %d false flags before" %
+          (DEGRADE_STEP * 100, DEGRADE_FROM, flagged_at, false_alarms))
+    print("  estimates %s" % model.summary())
+
+
+if __name__ == "__main__":
+    main()
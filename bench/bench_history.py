@@ -0,0 +1,171 @@
+# Host-side benchmark for TimeSeriesLog on a real file, DAYS of simulated pumping on a virtual clock.
+# Every PUMP_EVERY seconds a pump cycle is recorded the way the controller does it (state transitions, float edges,
+# pump on/off with the run time, HTTP outcomes), the loop calls tick() every TICK seconds.
+# Flash wear is modelled on the file writes: every sync erases each 4 KB sector written since the previous sync
+# once, plus the sector holding the directory entry (FAT updates it on every sync). Reported per flush interval,
+# with the worst sector's life at ENDURANCE erase cycles. "every record" syncs after each record, for comparison.
+# Then checks the pumps/hour and mean run time queries against what was recorded, and that the history and the
+# log clock survive a reboot (the file reopened).
+# Exits 1 if a query is off by more than 5% or the reopen loses the history.
+# Run from the repo root: python bench/bench_history.py
+import os
+import sys
+import tempfile
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.time_series_log as time_series_log  # noqa: E402
+from util.time_series_log import (HTTP, PUMP_OFF, PUMP_ON, SENSOR, STATE, TimeSeriesLog)  # noqa: E402
+
+DAYS = 30
+TICK = 5
+PUMP_EVERY = 1200  # A pump cycle every 20 minutes
+RUN_SECONDS = 45
+SECTOR = 4096
+ENDURANCE = 100000
+FLUSH_OPTIONS = ((0, "every record"), (300, "5 min"), (1800, "30 min"), (3600, "60 min"))
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 0.0
+
+    def monotonic(self):
+        return self.seconds
+
+
+class WearFile:
+    # File wrapper that counts sector erases per sync
+    def __init__(self, file):
+        self.file = file
+        self.pending = set()
+        self.erases = {}
+        self.syncs = 0
+        self.bytes_written = 0
+
+    def seek(self, position, whence=0):
+        return self.file.seek(position, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def readinto(self, buffer):
+        return self.file.readinto(buffer)
+
+    def write(self, data):
+        position = self.file.tell()
+        for sector in range(position // SECTOR, (position + len(data) - 1) // SECTOR + 1):
+            self.pending.add(sector)
+        self.bytes_written += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+        self.syncs += 1
+        self.pending.add("dir")
+        for sector in self.pending:
+            self.erases[sector] = self.erases.get(sector, 0) + 1
+        self.pending = set()
+
+    def close(self):
+        self.file.close()
+
+
+def open_counting(path, mode="r"):
+    file = WearFile(open(path, mode))
+    open_counting.last = file
+    return file
+
+
+def cycle(record, clock):
+    # What one pump cycle records: the floats, the states, the pump run and the remote posts
+    record(SENSOR, 0, 1)
+    record(STATE, 0, 1)
+    record(HTTP, 0, 200)
+    record(SENSOR, 1, 1)
+    record(STATE, 0, 7)
+    record(PUMP_ON, 0, 0)
+    record(SENSOR, 1, 0)
+    record(STATE, 0, 9)
+    record(SENSOR, 0, 0)
+    record(PUMP_OFF, 0, RUN_SECONDS)
+    record(STATE, 0, 0)
+    record(HTTP, 0, 200)
+    record(HTTP, 0, 0 if int(clock.seconds) % 7 == 0 else 200)
+
+
+def run(directory, flush_seconds, days=DAYS, name="history"):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time_series_log.open = open_counting
+    path = os.path.join(directory, "%s_%d.bin" % (name, flush_seconds))
+    log = TimeSeriesLog(path, flush_seconds=flush_seconds)
+    file = open_counting.last
+    file.erases = {}
+    file.syncs = 0
+    file.bytes_written = 0
+    record = log.record
+    if flush_seconds == 0:
+        # Synced after every record, what a plain append-and-close log would do
+        def record(kind, subject, value):
+            log.record(kind, subject, value)
+            log.flush()
+    records = 0
+    record_ns = 0
+    next_cycle = PUMP_EVERY
+    end = days * 86400
+    while clock.seconds < end:
+        clock.seconds += TICK
+        if clock.seconds >= next_cycle:
+            next_cycle += PUMP_EVERY
+            start = time.perf_counter_ns()
+            cycle(record, clock)
+            record_ns += time.perf_counter_ns() - start
+            records += 13
+        log.tick()
+    log.flush()
+    return log, file, clock, records, record_ns
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    print("%d days, a %d s pump cycle every %d s, 13 records per cycle, %d byte records" %
+          (DAYS, RUN_SECONDS, PUMP_EVERY, time_series_log.RECORD_SIZE))
+    failed = False
+    for flush_seconds, name in FLUSH_OPTIONS:
+        log, file, clock, records, record_ns = run(directory, flush_seconds)
+        data = [count for sector, count in file.erases.items() if sector != "dir"]
+        worst = max(max(data), file.erases.get("dir", 0)) / DAYS
+        print("  flush %-12s %5.0f syncs/day, %6.1f KB written/day, worst data sector %5.1f erases/day, "
+              "directory %5.0f/day -> %5.1f years, record() %.1f us" %
+              (name, file.syncs / DAYS, file.bytes_written / 1024 / DAYS, max(data) / DAYS,
+               file.erases.get("dir", 0) / DAYS, ENDURANCE / worst / 365, record_ns / records / 1000))
+
+    # Queries and reboot on the default interval
+    log, file, clock, records, record_ns = run(directory, time_series_log.FLUSH_SECONDS, 3, "queries")
+    expected_per_hour = 3600 / PUMP_EVERY
+    per_hour = log.pumps_per_hour(24)
+    mean_run = log.mean_run_seconds(24)
+    fail_rate = log.http_failure_rate(24)
+    summary = log.summary()
+    last = log.now()
+    file.close()
+    clock.seconds = 5  # Rebooted, the monotonic clock starts again
+    reopened = TimeSeriesLog(os.path.join(directory, "queries_%d.bin" % time_series_log.FLUSH_SECONDS))
+    kept = reopened.pumps_per_hour(24)
+    ok_queries = abs(per_hour - expected_per_hour) <= expected_per_hour * 0.05 and mean_run == RUN_SECONDS
+    ok_reboot = reopened.now() > last and abs(kept - per_hour) <= per_hour * 0.05
+    failed = not ok_queries or not ok_reboot
+    print("  queries: %.2f pumps/h (expected %.2f), mean run %s s, http failure rate %.3f  %s" %
+          (per_hour, expected_per_hour, mean_run, fail_rate, "OK" if ok_queries else "FAIL"))
+    print("  summary %s" % summary)
+    print("  after reboot: log time %d -> %d, %.2f pumps/h  %s" %
+          (last, reopened.now(), kept, "OK" if ok_reboot else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Host-side benchmark for the idempotent mission posts, on a virtual clock.
+# A flaky stand-in backend (the loop_harness Backend with its idempotencyKey dedupe window): TAIL of the answers
+# take TAIL_SECONDS, and LOST of them are recorded on the server but the answer never arrives (connection reset).
+# A try that takes longer than the post timeout is given up on by the device, the server still records it.
+# EVENTS pump_events are sent, each until the remote has it (through the outbound queue when all 3 tries fail):
+#   conservative - the previous settings: adafruit_requests' 60 s timeout, 2 s between tries
+#   aggressive   - post_timeout 1 s, RETRY_SECONDS between tries
+# each with and without the server dedupe.
+# Reports the latency per event (p50/p99/max) and the pump_events the server recorded.
+# Exits 1 if the server records a pump_event more or less than once with the dedupe, or aggressive has a worse p99.
+# Run from the repo root: python bench/bench_idempotency.py
+import json
+import random
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.http_functions  # noqa: E402
+import util.simple_timer  # noqa: E402
+from loop_harness import Backend  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.outbound_queue import OutboundQueue  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+EVENTS = 500
+FAST_SECONDS = 0.15
+TAIL = 0.08
+TAIL_SECONDS = 8
+LOST = 0.04
+MODES = (("conservative", 60, (2, 2)), ("aggressive", 1.0, util.http_functions.RETRY_SECONDS))
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class FlakyBackend(Backend):
+    def __init__(self, clock, dedupe):
+        super().__init__()
+        self.clock = clock
+        self.dedupe = dedupe
+        self.random = random.Random(7)
+
+    def __call__(self, method, url, headers, data):
+        if not self.dedupe:
+            self.answers.clear()
+        took = TAIL_SECONDS if self.random.random() < TAIL else FAST_SECONDS
+        timeout = hardware_stubs.Session.timeout or 60
+        # The server handles it either way, only the device may not see the answer
+        response = super().__call__(method, url, headers, data)
+        if took > timeout:
+            self.clock.sleep(timeout)
+            raise OSError("[Errno 116] ETIMEDOUT")
+        self.clock.sleep(took)
+        if self.random.random() < LOST:
+            raise OSError("[Errno 104] ECONNRESET")
+        return response
+
+    def recorded(self, action):
+        return len([1 for method, path, data in self.requests
+                    if path.startswith("mission") and json.loads(data)["action"] == action])
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(timeout, retry_seconds, dedupe):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    util.http_functions.RETRY_SECONDS = retry_seconds
+    backend = FlakyBackend(clock, dedupe)
+    hardware_stubs.Session.handler = backend
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    properties.config.post_timeout = timeout
+    notifier = RemoteEventNotifier(properties, debug, outbound=OutboundQueue(debug, (None, None, None)))
+    while not notifier.http.bring_up_network():
+        pass
+    latencies = []
+    for n in range(EVENTS):
+        start = clock.seconds
+        notifier.pump_event("pumping", {"last_pump_elapsed_time": 45, "pump_event_count": n + 1})
+        while notifier.outbound.retries:
+            # Not through: the loop pings and sends the queued one again
+            clock.sleep(1)
+            if not notifier.http.last_http_status_success():
+                notifier.http.ping_default()
+            notifier.send_queued()
+        latencies.append(clock.seconds - start)
+        clock.sleep(5)
+    return latencies, backend
+
+
+def main():
+    print("%d pump_events, answers %.2f s, %d%% take %d s, %d%% lost after the server recorded them" %
+          (EVENTS, FAST_SECONDS, TAIL * 100, TAIL_SECONDS, LOST * 100))
+    failed = False
+    p99s = {}
+    for name, timeout, retry_seconds in MODES:
+        for dedupe in (False, True):
+            latencies, backend = run(timeout, retry_seconds, dedupe)
+            recorded = backend.recorded("pump_event")
+            p99s[name] = percentile(latencies, 0.99)
+            ok = not dedupe or recorded == EVENTS
+            failed = failed or not ok
+            print("  %-12s timeout %4.1f s dedupe %-5s latency p50 %5.2f s p99 %5.2f s max %5.2f s, recorded %d "
+                  "(%d repeats dropped)  %s" %
+                  (name, timeout, dedupe, percentile(latencies, 0.5), p99s[name], max(latencies), recorded,
+                   backend.duplicates, "" if not dedupe else "OK" if ok else "FAIL"))
+    faster = p99s["aggressive"] <= p99s["conservative"]
+    failed = failed or not faster
+    print("  aggressive p99 %.2f s vs conservative %.2f s  %s" %
+          (p99s["aggressive"], p99s["conservative"], "OK" if faster else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
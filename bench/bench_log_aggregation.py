@@ -0,0 +1,104 @@
+# Host-side benchmark: bytes posted to /component/debug for the same captured loop trace,
+# with and without aggregation of repeated debug lines.
+# Runs on a virtual clock, one loop every sleep_time like the device, so the bulk rate limit of the outbound queue
+# sees the real pace. Also reports the lines the ring buffer had to drop, the upload has to keep up with the default
+# (aggregated) log. With every line kept a few can go while a pump runs, which only makes the savings smaller.
+# Checks the collapsed records come in the order of their last line, i.e. aggregation didn't move lines around.
+# Exits 1 if aggregation saves less than MIN_AGGREGATED, aggregation + sampling less than MIN_SAMPLED, lines are
+# dropped from an aggregated log, or records are out of order. Run from the repo root: python bench/bench_log_aggregation.py
+import json
+import re
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from loop_harness import Harness  # noqa: E402
+
+TICKS = 1200
+MIN_AGGREGATED = 25  # % less than every line
+MIN_SAMPLED = 50
+RECORD = re.compile(r"\[x(\d+) ([\d.]+)-([\d.]+)s\]$")
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def monotonic_ns(self):
+        return int(self.seconds * 1000000000)
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+def run(aggregate, sample_http=None):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    harness = Harness(remote_debug=True)
+    harness.debug.aggregate_remote = aggregate
+    if sample_http is not None:
+        harness.debug.set_remote_sample_rate("-->http", sample_http)
+    bodies = []  # The chunk buffer is reused, the backend only keeps a view of it
+
+    def handler(method, url, headers, data):
+        if "/component/debug" in url:
+            bodies.append(bytes(data))
+        return harness.backend(method, url, headers, data)
+    hardware_stubs.Session.handler = handler
+    for _ in range(TICKS):
+        harness.tick()
+        clock.sleep(harness.properties.config.sleep_time)
+    harness.pumping.remote_notifier.send_debug_logs_to_remote()
+    posts = [r for r in harness.backend.requests if r[1] == "debug"]
+    return harness.backend.bytes_by_path.get("debug", 0), len(posts), harness.pumping.pump_event_count, \
+        harness.debug.remote_lines.dropped, out_of_order(bodies)
+
+
+# Collapsed records whose last line is older than the one of a record before them
+def out_of_order(bodies):
+    count = 0
+    last = 0
+    for body in bodies:
+        for line in json.loads(body):
+            match = RECORD.search(line)
+            if match is None:
+                continue
+            if float(match.group(3)) < last:
+                count += 1
+            last = max(last, float(match.group(3)))
+    return count
+
+
+def main():
+    raw_bytes, raw_posts, events, raw_dropped, _ = run(False)
+    agg_bytes, agg_posts, _, agg_dropped, agg_order = run(True)
+    sampled_bytes, _, _, sampled_dropped, sampled_order = run(True, sample_http=4)
+    aggregated = 100.0 * (raw_bytes - agg_bytes) / raw_bytes
+    sampled = 100.0 * (raw_bytes - sampled_bytes) / raw_bytes
+    print("%d ticks, %d pump events, %d debug posts" % (TICKS, events, raw_posts))
+    print("  every line:                 %8d bytes, %d lines dropped" % (raw_bytes, raw_dropped))
+    print("  aggregated:                 %8d bytes (%.0f%% less), %d lines dropped, %d records out of order" %
+          (agg_bytes, aggregated, agg_dropped, agg_order))
+    print("  aggregated + http 1-in-4:   %8d bytes (%.0f%% less), %d lines dropped, %d records out of order" %
+          (sampled_bytes, sampled, sampled_dropped, sampled_order))
+    ok = aggregated >= MIN_AGGREGATED and sampled >= MIN_SAMPLED and agg_dropped + sampled_dropped == 0 and \
+        agg_order + sampled_order == 0
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
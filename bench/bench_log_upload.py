@@ -0,0 +1,140 @@
+# Host-side benchmark: flushing a 1,000 line debug backlog.
+#   legacy   - the previous do_debug_log_post: copy the lines into a list, json.dumps it and post it in one go
+#   chunked  - LogUploader streaming fixed-size chunks
+# A stand-in receiver reassembles the chunk stream by the sequence numbers of the lines and checks every line
+# arrives once, in order, after a post fails mid-flush and after the remote took a chunk but its reply was lost
+# (the lines come again, in a chunk cut differently). Run from the repo root: python bench/bench_log_upload.py
+import gc
+import json
+import tracemalloc
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from util.debug import Debug  # noqa: E402
+from util.outbound_queue import OutboundQueue  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+LINES = 1000
+
+
+def expected_line(n):
+    return "[controller] check_state: pump_state[idle], last_pump_state[idle], pumping_started_flag[False] #%d" % n
+
+
+class ChunkReceiver:
+    # Stand-in for /component/debug. Verifies lines as they arrive instead of storing them,
+    # so the receiver doesn't show up in the device-side heap numbers.
+    def __init__(self):
+        self.expected_sequence = {}
+        self.next_line = 0
+        self.duplicates = 0
+        self.fail_posts = set()
+        self.lose_replies = set()  # Posts taken, but the device doesn't get the reply
+        self.posts = 0
+        self.wire_bytes = 0
+
+    def __call__(self, method, url, headers, data):
+        if "/component/debug" not in url:
+            return hardware_stubs.Response(200, "{}")
+        self.posts += 1
+        if self.posts in self.fail_posts:
+            raise OSError("simulated link drop")
+        data = data.encode() if isinstance(data, str) else bytes(data)
+        self.wire_bytes += len(data)
+        query = dict(part.split("=") for part in url.split("?")[1].split("&"))
+        stream = query.get("stream", "legacy")
+        sequence = int(query.get("seq", self.expected_sequence.get(stream, 0)))
+        expected = self.expected_sequence.get(stream, 0)
+        for line in json.loads(data):
+            if sequence < expected:
+                self.duplicates += 1
+            elif line.startswith("[controller]"):
+                assert line.endswith(expected_line(self.next_line)), (line, self.next_line)
+                self.next_line += 1
+            sequence += 1
+        self.expected_sequence[stream] = max(expected, sequence)
+        if self.posts in self.lose_replies:
+            raise OSError("simulated lost reply")
+        return hardware_stubs.Response(200, "{}")
+
+
+def setup():
+    debug = Debug(remote_buffer_bytes=160 * 1024)
+    debug.debug = False
+    debug.toggle_remote_debug(True)
+    debug.aggregate_remote = False
+    properties = Properties(debug)
+    # Without the bulk rate limit, this is about flushing the whole backlog at once
+    notifier = RemoteEventNotifier(properties, debug, outbound=OutboundQueue(debug, (None, None, None)))
+    receiver = ChunkReceiver()
+    hardware_stubs.Session.handler = receiver
+    notifier.http.check_connection()
+    debug.clear_remote_lines()
+    debug.set_remote_quota("controller", 160 * 1024)
+    for n in range(LINES):
+        debug.remote_lines.append("controller", expected_line(n))
+    return debug, notifier, receiver
+
+
+def legacy_flush(debug, notifier):
+    log_lines = debug.get_remote_lines()
+    post_body = []
+    for log_line in log_lines:
+        post_body.append(log_line)
+    url = '{}/component/debug?mission=Pump1Mission'.format(notifier.http.remote_url)
+    response = notifier.http.do_post(url, {'Content-Type': 'application/json'}, post_body, "debug_log_post")
+    debug.ack_remote_lines(len(log_lines))
+    return response
+
+
+def measure(flush):
+    gc.collect()
+    tracemalloc.start()
+    flush()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    debug, notifier, receiver = setup()
+    legacy_peak = measure(lambda: legacy_flush(debug, notifier))
+    assert receiver.next_line == LINES
+    print("%d line flush" % LINES)
+    print("  legacy single post: peak heap %7d bytes, %d posts, %d bytes on the wire" %
+          (legacy_peak, receiver.posts, receiver.wire_bytes))
+
+    debug, notifier, receiver = setup()
+    peak = measure(notifier.send_debug_logs_to_remote)
+    # Only the lines logged by the http layer during the flush may still be pending
+    assert receiver.next_line == LINES and not any(line.startswith("[controller]")
+                                                   for line in debug.remote_lines.iter_lines())
+    print("  chunked:            peak heap %7d bytes, %d posts, %d bytes on the wire" %
+          (peak, receiver.posts, receiver.wire_bytes))
+
+    # Link drops on the 4th chunk: the first 3 chunks are freed, the rest resumes at the first line not acked
+    debug, notifier, receiver = setup()
+    receiver.fail_posts = {4, 5, 6}
+    notifier.send_debug_logs_to_remote()
+    pending = len(debug.remote_lines)
+    notifier.send_debug_logs_to_remote()
+    assert receiver.next_line == LINES and receiver.duplicates == 0
+    print("  resume after failed chunk: %d lines kept after the failure, all %d reassembled in order" %
+          (pending, receiver.next_line))
+
+    # The remote takes the 4th chunk but the reply is lost: its lines are sent again, after the http layer logged
+    # the failure in front of them, so the chunks are cut at other lines. The remote drops the ones it has.
+    debug, notifier, receiver = setup()
+    receiver.lose_replies = {4, 5, 6}
+    notifier.send_debug_logs_to_remote()
+    notifier.send_debug_logs_to_remote()
+    assert receiver.next_line == LINES and receiver.duplicates > 0
+    print("  resume after lost reply:   %d lines sent twice and dropped, all %d reassembled in order" %
+          (receiver.duplicates, receiver.next_line))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Host-side allocation budget for the main loop, run under tracemalloc with the stubbed hardware.
+# Drives WARMUP_TICKS, then measures CYCLES simulated fill/pump cycles. For every phase it records the peak
+# transient allocation (what a CircuitPython heap would have to find room for) and checks it against BUDGET.
+# Also checks the heap retained over the run stays flat, that the idle collects never ran while pumping, and that a
+# status refresh only sets label text: the display phase still allocates the strings it shows, but no Group, Bitmap or
+# Label is built again after the first status screen.
+# Exits non-zero when a budget is exceeded, so it can gate a change.
+# Run from the repo root: python bench/bench_memory.py
+import sys
+import tracemalloc
+
+import hardware_stubs
+import loop_harness
+from util.memory_monitor import MemoryMonitor
+
+WARMUP_TICKS = 240
+CYCLES = 10
+
+# Peak transient bytes per phase on the host. Steady state is a tick where nothing changed state
+# and nothing was sent; event ticks (state change, remote post, log flush) get the larger budget.
+# The gc phase is only budgeted in steady ticks, on event ticks it is the collect itself.
+BUDGET = {
+    "steady": {"log_flush": 256, "check_state": 512, "display": 256, "notify": 512, "ping": 256, "gc": 256},
+    "event": {"log_flush": 8192, "check_state": 1024, "display": 1024, "notify": 8192, "ping": 512},
+}
+RETAINED_GROWTH_BUDGET = 4096  # bytes kept after CYCLES cycles
+
+
+class PeakMonitor(MemoryMonitor):
+    # MemoryMonitor fed by tracemalloc, additionally records the peak of every phase
+    def __init__(self):
+        super().__init__(mem_alloc=lambda: tracemalloc.get_traced_memory()[0])
+        self.peaks = {}
+        self.collects_while_pumping = 0
+        self.pump = None
+
+    def begin_tick(self):
+        super().begin_tick()
+        self.peaks = {}
+        tracemalloc.reset_peak()
+
+    def mark(self, phase):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peaks[phase] = peak - (self.last_alloc or current)
+        super().mark(phase)
+        tracemalloc.reset_peak()
+
+    def collect_if_idle(self, busy):
+        collected = super().collect_if_idle(busy)
+        if collected and self.pump is not None and self.pump.running:
+            self.collects_while_pumping += 1
+        return collected
+
+
+def main():
+    tracemalloc.start()
+    monitor = PeakMonitor()
+    harness = loop_harness.Harness(memory=monitor)
+    monitor.pump = harness.pump
+    display_status = harness.display.display_status
+    rebuilt = [0, 0]  # status refreshes, screen objects they built
+
+    # The harness's status refresh, counting the screen objects built after the first one
+    def counted_display_status(*args):
+        created = hardware_stubs.Group.created
+        display_status(*args)
+        if harness.display.status_group is not None and rebuilt[0] > 0:
+            rebuilt[1] += hardware_stubs.Group.created - created
+        rebuilt[0] += 1
+    harness.display.display_status = counted_display_status
+    for _ in range(WARMUP_TICKS):
+        harness.tick()
+    harness.backend.requests.clear()
+
+    worst = {"steady": {}, "event": {}}
+    ticks = {"steady": 0, "event": 0}
+    start_retained = tracemalloc.get_traced_memory()[0]
+    for _ in range(CYCLES * loop_harness.CYCLE_TICKS):
+        state_before = harness.pumping.pump_state
+        harness.tick()
+        changed = harness.pumping.pump_state != state_before or len(harness.backend.requests) > 0
+        # The stand-in backend keeps every request, that isn't the device's memory
+        harness.backend.requests.clear()
+        kind = "event" if changed or harness.loop_count % 5 == 0 else "steady"
+        ticks[kind] += 1
+        for phase, peak in monitor.peaks.items():
+            if peak > worst[kind].get(phase, 0):
+                worst[kind][phase] = peak
+    monitor.collect_if_idle(False)
+    retained = tracemalloc.get_traced_memory()[0] - start_retained
+
+    failed = False
+    print("%d cycles, worst peak transient bytes per phase (budget)" % CYCLES)
+    for kind in ("steady", "event"):
+        print("  %s ticks: %d" % (kind, ticks[kind]))
+        for phase, budget in BUDGET[kind].items():
+            peak = worst[kind].get(phase, 0)
+            over = peak > budget
+            failed = failed or over
+            print("    %-12s %6d (%6d)%s" % (phase, peak, budget, "  OVER BUDGET" if over else ""))
+    print("  retained growth %d bytes (%d)%s" % (retained, RETAINED_GROWTH_BUDGET,
+                                                 "  OVER BUDGET" if retained > RETAINED_GROWTH_BUDGET else ""))
+    # (unplanned collects aren't meaningful here, CPython frees by reference counting)
+    print("  idle collects %d, while pumping %d" % (monitor.planned_collects, monitor.collects_while_pumping))
+    print("  allocating phases: %s" % ", ".join(monitor.allocating_phases()))
+    print("  status refreshes %d, screen objects rebuilt %d%s" % (rebuilt[0], rebuilt[1],
+                                                                  "  FAIL" if rebuilt[1] else ""))
+    failed = failed or retained > RETAINED_GROWTH_BUDGET or monitor.collects_while_pumping > 0 or rebuilt[1] > 0
+    if failed:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
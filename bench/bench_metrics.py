@@ -0,0 +1,159 @@
+# Host-side benchmark for the on-device metrics endpoint.
+# Runs the loop_harness controller through fill/pump cycles with a MetricsServer registered the way code.py does it
+# (StationScheduler.register_metrics, the tick phases, uptime) on the stand-in socket pool, and scrapes it between
+# ticks.
+# Reports the cost of an idle poll (nothing to accept) and of the poll that serves a scrape, for /metrics and
+# /metrics.json, and the response size. Then checks:
+#   - every sample line parses as Prometheus text and Content-Length matches, the JSON loads
+#   - a response larger than the socket takes in one send goes out over several polls
+#   - a client that connects and never sends its request is dropped after CLIENT_TIMEOUT_MS, no poll waits on it
+# Exits 1 if a check fails or a scrape poll takes more than SCRAPE_BUDGET_US at p99 on the host.
+# Run from the repo root: python bench/bench_metrics.py
+import json
+import re
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from loop_harness import CYCLE_TICKS, Harness  # noqa: E402
+from stations import StationScheduler  # noqa: E402
+from util import metrics_server  # noqa: E402
+from util.metrics_server import MetricsServer  # noqa: E402
+
+PORT = 9100
+SCRAPES = 200
+SCRAPE_BUDGET_US = 1000
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?[0-9.]+$')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def build():
+    harness = Harness()
+    scheduler = StationScheduler([harness.pumping], harness.debug)
+    metrics = MetricsServer(harness.debug, PORT)
+    scheduler.register_metrics(metrics)
+    metrics.register("pump_uptime_seconds", "Seconds since power on", "gauge", lambda: int(time.monotonic()))
+    metrics.register("pump_tick_phase_ms", "Main loop phase time over the last ticks", "summary",
+                     harness.profiler.metric_values)
+    metrics.register("pump_metrics_scrape_microseconds", "Time to render the previous scrape", "gauge",
+                     lambda: metrics.last_scrape_us)
+    pool = harness.pumping.remote_notifier.http.pool
+    return harness, metrics, pool
+
+
+def timed_poll(metrics, pool):
+    start = time.perf_counter_ns()
+    metrics.poll(pool)
+    return (time.perf_counter_ns() - start) / 1000
+
+
+def scrape(metrics, pool, path):
+    client = pool.connect(PORT)
+    client.inbound += b"GET %s HTTP/1.1\r\nHost: pump\r\nAccept: */*\r\n\r\n" % path
+    cost = timed_poll(metrics, pool)
+    return client, cost
+
+
+def split_response(data):
+    head, body = bytes(data).split(b"\r\n\r\n", 1)
+    length = int(re.search(rb"Content-Length: *([0-9]+)", head).group(1))
+    return head, body, length
+
+
+def check_prometheus(client):
+    head, body, length = split_response(client.outbound)
+    bad = [line for line in body.decode().splitlines() if not line.startswith("#") and not SAMPLE.match(line)]
+    return length == len(body) and not bad and client.closed, bad
+
+
+def main():
+    harness, metrics, pool = build()
+    idle = []
+    costs = {b"/metrics": [], b"/metrics.json": []}
+    sizes = {}
+    ok_format = True
+    bad_lines = []
+    for i in range(SCRAPES):
+        for tick in range(CYCLE_TICKS // 20):
+            harness.tick()
+            idle.append(timed_poll(metrics, pool))
+        for path in costs:
+            client, cost = scrape(metrics, pool, path)
+            costs[path].append(cost)
+            sizes[path] = len(client.outbound)
+            if path == b"/metrics":
+                ok, bad = check_prometheus(client)
+                ok_format = ok_format and ok
+                bad_lines += bad
+            else:
+                head, body, length = split_response(client.outbound)
+                ok_format = ok_format and length == len(body) and isinstance(json.loads(body), dict)
+
+    print("%d scrapes of each, one every %d ticks" % (SCRAPES, CYCLE_TICKS // 20))
+    print("  idle poll          median %6.1f us p99 %6.1f us" % (percentile(idle, 0.5), percentile(idle, 0.99)))
+    failed = False
+    for path, values in costs.items():
+        p99 = percentile(values, 0.99)
+        failed = failed or p99 > SCRAPE_BUDGET_US
+        print("  %-18s median %6.1f us p99 %6.1f us, %5d bytes  %s" %
+              (path.decode(), percentile(values, 0.5), p99, sizes[path], "OK" if p99 <= SCRAPE_BUDGET_US else "FAIL"))
+    print("  format: Prometheus text and JSON  %s" % ("OK" if ok_format else "FAIL %s" % bad_lines[:3]))
+
+    # A socket that only takes 536 bytes per send
+    client = pool.connect(PORT)
+    client.send_window = 536
+    client.inbound += b"GET /metrics HTTP/1.1\r\n\r\n"
+    polls = 0
+    while not client.closed and polls < 100:
+        metrics.poll(pool)
+        polls += 1
+    ok_partial, bad = check_prometheus(client)
+    print("  %d byte response at 536 bytes per send: %d polls  %s" %
+          (len(client.outbound), polls, "OK" if ok_partial else "FAIL"))
+
+    # A client that never sends its request
+    silent = pool.connect(PORT)
+    silent_costs = []
+    start = time.monotonic()
+    while not silent.closed and time.monotonic() - start < 5:
+        silent_costs.append(timed_poll(metrics, pool))
+        busy_wait(0.01)
+    ok_silent = silent.closed and max(silent_costs) < SCRAPE_BUDGET_US
+    print("  silent client dropped after %.1f s (timeout %d ms), slowest poll meanwhile %.1f us  %s" %
+          (time.monotonic() - start, metrics_server.CLIENT_TIMEOUT_MS, max(silent_costs),
+           "OK" if ok_silent else "FAIL"))
+
+    # Metrics with no value yet, a scrape leaves them out instead of failing
+    metrics.register("pump_bench_unset", "Never set", "gauge", lambda: None)
+    metrics.register("pump_bench_partly_set", "One sensor not read yet", "gauge",
+                     lambda: [('sensor="a"', None), ('sensor="b"', 1)])
+    client, cost = scrape(metrics, pool, b"/metrics")
+    ok_prometheus, bad = check_prometheus(client)
+    text = bytes(client.outbound).decode()
+    client, cost = scrape(metrics, pool, b"/metrics.json")
+    head, body, length = split_response(client.outbound)
+    values = json.loads(body)
+    ok_none = (ok_prometheus and 'pump_bench_partly_set{sensor="b"} 1' in text and 'sensor="a"' not in text and
+               "pump_bench_unset" not in values and values["pump_bench_partly_set"] == {'sensor="b"': 1})
+    print("  metrics without a value left out of both formats  %s" % ("OK" if ok_none else "FAIL"))
+
+    failed = failed or not ok_format or not ok_partial or not ok_silent or not ok_none
+    sys.exit(1 if failed else 0)
+
+
+# time.sleep is a no-op under hardware_stubs
+def busy_wait(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+if __name__ == "__main__":
+    main()
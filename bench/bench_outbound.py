@@ -0,0 +1,161 @@
+# Host-side benchmark for the OutboundQueue priority classes, on a virtual clock where every post takes
+# POST_MS plus its bytes at THROUGHPUT (and the retry sleeps in do_post take their time).
+#   backlog  - BACKLOG debug lines are waiting when a pump cycle runs: the debug flush every 5 ticks, and the
+#              pumping_timeout while the pump runs / the pump_event right after it stopped.
+#              "unprioritized" is the previous behaviour (the flush posts the whole backlog whenever it runs),
+#              "priority" the queue.
+#              Reports how long each control notification waited behind the flush in its tick.
+#   outage   - the link is down when the pump_event is due and comes back OUTAGE_TICKS later. Before the queue the
+#              event was lost, now it has to go out once the link is back, with its event id.
+# Prints the per class queue metrics at the end.
+# Exits 1 if a control notification waits behind more than the bulk burst (one chunk while the pump runs) or the
+# outage loses the pump event.
+# Run from the repo root: python bench/bench_outbound.py
+import json
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.outbound_queue import CLASS_LIMITS, OutboundQueue  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+BACKLOG = 400
+POST_MS = 80
+THROUGHPUT = 50000
+CHUNK_SIZE = 1024  # debug_log_chunk_size default
+TICK_MS = 1000
+OUTAGE_TICKS = 20
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class Server:
+    def __init__(self, clock):
+        self.clock = clock
+        self.down = False
+        self.received = []  # (seconds, action, event id)
+
+    def __call__(self, method, url, headers, data):
+        if self.down:
+            self.clock.sleep(POST_MS / 1000)
+            raise OSError("link down")
+        self.clock.sleep((POST_MS + len(data or b"") * 1000 / THROUGHPUT) / 1000)
+        if "/mission" in url:
+            body = json.loads(data)
+            self.received.append((self.clock.seconds, body["action"], body["eventId"]))
+        return hardware_stubs.Response(200, json.dumps({"eventId": "e%d" % len(self.received)}))
+
+
+def setup(limits):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    server = Server(clock)
+    hardware_stubs.Session.handler = server
+    radio = sys.modules["wifi"].radio
+    radio.ping_result = 0.01
+    debug = Debug(remote_buffer_bytes=64 * 1024)
+    debug.debug = False
+    debug.toggle_remote_debug(True)
+    debug.aggregate_remote = False
+    debug.set_remote_quota("controller", 64 * 1024)
+    properties = Properties(debug)
+    outbound = OutboundQueue(debug, limits)
+    outbound.bulk_depth = lambda: len(debug.remote_lines)
+    notifier = RemoteEventNotifier(properties, debug, outbound=outbound)
+    while not notifier.http.bring_up_network():
+        pass
+    for n in range(BACKLOG):
+        debug.remote_lines.append("controller", "[controller] check_state: pump_state[idle] water level #%d" % n)
+    return clock, server, notifier, radio
+
+
+def run_backlog(limits, prioritized):
+    clock, server, notifier, radio = setup(limits)
+    waits = {}
+    # tick -> (pump running, control notification due in that tick)
+    events = {5: (True, "pumping_timeout"), 10: (False, "pump_event")}
+    for tick in range(1, 16):
+        tick_start = clock.seconds
+        running, action = events.get(tick, (False, None))
+        if tick % 5 == 0:
+            notifier.send_debug_logs_to_remote(running and prioritized)
+        if action == "pumping_timeout":
+            notifier.pumping_timout("timed_out", {"elapsed": 40})
+        elif action == "pump_event":
+            notifier.pump_event("pumping", {"last_pump_elapsed_time": 45, "pump_event_count": 1})
+        if action is not None:
+            sent = [received for received in server.received if received[1] == action]
+            waits[action] = int((sent[0][0] - tick_start) * 1000) if sent else None
+        clock.sleep(TICK_MS / 1000)
+    return waits, notifier
+
+
+def run_outage():
+    clock, server, notifier, radio = setup(CLASS_LIMITS)
+    notifier.debug.clear_remote_lines()
+    notifier.send_ready_to_pump("ready")
+    event_id = notifier.event_id
+    server.down = True
+    radio.ping_result = None
+    notifier.pump_event("pumping", {"last_pump_elapsed_time": 45, "pump_event_count": 1})
+    for tick in range(OUTAGE_TICKS + 80):
+        if tick == OUTAGE_TICKS:
+            server.down = False
+            radio.ping_result = 0.01
+        if not notifier.http.last_http_status_success():
+            notifier.http.ping_default()
+        notifier.send_queued()
+        clock.sleep(TICK_MS / 1000)
+    delivered = [received for received in server.received if received[1] == "pump_event"]
+    return delivered, event_id, notifier
+
+
+def main():
+    print("%d debug lines waiting, posts take %d ms + bytes at %d KB/s" % (BACKLOG, POST_MS, THROUGHPUT // 1000))
+    failed = False
+    chunk_ms = POST_MS + CHUNK_SIZE * 1000 // THROUGHPUT
+    # The chunks of the burst, and the ones the bucket refills for while they go out
+    rate, burst = CLASS_LIMITS[2]
+    burst_ms = chunk_ms * int(burst / (CHUNK_SIZE - rate * chunk_ms / 1000))
+    for name, limits in (("unprioritized", (None, None, None)), ("priority", CLASS_LIMITS)):
+        waits, notifier = run_backlog(limits, name == "priority")
+        print("  %-14s pumping_timeout (pump running) waited %5d ms, pump_event waited %5d ms, %d lines still queued" %
+              (name, waits["pumping_timeout"], waits["pump_event"], len(notifier.debug.remote_lines)))
+        if name == "priority":
+            ok = waits["pumping_timeout"] <= chunk_ms + POST_MS * 2 and waits["pump_event"] <= burst_ms + POST_MS * 2
+            failed = failed or not ok
+            print("  %-14s %s" % ("", "OK" if ok else "FAIL"))
+
+    delivered, event_id, notifier = run_outage()
+    ok = len(delivered) == 1 and delivered[0][2] == event_id
+    failed = failed or not ok
+    print("  outage: pump_event delivered %d time(s) with event id %s (expected %s)  %s" %
+          (len(delivered), delivered[0][2] if delivered else None, event_id, "OK" if ok else "FAIL"))
+    for class_name, stats in notifier.outbound.summary().items():
+        print("    %-8s sent %3d deferred %3d dropped %d depth %3d wait last %6d ms max %6d ms" %
+              (class_name, stats[0], stats[1], stats[2], stats[3], stats[4], stats[5]))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
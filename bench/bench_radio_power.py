@@ -0,0 +1,219 @@
+# Host-side benchmark for the radio duty-cycling (RadioPower), on a virtual clock.
+# The loop_harness controller runs HOURS of fill cycles, one every FILL_MINUTES (floats driven by the clock), with
+# the status handshake from secrets.json in between. The stand-in radio charges the time of an association:
+#   full - SCAN_MS + ASSOC_MS + DHCP_MS
+#   fast - ASSOC_MS, + DHCP_MS when the cached address is too old to set
+# Half way the access point moves to another channel, the cached one no longer works.
+#   always on     - radio_idle_seconds 0, as before
+#   duty cycled   - radio_idle_seconds IDLE_SECONDS
+# Reports the radio on time per day (measured on the radio and as reported), associations per kind and their mean
+# time (a fallback's full one includes the failed fast try), and what the backend recorded. The handshake counts can
+# differ by the early handshake before a pump cycle, whether it is due depends on when the last one went out.
+# Then the access point goes away for GONE_MINUTES while the duty cycled radio is asleep, the loop keeps posting its
+# status handshakes. Reports the longest tick meanwhile and whether the radio came back once the access point did.
+# Exits 1 if duty cycling doesn't at least halve the on time, loses a notification, leaves the radio down while a
+# station isn't idle, fast associations aren't faster than full ones, a tick with the access point gone takes longer
+# than MAX_GONE_TICK_SECONDS, or the radio isn't back and posting after it returns.
+# Run from the repo root: python bench/bench_radio_power.py
+import json
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.simple_timer  # noqa: E402
+from loop_harness import Harness  # noqa: E402
+
+HOURS = 24
+TICK_SECONDS = 1
+FILL_MINUTES = 40
+BOTTOM_AT = 35 * 60  # Seconds into a cycle
+TOP_AT = 38 * 60
+DRAIN_SECONDS = 20
+IDLE_SECONDS = 30
+SCAN_MS = 1500
+ASSOC_MS = 300
+DHCP_MS = 700
+GONE_MINUTES = 30
+FAILED_ASSOCIATION_SECONDS = 3
+MAX_GONE_TICK_SECONDS = 4 * FAILED_ASSOCIATION_SECONDS  # Two single attempts (fast, then full), from tick or a post
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def monotonic_ns(self):
+        return int(self.seconds * 1000000000)
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class TimedRadio(hardware_stubs.Radio):
+    def __init__(self, clock):
+        self.clock = clock
+        self.on = True
+        self.on_seconds = 0
+        self.on_since = clock.seconds
+        self.gone = False  # The access point doesn't answer on any channel
+        super().__init__()
+
+    @property
+    def enabled(self):
+        return self.on
+
+    @enabled.setter
+    def enabled(self, value):
+        if self.on and not value:
+            self.on_seconds += self.clock.seconds - self.on_since
+        elif value and not self.on:
+            self.on_since = self.clock.seconds
+        self.on = value
+
+    def on_total(self):
+        return self.on_seconds + (self.clock.seconds - self.on_since if self.on else 0)
+
+    def connect(self, ssid, password, channel=0, bssid=None, **kwargs):
+        if not self.on:
+            raise ConnectionError("radio off")
+        if self.gone or (channel and channel != self.ap_info.channel):
+            self.clock.sleep(FAILED_ASSOCIATION_SECONDS)  # Waits for the access point that isn't there
+            raise ConnectionError("No network with that ssid")
+        self.clock.sleep(((ASSOC_MS if channel else SCAN_MS + ASSOC_MS) + (DHCP_MS if self.dhcp else 0)) / 1000)
+        super().connect(ssid, password)
+
+    def ping(self, ip=None):
+        return self.ping_result if self.on else None
+
+
+class TimedHarness(Harness):
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.pump_on_at = None
+        self.cycle_start = clock.seconds
+        pump_on = self.pump.pump_on
+
+        def on():
+            if not self.pump.running:
+                self.pump_on_at = self.clock.seconds
+            pump_on()
+        self.pump.pump_on = on
+
+    def drive_floats(self):
+        elapsed = self.clock.seconds - self.cycle_start
+        bottom = self.readers[0].water_level_sensor
+        top = self.readers[1].water_level_sensor
+        if self.pump_on_at is not None:
+            top.value = False
+            bottom.value = self.clock.seconds - self.pump_on_at < DRAIN_SECONDS
+            if not self.pump.running and not bottom.value:
+                self.pump_on_at = None
+                self.cycle_start = self.clock.seconds
+        else:
+            bottom.value = elapsed >= BOTTOM_AT
+            top.value = elapsed >= TOP_AT
+
+
+def run(idle_seconds):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    radio = TimedRadio(clock)
+    sys.modules["wifi"].radio = radio
+    harness = TimedHarness(clock)
+    harness.properties.config.radio_idle_seconds = idle_seconds
+    http = harness.pumping.remote_notifier.http
+    backend = harness.backend
+    start = clock.seconds
+    on_start = radio.on_total()
+    moved = False
+    down_while_active = 0
+    while clock.seconds - start < HOURS * 3600:
+        if not moved and clock.seconds - start >= HOURS * 3600 / 2:
+            radio.ap_info.channel = 11
+            moved = True
+            if idle_seconds == 0:
+                http.need_to_connect = True  # The always on radio loses the access point too
+        harness.tick()
+        if harness.pumping.pump_state != harness.pumping.IDLE and not radio.on:
+            down_while_active += 1
+        clock.sleep(TICK_SECONDS)
+    actions = [json.loads(data)["action"] for method, path, data in backend.requests if path.startswith("mission")]
+    on_per_day = (radio.on_total() - on_start) * 86400 / (clock.seconds - start)
+    return on_per_day, http.radio_power.summary(), actions, down_while_active
+
+
+# The duty cycled radio goes to sleep, the access point goes away for GONE_MINUTES and comes back.
+# Returns the longest tick while it was gone and the handshakes that went through after it came back.
+def run_gone():
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    radio = TimedRadio(clock)
+    sys.modules["wifi"].radio = radio
+    harness = TimedHarness(clock)
+    harness.properties.config.radio_idle_seconds = IDLE_SECONDS
+    http = harness.pumping.remote_notifier.http
+    while not http.radio_power.asleep:
+        harness.tick()
+        clock.sleep(TICK_SECONDS)
+    radio.gone = True
+    longest = 0
+    start = clock.seconds
+    while clock.seconds - start < GONE_MINUTES * 60:
+        tick_start = clock.seconds
+        harness.tick()
+        longest = max(longest, clock.seconds - tick_start)
+        clock.sleep(TICK_SECONDS)
+    radio.gone = False
+    requests = len(harness.backend.requests)
+    start = clock.seconds
+    while clock.seconds - start < GONE_MINUTES * 60:
+        harness.tick()
+        clock.sleep(TICK_SECONDS)
+    return longest, len(harness.backend.requests) - requests
+
+
+def main():
+    print("%d h, a fill cycle every %d min, association scan %d ms, associate %d ms, DHCP %d ms" %
+          (HOURS, FILL_MINUTES, SCAN_MS, ASSOC_MS, DHCP_MS))
+    results = {}
+    for name, idle_seconds in (("always on", 0), ("duty cycled", IDLE_SECONDS)):
+        on_per_day, summary, actions, down_while_active = run(idle_seconds)
+        results[name] = (on_per_day, actions.count("pump_event"), actions.count("ready_to_pump"))
+        print("  %-12s radio on %5.1f h/day (reported %5.1f), %4d sleeps, full %3d x %5d ms, fast %4d x %5d ms, "
+              "%d fallbacks, %d pump_event %d ready_to_pump %d handshakes, %d ticks down while active" %
+              (name, on_per_day / 3600, summary["on_per_day"] / 3600, summary["sleeps"], summary["full"][0],
+               summary["full"][1], summary["fast"][0], summary["fast"][1], summary["fallbacks"],
+               actions.count("pump_event"), actions.count("ready_to_pump"), actions.count("status_handshake"),
+               down_while_active), end="")
+        if idle_seconds == 0:
+            print()
+            continue
+        ok = on_per_day <= results["always on"][0] / 2 and results[name][1:] == results["always on"][1:] and \
+            results[name][1] > 0 and down_while_active == 0 and summary["fast"][1] < summary["full"][1] and \
+            summary["fallbacks"] >= 1
+        print("  %s" % ("OK" if ok else "FAIL"))
+    longest, posted = run_gone()
+    ok_gone = longest <= MAX_GONE_TICK_SECONDS and posted > 0
+    print("  access point gone %d min while asleep: longest tick %.1f s (%d s), %d posts once it was back  %s" %
+          (GONE_MINUTES, longest, MAX_GONE_TICK_SECONDS, posted, "OK" if ok_gone else "FAIL"))
+    sys.exit(0 if ok and ok_gone else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Host-side benchmark for the network recovery ladder (NetworkRecovery), on a virtual clock.
+# The loop posts a status every TICK_SECONDS while a fault is injected that only one kind of step clears:
+#   session      - the requests session is stale, a new one fixes it (ping still works)
+#   pool         - the socket pool is wedged, a new one fixes it (ping still works)
+#   radio        - the radio is stuck, turning it off and on fixes it
+#   association  - the access point dropped the station, a connect after stop_station() fixes it
+#   permanent    - nothing but a reboot helps
+# Compared with what the failure paths did before: flag a reconnect on every failure, reboot once error_count passed
+# 20 (the ping threshold was 40, so the old numbers here are on the generous side). A reboot costs BOOT_SECONDS.
+# Reports the time from the fault to the first request through, the step that did it, connects and reboots.
+# Exits 1 if the ladder doesn't clear a fault with its step, reboots for anything but the permanent fault, doesn't
+# reboot for that one, or is slower than before for a fault a step clears.
+# Run from the repo root: python bench/bench_recovery.py
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import util.network_recovery  # noqa: E402
+import util.simple_timer  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.http_functions import HttpFunctions  # noqa: E402
+from util.network_recovery import RUNGS, NetworkRecovery  # noqa: E402
+from util.properties import Properties  # noqa: E402
+
+TICK_SECONDS = 1
+CONNECT_SECONDS = 2
+PING_FAIL_SECONDS = 0.5  # Per try, ping() makes 5
+REQUEST_FAIL_SECONDS = 1
+BOOT_SECONDS = 30  # Boot, association, hello
+LIMIT_SECONDS = 900
+FAULTS = (("session", "session"), ("pool", "pool"), ("radio", "radio"), ("association", "reconnect"),
+          ("permanent", "reboot"))
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def time(self):
+        return self.seconds
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+
+
+class Network:
+    # Counts what the device did to its connection, a fault holds until the step that clears it was taken
+    def __init__(self, clock):
+        self.clock = clock
+        self.sessions = 0
+        self.pools = 0
+        self.fault = None
+        self.since = None  # The counters when the fault was injected
+        self.radio = None
+
+    def counters(self):
+        return {
+            "session": self.sessions,
+            "pool": self.pools,
+            "radio": self.radio.cycles,
+            "association": self.radio.stop_count,
+            "permanent": hardware_stubs.Microcontroller.reset_count
+        }
+
+    def inject(self, fault):
+        self.fault = fault
+        self.since = self.counters()
+
+    def broken(self, ping=False):
+        if self.fault is None or self.counters()[self.fault] != self.since[self.fault]:
+            return False
+        return not ping or self.fault in ("radio", "association", "permanent")
+
+    def session(self, pool, ssl_context=None):
+        self.sessions += 1
+        return hardware_stubs.Session(pool, ssl_context)
+
+    def socket_pool(self, radio):
+        self.pools += 1
+        return hardware_stubs.SocketPool(radio)
+
+    def __call__(self, method, url, headers, data):
+        if self.broken():
+            self.clock.sleep(REQUEST_FAIL_SECONDS)
+            raise OSError("[Errno 113] ECONNABORTED")
+        self.clock.sleep(0.1)
+        return hardware_stubs.Response(200, "{}")
+
+
+class FaultyRadio(hardware_stubs.Radio):
+    def __init__(self, network):
+        self.network = network
+        self.cycles = 0
+        self.on = True
+        super().__init__()
+
+    @property
+    def enabled(self):
+        return self.on
+
+    @enabled.setter
+    def enabled(self, value):
+        if value and not self.on:
+            self.cycles += 1
+        self.on = value
+
+    def connect(self, ssid, password, **kwargs):
+        self.network.clock.sleep(CONNECT_SECONDS)
+        super().connect(ssid, password, **kwargs)
+
+    def ping(self, ip=None):
+        if self.network.broken(ping=True):
+            self.network.clock.sleep(PING_FAIL_SECONDS)
+            return None
+        return 0.01
+
+
+class OldRecovery(NetworkRecovery):
+    # What the failure paths did before
+    def failed(self, ping=False):
+        self.http.need_to_connect = True
+        if self.http.error_count > 20:
+            self.climb(util.network_recovery.REBOOT)
+
+    def recovered(self, ping=False):
+        pass
+
+
+def run(fault, ladder):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    util.simple_timer.time = clock.time
+    network = Network(clock)
+    network.radio = FaultyRadio(network)
+    sys.modules["wifi"].radio = network.radio
+    sys.modules["socketpool"].SocketPool = network.socket_pool
+    sys.modules["adafruit_requests"].Session = network.session
+    hardware_stubs.Session.handler = network
+    debug = Debug()
+    debug.debug = False
+    http = HttpFunctions(Properties(debug), debug)
+    if not ladder:
+        http.recovery = OldRecovery(http, debug)
+    while not http.bring_up_network():
+        clock.sleep(TICK_SECONDS)
+    for n in range(3):
+        http.do_action_post("status", "IDLE", {})
+        clock.sleep(TICK_SECONDS)
+    connects = network.radio.connect_count
+    resets = hardware_stubs.Microcontroller.reset_count
+    start = clock.seconds
+    network.inject(fault)
+    took = None
+    while clock.seconds - start < LIMIT_SECONDS:
+        response = http.do_action_post("status", "IDLE", {})
+        if hardware_stubs.Microcontroller.reset_count != resets:
+            took = clock.seconds + BOOT_SECONDS - start
+            break
+        if http.success(response):
+            took = clock.seconds - start
+            break
+        clock.sleep(TICK_SECONDS)
+    cleared = None
+    for i in range(len(RUNGS) - 1):
+        if http.recovery.stats[i][1]:
+            cleared = RUNGS[i]
+    if hardware_stubs.Microcontroller.reset_count != resets:
+        cleared = "reboot"
+    return took, cleared, network.radio.connect_count - connects, hardware_stubs.Microcontroller.reset_count - resets
+
+
+def main():
+    print("Status post every %d s, connect %d s, failed ping try %.1f s, failed request %d s, reboot %d s" %
+          (TICK_SECONDS, CONNECT_SECONDS, PING_FAIL_SECONDS, REQUEST_FAIL_SECONDS, BOOT_SECONDS))
+    failed = False
+    for fault, rung in FAULTS:
+        results = {}
+        for ladder in (False, True):
+            took, cleared, connects, reboots = run(fault, ladder)
+            results[ladder] = took
+            print("  %-12s %-7s %s by %-9s %3d connects %d reboots" %
+                  (fault, "ladder" if ladder else "before",
+                   "recovered in %6.1f s" % took if took is not None else "not recovered in %d s" % LIMIT_SECONDS,
+                   cleared if ladder else "-", connects, reboots), end="")
+            if ladder:
+                ok = took is not None and cleared == rung and reboots == (1 if rung == "reboot" else 0)
+                if rung != "reboot":
+                    ok = ok and (results[False] is None or took <= results[False])
+                failed = failed or not ok
+                print("  %s" % ("OK" if ok else "FAIL"))
+            else:
+                print()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Host-side benchmark for the multi-station scheduler.
+# Builds 1..16 stations from a "stations" config with build_stations, drives every station's floats through the
+# fill/pump cycle of loop_harness (offset per station so they don't all pump at once) and steps them with
+# StationScheduler for CYCLES cycles against the stand-in backend.
+# Reports the scheduler cost per tick and per station-tick (median and p99), the requests per tick, how many
+# connections were opened and the pump events each station reported.
+# Exits 1 if the cost per station grows more than LINEAR_SLACK over the single station, if more than one
+# connection was opened, a station missed a pump event or a request went out without its station name.
+# Run from the repo root: python bench/bench_stations.py
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from loop_harness import BOTTOM_WET_AT, CYCLE_TICKS, TOP_WET_AT, Backend  # noqa: E402
+from stations import StationScheduler, build_stations  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.pumping_display import PumpingDisplay  # noqa: E402
+
+STATION_COUNTS = (1, 2, 4, 8, 16)
+CYCLES = 4
+LINEAR_SLACK = 2.0  # Per station cost over the single station, quadratic growth would be 16x at 16 stations
+
+
+class CountingSession(hardware_stubs.Session):
+    created = 0
+
+    def __init__(self, pool, ssl_context=None):
+        super().__init__(pool, ssl_context)
+        CountingSession.created += 1
+
+
+def declarations(count):
+    stations = []
+    for i in range(count):
+        stations.append({"name": "S%d" % i, "pump": "D12",
+                         "sensors": [{"name": "S%d Bottom" % i, "enable": "D5", "pin": "D5"},
+                                     {"name": "S%d Top" % i, "enable": "D6", "pin": "D6"}]})
+    return stations
+
+
+def drive_floats(station, tick):
+    # Same cycle as loop_harness.Harness.drive_floats
+    phase = tick % CYCLE_TICKS
+    bottom = station.water_level_readers[0].water_level_sensor
+    top = station.water_level_readers[-1].water_level_sensor
+    if station.pump.running:
+        top.value = False
+        bottom.value = phase < TOP_WET_AT + 10
+    else:
+        bottom.value = phase >= BOTTOM_WET_AT
+        top.value = phase >= TOP_WET_AT
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(count):
+    backend = Backend()
+    hardware_stubs.Session.handler = backend
+    sys.modules["adafruit_requests"].Session = CountingSession
+    CountingSession.created = 0
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    properties.config.stations = declarations(count)
+    display = PumpingDisplay(debug, properties)
+    scheduler = StationScheduler(build_stations(properties, display, debug), debug)
+    http = scheduler.primary.remote_notifier.http
+    while not http.bring_up_network():
+        pass
+    for station in scheduler.stations:
+        station.pump_overrun_seconds = 0
+    offsets = [i * CYCLE_TICKS // count for i in range(count)]
+
+    costs = []
+    backend.requests.clear()
+    ticks = CYCLES * CYCLE_TICKS
+    for tick in range(ticks):
+        for i in range(count):
+            drive_floats(scheduler.stations[i], tick + offsets[i])
+        start = time.perf_counter_ns()
+        scheduler.check_all()
+        scheduler.notify_all()
+        costs.append((time.perf_counter_ns() - start) / 1000)
+    events = [station.pump_event_count for station in scheduler.stations]
+    tagged = 0
+    for method, path, data in backend.requests:
+        if data is not None and b'"station"' in (data if isinstance(data, bytes) else data.encode()):
+            tagged += 1
+    return costs, len(backend.requests) / ticks, CountingSession.created, events, tagged, len(backend.requests)
+
+
+def main():
+    print("%d cycles of %d ticks per station count" % (CYCLES, CYCLE_TICKS))
+    failed = False
+    base = None
+    for count in STATION_COUNTS:
+        costs, requests_per_tick, sessions, events, tagged, requests = run(count)
+        median = percentile(costs, 0.5)
+        per_station = median / count
+        if base is None:
+            base = per_station
+        linear = per_station <= base * LINEAR_SLACK
+        ok = linear and sessions == 1 and min(events) >= CYCLES - 1 and tagged == requests
+        failed = failed or not ok
+        print("  %2d stations  tick median %7.1f us p99 %8.1f us, %5.1f us/station (x%.2f), %.2f requests/tick, "
+              "%d connection, pump events %d-%d  %s" %
+              (count, median, percentile(costs, 0.99), per_station, per_station / base, requests_per_tick, sessions,
+               min(events), max(events), "OK" if ok else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
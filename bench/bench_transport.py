@@ -0,0 +1,196 @@
+# Host-side benchmark: the same events sent over the http transport (an HTTPS request per event) and the mqtt
+# transport (publishes on one persistent broker connection), against stand-ins for the server and the broker
+# that give the same answer ({"eventId": ..., "cmd": null}).
+# Bytes are what goes over the TLS connection: the request line and headers adafruit_requests sends, a typical
+# Spring Boot response (HTTP_RESPONSE_HEADERS, chunked body), and the MQTT PUBLISH packets both ways. The ICMP echo
+# that check_connection sends before every http post counts 2 x 64 bytes. TLS records and TCP/IP aren't counted.
+# Latency is modelled from the round trips each event waits for (ping, request/response, publish/reply) at RTT_MS,
+# plus the bytes at THROUGHPUT, plus the host time spent in the code. An http post further apart than the
+# server's keep-alive also pays a new TLS handshake (TLS_HANDSHAKE_*), shown as "cold".
+# Then checks a cmd the remote pushes arrives on the next poll, and that a reply later than mqtt_reply_timeout
+# still delivers its event id.
+# Exits 1 if an event costs more bytes over mqtt than over http or a pushed cmd or late reply is lost.
+# Run from the repo root: python bench/bench_transport.py
+import json
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from loop_harness import Harness  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.mqtt_functions import POLL_SECONDS  # noqa: E402
+from util.outbound_queue import OutboundQueue  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+RUNS = 50
+RTT_MS = 60
+THROUGHPUT = 50000  # bytes/s through TLS on the ESP32-S2
+TLS_HANDSHAKE_BYTES = 5000
+TLS_HANDSHAKE_RTTS = 2
+ICMP_ECHO_BYTES = 64
+HTTP_RESPONSE_HEADERS = ("HTTP/1.1 200 \r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n"
+                         "Date: Mon, 19 Oct 2026 12:00:00 GMT\r\nKeep-Alive: timeout=60\r\nConnection: keep-alive\r\n\r\n")
+
+
+def reply_for(action, station=None):
+    reply = {"eventId": "42", "cmd": None}
+    if action is not None:
+        reply["action"] = action
+    if station is not None:
+        reply["station"] = station
+    return json.dumps(reply)
+
+
+class Wire:
+    # Bytes and round trips seen by the stand-ins for one event
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.bytes = 0
+        self.round_trips = 0
+        self.one_way = 0
+
+    def ping(self, ip=None):
+        self.bytes += 2 * ICMP_ECHO_BYTES
+        self.round_trips += 1
+        return 0.01
+
+    def http(self, method, url, headers, data):
+        path = url.split("standin.local")[-1]
+        request = "%s %s HTTP/1.1\r\nHost: standin.local\r\nUser-Agent: Adafruit CircuitPython\r\n" % (method, path)
+        for key, value in (headers or {}).items():
+            request += "%s: %s\r\n" % (key, value)
+        if data is not None:
+            request += "Content-Length: %d\r\n" % len(data)
+        body = reply_for(None) if "/mission" in url else "{}"
+        self.bytes += len(request) + 2 + (0 if data is None else len(data))
+        self.bytes += len(HTTP_RESPONSE_HEADERS) + len("%x\r\n" % len(body)) + len(body) + len("\r\n0\r\n\r\n")
+        self.round_trips += 1
+        return hardware_stubs.Response(200, body)
+
+    def broker(self, client, topic, payload):
+        self.bytes += publish_size(topic, payload)
+        if not topic.endswith("-mission"):
+            self.one_way += 1
+            return []
+        self.round_trips += 1
+        sent = json.loads(payload)
+        cmd_topic = topic.replace("-mission", "-cmd")
+        reply = reply_for(sent["action"], sent.get("station"))
+        self.bytes += publish_size(cmd_topic, reply)
+        return [(cmd_topic, reply)]
+
+
+# MQTT 3.1.1 PUBLISH at QoS 0: fixed header, remaining length, topic length, topic, payload
+def publish_size(topic, payload):
+    remaining = 2 + len(topic.encode()) + len(payload.encode() if isinstance(payload, str) else payload)
+    length_bytes = 1
+    while remaining >= 128 ** length_bytes:
+        length_bytes += 1
+    return 1 + length_bytes + remaining
+
+
+def notifier_for(transport, wire):
+    debug = Debug()
+    debug.debug = False
+    properties = Properties(debug)
+    properties.config.transport = transport
+    # Without the status rate limit, every run goes over the wire
+    notifier = RemoteEventNotifier(properties, debug, outbound=OutboundQueue(debug, (None, None, None)))
+    while not notifier.http.bring_up_network():
+        pass
+    wire.clear()
+    return notifier
+
+
+def events(status):
+    chunk = json.dumps(["debug line %d: water level bottom True top False" % i for i in range(18)]).encode()
+    return (
+        ("status_handshake", lambda n: n.send_status_handshake("idle", status)),
+        ("ready_to_pump", lambda n: n.send_ready_to_pump("ready")),
+        ("pump_event", lambda n: n.pump_event("pumping", {"last_pump_elapsed_time": 45.2, "pump_event_count": 12})),
+        ("error", lambda n: n.http.send_error(n.http.error_body("sensor fault", "Top stuck wet"))),
+        ("debug chunk", lambda n: n.http.do_debug_post("a1b2c3d4", 0, {'Content-Type': 'application/json'},
+                                                       memoryview(chunk))),
+    )
+
+
+def measure(notifier, wire, send):
+    wire.clear()
+    start = time.perf_counter_ns()
+    for i in range(RUNS):
+        send(notifier)
+    host_ms = (time.perf_counter_ns() - start) / RUNS / 1e6
+    return wire.bytes / RUNS, wire.round_trips / RUNS, wire.one_way / RUNS, host_ms
+
+
+def latency_ms(size, round_trips, one_way, host_ms):
+    return (round_trips + one_way / 2) * RTT_MS + size * 1000 / THROUGHPUT + host_ms
+
+
+def check_push(wire):
+    # A cmd the remote sends on its own, e.g. a cancel while the station is idle
+    notifier = notifier_for("mqtt", wire)
+    mqtt = notifier.http
+    client = mqtt.io._client
+    client.deliver("pumpuser/feeds/" + mqtt.cmd_feed, json.dumps({"eventId": "43", "cmd": "canceled"}))
+    mqtt.poll()
+    pushed = notifier.take_pushed_cmd() == "canceled" and notifier.event_id == "43"
+
+    # A reply that misses mqtt_reply_timeout is kept until the station picks it up
+    notifier.properties.config.mqtt_reply_timeout = 0
+    hardware_stubs.MQTT.handler = lambda client, topic, payload: []
+    response = notifier.send_ready_to_pump("ready")
+    client.deliver("pumpuser/feeds/" + mqtt.cmd_feed, reply_for("ready_to_pump"))
+    mqtt.poll_timer.cancel_timer()
+    mqtt.poll()
+    late = response["status_code"] == 202 and notifier.take_pushed_cmd() is None and notifier.event_id == "42"
+    return pushed, late
+
+
+def main():
+    wire = Wire()
+    status = Harness().pumping.create_status_object()
+    sys.modules["wifi"].radio.ping = wire.ping
+    hardware_stubs.Session.handler = wire.http
+    hardware_stubs.MQTT.handler = wire.broker
+
+    http = notifier_for("http", wire)
+    mqtt = notifier_for("mqtt", wire)
+    print("%d runs per event, RTT %d ms, %d KB/s, latency = round trips x RTT + bytes / throughput + host time" %
+          (RUNS, RTT_MS, THROUGHPUT // 1000))
+    print("  %-17s %22s %31s %22s" % ("", "http warm", "http cold (new TLS session)", "mqtt"))
+    failed = False
+    total_http = 0
+    total_mqtt = 0
+    for name, send in events(status):
+        http_size, http_rtts, http_one_way, http_host = measure(http, wire, send)
+        mqtt_size, mqtt_rtts, mqtt_one_way, mqtt_host = measure(mqtt, wire, send)
+        warm = latency_ms(http_size, http_rtts, http_one_way, http_host)
+        cold = latency_ms(http_size + TLS_HANDSHAKE_BYTES, http_rtts + TLS_HANDSHAKE_RTTS, http_one_way, http_host)
+        over_mqtt = latency_ms(mqtt_size, mqtt_rtts, mqtt_one_way, mqtt_host)
+        ok = mqtt_size < http_size
+        failed = failed or not ok
+        total_http += http_size
+        total_mqtt += mqtt_size
+        print("  %-17s %6d B %6.0f ms %9d B %6.0f ms %14d B %6.0f ms  %s" %
+              (name, http_size, warm, http_size + TLS_HANDSHAKE_BYTES, cold, mqtt_size, over_mqtt,
+               "OK" if ok else "FAIL"))
+    print("  all events: mqtt sends %.0f%% of the http bytes" % (100 * total_mqtt / total_http))
+
+    pushed, late = check_push(wire)
+    failed = failed or not pushed or not late
+    print("  pushed cmd: http waits for the next status handshake (%d s on average), mqtt within %d s  %s" %
+          (http.properties.config.seconds_between_pumping_status_to_remote // 2, POLL_SECONDS + 1,
+           "OK" if pushed else "FAIL"))
+    print("  reply after mqtt_reply_timeout: event id delivered on the next poll  %s" % ("OK" if late else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
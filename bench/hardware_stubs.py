@@ -0,0 +1,379 @@
+# Minimal stand-ins for the CircuitPython modules the project imports, so the code in util/ and
+# pumping_controller.py can be exercised on a host. Only what the benches touch is modelled.
+# Usage (before importing project modules):
+#     import hardware_stubs
+#     hardware_stubs.install()
+import os
+import sys
+import time
+import types
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "board." + self.name
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = False
+        self.direction = None
+        self.pull = None
+
+    def switch_to_input(self, pull=None):
+        self.pull = pull
+
+    def switch_to_output(self, value=False):
+        self.value = value
+
+
+class AnalogIn:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = 30000
+        self.reference_voltage = 3.3
+
+
+class Radio:
+    def __init__(self):
+        self.enabled = True
+        self.ipv4_address = "192.168.1.50"
+        self.ipv4_subnet = "255.255.255.0"
+        self.ipv4_gateway = "192.168.1.1"
+        self.ipv4_dns = "192.168.1.1"
+        self.ap_info = types.SimpleNamespace(bssid=b"\x02\x11\x22\x33\x44\x55", channel=6, rssi=-60)
+        self.dhcp = True
+        self.connect_count = 0
+        self.stop_count = 0
+        self.connect_error = None
+        self.ping_result = 0.01
+
+    def connect(self, ssid, password, **kwargs):
+        self.connect_count += 1
+        if self.connect_error is not None:
+            raise self.connect_error
+
+    def set_ipv4_address(self, ipv4=None, netmask=None, gateway=None, ipv4_dns=None):
+        self.dhcp = False
+        self.ipv4_address = ipv4
+
+    def start_dhcp(self):
+        self.dhcp = True
+
+    def stop_station(self):
+        self.stop_count += 1
+
+    def ping(self, ip=None):
+        return self.ping_result
+
+
+class Socket:
+    # socketpool socket. A listener's clients come from SocketPool.connect(), the bench writes the request into
+    # inbound and reads the response from outbound. send() takes at most send_window bytes per call.
+    def __init__(self, pool):
+        self.pool = pool
+        self.backlog = []
+        self.blocking = True
+        self.closed = False
+        self.peer_closed = False
+        self.inbound = bytearray()
+        self.outbound = bytearray()
+        self.send_window = 1 << 16
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def bind(self, address):
+        self.address = address
+
+    def listen(self, backlog):
+        self.pool.listeners[self.address[1]] = self
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def accept(self):
+        if not self.backlog:
+            raise OSError(11)
+        return self.backlog.pop(0), ("192.168.1.10", 50000)
+
+    def recv_into(self, buffer):
+        if not self.inbound:
+            if self.peer_closed:
+                return 0
+            raise OSError(11)
+        count = min(len(buffer), len(self.inbound))
+        buffer[:count] = self.inbound[:count]
+        del self.inbound[:count]
+        return count
+
+    def send(self, data):
+        count = min(len(data), self.send_window)
+        self.outbound += data[:count]
+        return count
+
+    def close(self):
+        self.closed = True
+
+
+class SocketPool:
+    AF_INET = 2
+    SOCK_STREAM = 1
+    SOL_SOCKET = 1
+    SO_REUSEADDR = 2
+
+    resolver = None  # Replaced per bench, a stand-in resolver(host, port) for getaddrinfo
+
+    def __init__(self, radio):
+        self.radio = radio
+        self.listeners = {}
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if SocketPool.resolver is not None:
+            return SocketPool.resolver(host, port)
+        return [(self.AF_INET, self.SOCK_STREAM, 0, "", ("192.168.1.10", port))]
+
+    def socket(self, family=AF_INET, type=SOCK_STREAM):
+        return Socket(self)
+
+    # A client connecting to port, returns the server side of the connection
+    def connect(self, port):
+        client = Socket(self)
+        self.listeners[port].backlog.append(client)
+        return client
+
+
+class Session:
+    # Replaced per bench, requests to a stand-in backend go through handler(method, url, headers, data)
+    handler = None
+    timeout = None  # Of the last request, for a handler that models slow answers
+
+    def __init__(self, pool, ssl_context=None):
+        self.pool = pool
+
+    # Like adafruit_requests, every request opens its socket to the address getaddrinfo gives for the host
+    def resolve(self, url):
+        self.pool.getaddrinfo(url.split("/")[2], 443 if url.startswith("https") else 80, 0, SocketPool.SOCK_STREAM)
+
+    def post(self, url, headers=None, data=None, **kwargs):
+        Session.timeout = kwargs.get("timeout")
+        self.resolve(url)
+        return Session.handler("POST", url, headers, data)
+
+    def get(self, url, headers=None, **kwargs):
+        self.resolve(url)
+        return Session.handler("GET", url, headers, None)
+
+
+class Response:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+def ok_handler(method, url, headers, data):
+    return Response(200, "{}")
+
+
+class MQTT:
+    # adafruit_minimqtt.adafruit_minimqtt.MQTT in front of a stand-in broker. Every publish goes to
+    # handler(client, topic, payload), which returns the messages the broker sends back as [(topic, payload)].
+    # Those on a subscribed topic are handed to on_message on the next loop().
+    handler = None
+
+    def __init__(self, broker=None, port=None, username=None, password=None, socket_pool=None, ssl_context=None,
+                 **kwargs):
+        self.broker = broker
+        self.port = port
+        self.user = username
+        self.on_message = None
+        self.subscriptions = set()
+        self.inbox = []
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def subscribe(self, topic):
+        self.subscriptions.add(topic)
+
+    def publish(self, topic, msg):
+        if not self.connected:
+            raise OSError("not connected")
+        for message in MQTT.handler(self, topic, msg) if MQTT.handler is not None else []:
+            self.deliver(*message)
+
+    # A message from the broker, received on the next loop()
+    def deliver(self, topic, payload):
+        if topic in self.subscriptions:
+            self.inbox.append((topic, payload))
+
+    def loop(self, timeout=0):
+        inbox = self.inbox
+        self.inbox = []
+        for topic, payload in inbox:
+            self.on_message(self, topic, payload)
+
+
+class IO_MQTT:
+    # adafruit_io.adafruit_io.IO_MQTT, feeds are <user>/feeds/<feed_key> and on_message gets the feed key
+    def __init__(self, client):
+        self._client = client
+        self._user = client.user
+        self.on_message = None
+        client.on_message = self._on_message_mqtt
+
+    def _on_message_mqtt(self, client, topic, payload):
+        self.on_message(self, topic.split("/")[2], payload)
+
+    def connect(self):
+        self._client.connect()
+
+    def disconnect(self):
+        self._client.disconnect()
+
+    def subscribe(self, feed_key):
+        self._client.subscribe("{0}/feeds/{1}".format(self._user, feed_key))
+
+    def publish(self, feed_key, data):
+        self._client.publish("{0}/feeds/{1}".format(self._user, feed_key), data)
+
+    def loop(self, timeout=1):
+        self._client.loop(timeout)
+
+
+class Display:
+    width = 240
+    height = 135
+
+    def __init__(self, *args, **kwargs):
+        self.root_group = None
+
+    def show(self, group):
+        self.root_group = group
+
+
+class Group(list):
+    created = 0  # Screen objects built so far, Groups and Widgets
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        Group.created += 1
+
+
+class Widget:
+    def __init__(self, *args, **kwargs):
+        Group.created += 1
+        self.kwargs = kwargs
+        self.text = kwargs.get("text")
+
+    def __setitem__(self, key, value):
+        pass
+
+
+class BME280:
+    # adafruit_bme280.advanced.Adafruit_BME280_I2C. The readings come from reading(quantity), replaced per bench.
+    # I2C traffic is counted the way the driver reads: 3 bytes for the temperature, humidity and pressure read the
+    # temperature again first (for the compensation).
+    reading = None
+    i2c_reads = 0
+    i2c_bytes = 0
+
+    def __init__(self, i2c, address=0x77):
+        self.address = address
+        self.mode = 0
+
+    def read(self, count, quantity):
+        BME280.i2c_reads += 1
+        BME280.i2c_bytes += count
+        if BME280.reading is not None:
+            return BME280.reading(quantity)
+        return {"temperature": 24.5, "humidity": 45.0, "pressure": 1013.2}[quantity]
+
+    @property
+    def temperature(self):
+        return self.read(3, "temperature")
+
+    @property
+    def relative_humidity(self):
+        self.read(3, "temperature")
+        return self.read(2, "humidity")
+
+    @property
+    def pressure(self):
+        self.read(3, "temperature")
+        return self.read(3, "pressure")
+
+
+class Microcontroller:
+    reset_count = 0
+
+    @staticmethod
+    def reset():
+        Microcontroller.reset_count += 1
+
+
+def module(name, **attrs):
+    mod = types.ModuleType(name)
+    for key, value in attrs.items():
+        setattr(mod, key, value)
+    sys.modules[name] = mod
+    return mod
+
+
+def install(no_sleep=True):
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    board = module("board", pin=Pin, LED=Pin("LED"), DISPLAY=None, I2C=lambda: None)
+    for name in ["D0", "D1", "D2", "D5", "D6", "D9", "D10", "D11", "D12", "D13", "A0", "A1", "A2", "A3"]:
+        setattr(board, name, Pin(name))
+
+    module("digitalio", DigitalInOut=DigitalInOut,
+           Direction=types.SimpleNamespace(INPUT="input", OUTPUT="output"),
+           Pull=types.SimpleNamespace(UP="up", DOWN="down"))
+    module("analogio", AnalogIn=AnalogIn)
+    module("microcontroller", reset=Microcontroller.reset)
+    module("supervisor", runtime=types.SimpleNamespace(serial_bytes_available=0))
+    module("wifi", radio=Radio())
+    module("socketpool", SocketPool=SocketPool)
+    Session.handler = ok_handler
+    module("adafruit_requests", Session=Session)
+    module("ssl", create_default_context=lambda: None)
+    minimqtt = module("adafruit_minimqtt.adafruit_minimqtt", MQTT=MQTT)
+    module("adafruit_minimqtt", adafruit_minimqtt=minimqtt)
+    adafruit_io = module("adafruit_io.adafruit_io", IO_MQTT=IO_MQTT)
+    module("adafruit_io", adafruit_io=adafruit_io)
+    bme280 = module("adafruit_bme280.advanced", Adafruit_BME280_I2C=BME280, OVERSCAN_X16=5, IIR_FILTER_X16=4,
+                    STANDBY_TC_1000=5, MODE_NORMAL=3)
+    module("adafruit_bme280", advanced=bme280)
+
+    board.DISPLAY = Display()
+    module("displayio", Group=Group, Bitmap=Widget, Palette=Widget, TileGrid=Widget, I2CDisplay=Widget,
+           release_displays=lambda: None)
+    module("terminalio", FONT=None)
+    label = module("adafruit_display_text.label", Label=Widget)
+    module("adafruit_display_text", label=label)
+    bitmap_font = module("adafruit_bitmap_font.bitmap_font", load_font=lambda path: None)
+    module("adafruit_bitmap_font", bitmap_font=bitmap_font)
+    module("adafruit_displayio_sh1107", SH1107=Display)
+
+    # settings.toml values on the board
+    os.environ.setdefault("REMOTE_URL", "http://standin.local")
+    os.environ.setdefault("PING_IP", "127.0.0.1")
+    os.environ.setdefault("CIRCUITPY_WIFI_SSID", "ssid")
+    os.environ.setdefault("CIRCUITPY_WIFI_PASSWORD", "password")
+    os.environ.setdefault("ADAFRUIT_AIO_USERNAME", "pumpuser")
+    os.environ.setdefault("ADAFRUIT_AIO_KEY", "aio_key")
+
+    if no_sleep:
+        time.sleep = lambda seconds: None
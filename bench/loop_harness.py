@@ -0,0 +1,147 @@
+# Builds the real controller objects on top of hardware_stubs and steps a copy of the code.py main loop body,
+# with the float switches driven by a fill/pump cycle. Used by the host benches.
+import json
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+import board  # noqa: E402
+
+from pumping_controller import PumpingController  # noqa: E402
+from util.debug import Debug  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.pump_motor_controller import PumpMotorController  # noqa: E402
+from util.pumping_display import PumpingDisplay  # noqa: E402
+from util.simple_timer import Timer  # noqa: E402
+from util.tick_profiler import TickProfiler  # noqa: E402
+from util.water_level import WaterLevelReader  # noqa: E402
+
+# Ticks in one simulated fill/pump cycle and when each float trips
+CYCLE_TICKS = 120
+BOTTOM_WET_AT = 40
+TOP_WET_AT = 90
+
+
+class Backend:
+    # Stand-in for the Spring Boot server, records every request body by path.
+    # A mission post whose idempotencyKey is among the last DEDUPE_WINDOW ones is a repeat: it gets the first
+    # answer again and isn't recorded.
+    DEDUPE_WINDOW = 256
+
+    def __init__(self):
+        self.requests = []
+        self.bytes_by_path = {}
+        self.answers = {}  # idempotencyKey -> answer, the last DEDUPE_WINDOW in insertion order
+        self.duplicates = 0
+
+    def __call__(self, method, url, headers, data):
+        path = url.split("?")[0].split("/component/")[-1]
+        key = idempotency_key(data) if path.startswith("mission") else None
+        if key is not None and key in self.answers:
+            self.duplicates += 1
+            return hardware_stubs.Response(200, self.answers[key])
+        size = 0 if data is None else len(data)
+        self.requests.append((method, path, data))
+        self.bytes_by_path[path] = self.bytes_by_path.get(path, 0) + size
+        answer = self.answer(path, data)
+        if key is not None:
+            self.answers[key] = answer
+            if len(self.answers) > self.DEDUPE_WINDOW:
+                del self.answers[next(iter(self.answers))]
+        return hardware_stubs.Response(200, answer)
+
+    def answer(self, path, data):
+        return json.dumps({"eventId": "42"})
+
+
+def idempotency_key(data):
+    try:
+        return json.loads(data).get("idempotencyKey")
+    except (TypeError, ValueError):
+        return None
+
+
+class Harness:
+    def __init__(self, remote_debug=False, memory=None):
+        self.backend = Backend()
+        hardware_stubs.Session.handler = self.backend
+        self.debug = Debug()
+        self.debug.debug = False
+        self.debug.toggle_remote_debug(remote_debug)
+        self.properties = Properties(self.debug)
+        self.display = PumpingDisplay(self.debug, self.properties)
+        self.pump = PumpMotorController(board.D12, self.debug)
+        self.readers = [WaterLevelReader("Bottom", self.properties, board.D5, board.D5, self.debug),
+                        WaterLevelReader("Top", self.properties, board.D6, board.D6, self.debug)]
+        self.memory = memory
+        self.profiler = TickProfiler(memory=memory)
+        self.pumping = PumpingController(self.display, self.properties, board.LED, self.pump, self.readers,
+                                         self.debug, self.profiler)
+        # The simulated cycle is counted in ticks, the overrun after the bottom float was a no-op sleep here before
+        self.pumping.pump_overrun_seconds = 0
+        while not self.pumping.remote_notifier.http.bring_up_network():
+            pass
+        self.environment = None  # EnvironmentSensor, ticked like code.py when set
+        self.display_timer = Timer()
+        self.loop_count = 0
+        self.program_start_time = 0
+        self.pump_start_time = None
+
+    def drive_floats(self):
+        phase = self.loop_count % CYCLE_TICKS
+        bottom = self.readers[0].water_level_sensor
+        top = self.readers[1].water_level_sensor
+        if self.pump.running:
+            # Pump drains the reservoir: top goes dry right away, bottom a few ticks later
+            top.value = False
+            bottom.value = phase < TOP_WET_AT + 10
+        else:
+            bottom.value = phase >= BOTTOM_WET_AT
+            top.value = phase >= TOP_WET_AT
+
+    # One pass of the code.py main loop body (minus buttons and sleep)
+    def tick(self):
+        profiler = self.profiler
+        profiler.begin_tick()
+        self.loop_count += 1
+        self.drive_floats()
+        pumping = self.pumping
+        profiler.mark("debug_check")
+        if self.loop_count % 5 == 0:
+            pumping.remote_notifier.send_debug_logs_to_remote(self.pump.running)
+        profiler.mark("log_flush")
+
+        pumping.check_water_level_state()
+        profiler.mark("check_state")
+
+        if pumping.last_pump_state != pumping.pump_state or self.display_timer.start_time is None or \
+                self.display_timer.is_timed_out():
+            self.display.display_status("192.168.1.50", pumping.pump_state, pumping.remote_notifier,
+                                        self.program_start_time, self.pump_start_time, pumping.fusion)
+            self.display_timer.start_timer(self.properties.config.display_interval)
+        profiler.mark("display")
+
+        pumping.remote_notifier.http.poll()
+        if pumping.notify_remote():
+            self.display.display_status("192.168.1.50", pumping.pump_state, pumping.remote_notifier,
+                                        self.program_start_time, self.pump_start_time, pumping.fusion)
+        pumping.remote_notifier.send_errors()
+        profiler.mark("notify")
+
+        if not pumping.remote_notifier.http.last_http_status_success():
+            pumping.remote_notifier.http.ping_default()
+        profiler.mark("ping")
+
+        pumping.remote_notifier.http.radio_power.tick(pumping.pump_state != pumping.IDLE or
+                                                      not pumping.remote_notifier.quiet())
+        profiler.mark("radio")
+
+        if self.environment is not None:
+            self.environment.tick(self.pump.running)
+        profiler.mark("env")
+
+        if self.memory is not None:
+            self.memory.collect_if_idle(self.pump.running)
+        profiler.mark("gc")
+        profiler.end_tick()
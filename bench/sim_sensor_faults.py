@@ -0,0 +1,129 @@
+# Host-side fault injection for SensorFusion.
+# The reservoir fills at a noisy inflow and the pump runs on the controller's rule (start when the top reads wet,
+# stop when the bottom reads dry) using the fused readings. After WARMUP_CYCLES one float is stuck on or off.
+# Reports, per scenario, the seconds until the fault is flagged and the fault named, the pump cycles completed
+# after it, the highest volume reached (overflow above OVERFLOW) and the seconds the pump ran dry.
+# Exits 1 if a fault is missed, misnamed, the reservoir overflows or the pump keeps running dry.
+# Run from the repo root: python bench/sim_sensor_faults.py
+import random
+import sys
+import time
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from util.fill_rate_model import FillRateModel  # noqa: E402
+from util.sensor_fusion import SensorFusion  # noqa: E402
+
+TICK = 1.0  # Seconds between checks
+INFLOW = 2.0  # Volume per second, +-20% per cycle
+PUMP = 7.0
+BOTTOM_AT = 20.0
+TOP_AT = 120.0
+OVERFLOW = 180.0
+WARMUP_CYCLES = 8
+CYCLES_AFTER = 10
+MAX_DRY_RUN = 60  # Seconds of pumping below the bottom float tolerated over the whole run
+SCENARIOS = (("healthy", None, None), ("bottom stuck_off", 0, False), ("bottom stuck_on", 0, True),
+             ("top stuck_off", 1, False), ("top stuck_on", 1, True))
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 0.0
+
+    def monotonic(self):
+        return self.seconds
+
+    def monotonic_ns(self):
+        return int(self.seconds * 1e9)
+
+
+class Float:
+    # Water level reader stand-in, reads the simulated volume unless stuck
+    def __init__(self, name, level, tank):
+        self.name = name
+        self.level = level
+        self.tank = tank
+        self.stuck = None
+
+    def water_present(self):
+        if self.stuck is not None:
+            return self.stuck
+        return self.tank.volume >= self.level
+
+
+class Tank:
+    def __init__(self):
+        self.volume = 0.0
+
+
+def run(sensor, stuck):
+    clock = Clock()
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    rnd = random.Random(5)
+    tank = Tank()
+    readers = [Float("Bottom", BOTTOM_AT, tank), Float("Top", TOP_AT, tank)]
+    model = FillRateModel()
+    fusion = SensorFusion(readers, model)
+    pumping = False
+    cycles = 0
+    cycles_after = 0
+    injected_at = None
+    detected_after = None
+    detected = None
+    peak = 0.0
+    dry_run = 0.0
+    inflow = INFLOW
+    while cycles_after < CYCLES_AFTER and clock.seconds < 20000:
+        clock.seconds += TICK
+        tank.volume = max(0.0, tank.volume + (inflow - (PUMP if pumping else 0)) * TICK)
+        peak = max(peak, tank.volume) if injected_at is not None else peak
+        if pumping and tank.volume < BOTTOM_AT:
+            dry_run += TICK
+        bottom, top = fusion.read(pumping)
+        if fusion.all_healthy():
+            model.observe(bottom, top, pumping, int(clock.seconds * 1000))
+        if fusion.fault_changed:
+            fusion.fault_changed = False
+            if detected_after is None and fusion.faults():
+                detected_after = clock.seconds - injected_at if injected_at is not None else -1
+                detected = fusion.faults()
+        if not pumping and top:
+            pumping = True
+        elif pumping and not bottom:
+            pumping = False
+            cycles += 1
+            inflow = INFLOW * rnd.uniform(0.8, 1.2)
+            if injected_at is not None:
+                cycles_after += 1
+            elif cycles == WARMUP_CYCLES:
+                injected_at = clock.seconds
+                if sensor is not None:
+                    readers[sensor].stuck = stuck
+    return detected_after, detected, cycles_after, peak, dry_run, clock.seconds - injected_at
+
+
+def main():
+    print("fill %.0f s, drain %.0f s, %d warm-up cycles then %d cycles with the fault" %
+          ((TOP_AT - BOTTOM_AT) / INFLOW, (TOP_AT - BOTTOM_AT) / (PUMP - INFLOW), WARMUP_CYCLES, CYCLES_AFTER))
+    failed = False
+    for name, sensor, stuck in SCENARIOS:
+        detected_after, detected, cycles_after, peak, dry_run, seconds = run(sensor, stuck)
+        expected = None if sensor is None else ("Bottom", "Top")[sensor] + (" stuck_on" if stuck else " stuck_off")
+        ok = cycles_after >= CYCLES_AFTER and peak < OVERFLOW and dry_run <= MAX_DRY_RUN
+        if expected is None:
+            ok = ok and detected is None
+        else:
+            ok = ok and detected == [expected]
+        failed = failed or not ok
+        print("  %-16s detected %-20s after %6s s, %2d cycles in %5.0f s, peak volume %5.1f, dry run %3.0f s  %s" %
+              (name, detected, "-" if detected_after is None else "%.0f" % detected_after, cycles_after, seconds,
+               peak, dry_run, "OK" if ok else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
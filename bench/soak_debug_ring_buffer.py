@@ -0,0 +1,90 @@
+# Host-side soak test: remote debug on, link down for a long time.
+# Memory held by the debug pipeline must stay flat, and buffered lines must only be freed once a post succeeds.
+# Posts fail with OSError, so this takes a while on a host. Run from the repo root: python bench/soak_debug_ring_buffer.py
+import gc
+import tracemalloc
+
+import hardware_stubs
+
+hardware_stubs.install()
+
+from util.debug import Debug, REMOTE_BUFFER_BYTES  # noqa: E402
+from util.properties import Properties  # noqa: E402
+from util.remote_event_notifier import RemoteEventNotifier  # noqa: E402
+
+OUTAGE_TICKS = 5000
+
+
+def failing_handler(method, url, headers, data):
+    raise OSError("link down")
+
+
+def posted_handler(posted):
+    def handler(method, url, headers, data):
+        if "/component/debug" in url:
+            posted.append(data)
+        return hardware_stubs.Response(200, "{}")
+    return handler
+
+
+def tick(debug, n):
+    debug.print_debug("controller", "check_state: pump_state[%s], last_pump_state[%s]", "idle", "idle")
+    debug.print_debug("display", "pump_state %s levels %s - %s", "idle", "T dry", "B dry")
+    debug.print_info("pump", "Pump OFF")
+    debug.print_debug("code", "tick %d", n)
+
+
+def main():
+    debug = Debug()
+    debug.debug = False
+    debug.toggle_remote_debug(True)
+    properties = Properties(debug)
+    notifier = RemoteEventNotifier(properties, debug)
+
+    # Session is only created once the link came up, like after do_hello on the board
+    notifier.http.check_connection()
+    hardware_stubs.Session.handler = failing_handler
+    # Warm up first, CPython's traceback/linecache caches fill on the first failures (not a board concern)
+    for n in range(500):
+        tick(debug, n)
+        if n % 5 == 0:
+            notifier.send_debug_logs_to_remote()
+    gc.collect()
+
+    samples = [0] * 10
+    tracemalloc.start()
+    for n in range(OUTAGE_TICKS):
+        tick(debug, n)
+        if n % 5 == 0:
+            notifier.send_debug_logs_to_remote()
+        if n % (OUTAGE_TICKS // 10) == 0:
+            # Failed posts leave exception/frame cycles behind, measure what is still live
+            gc.collect()
+            samples[n // (OUTAGE_TICKS // 10)] = tracemalloc.get_traced_memory()[0]
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pending = len(debug.remote_lines)
+    print("outage: %d ticks, %d lines pending, %d dropped, buffer %d/%d bytes" %
+          (OUTAGE_TICKS, pending, debug.get_remote_dropped_count(), debug.remote_lines.used, REMOTE_BUFFER_BYTES))
+    print("  dropped by category: %s" % debug.get_remote_dropped_counts())
+    print("  traced heap samples (bytes): %s" % samples)
+    print("  traced heap at end %d, peak %d" % (current, peak))
+    # The first samples still include host interpreter caches settling, judge the second half of the outage
+    growth = samples[-1] - samples[len(samples) // 2]
+    print("  growth over the second half of the outage: %d bytes" % growth)
+    assert debug.remote_lines.used <= REMOTE_BUFFER_BYTES
+    assert growth < 4096, "debug pipeline memory grew during the outage"
+    assert pending > 0, "lines were freed although every post failed"
+
+    posted = []
+    hardware_stubs.Session.handler = posted_handler(posted)
+    notifier.send_debug_logs_to_remote()
+    print("link back: posted %d bytes, %d lines still pending (logged during the post)" %
+          (sum(len(p) for p in posted), len(debug.remote_lines)))
+    assert len(debug.remote_lines) < pending
+
+
+if __name__ == "__main__":
+    main()
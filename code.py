@@ -1,73 +1,196 @@
-import os
 import time
+
+# time.monotonic() counts from power on, so this also covers the time spent before code.py started
+boot_start_time = time.monotonic()
+boot_timings = {}  # ms per boot phase, sent with the startup notification
+boot_phase_start = boot_start_time
+
+
+def boot_phase_done(name):
+    global boot_phase_start
+    now = time.monotonic()
+    boot_timings[name] = int((now - boot_phase_start) * 1000)
+    boot_phase_start = now
+
+
+import gc
+import os
 from traceback import format_exception
 
 import board
+import supervisor
 
-from pumping_controller import PumpingController
+from stations import StationScheduler, build_stations
 from util.button import Button
-from util.debug import Debug
+from util.config_watcher import ConfigWatcher
+from util.debug import Debug, DEBUG_FLAG_FILE
+from util.memory_monitor import MemoryMonitor
 from util.properties import Properties
-from util.pump_motor_controller import PumpMotorController
 from util.simple_timer import Timer
-from util.water_level import WaterLevelReader
+from util.tick_profiler import TickProfiler
+from util.time_series_log import TimeSeriesLog
 
+# The feature modules the pump doesn't need are imported when they are used, never before the first float check:
+# the metrics server and the environment sensor after it when their config turns them on (start_features), the
+# serial console with the first byte typed, the mqtt transport only by a board on mqtt (RemoteEventNotifier)
 have_sent_startup_notification = False
 startup_notification_timer = None
+network_ready = False
+boot_phase_done("imports")
 
 debug = Debug()
-debug.print_debug("code","CircuitPython version " + str(os.uname().version))
-debug.check_debug_enable()
+debug.print_info("code","CircuitPython version %s", os.uname().version)
 
 properties = Properties(debug)
+boot_phase_done("properties")
+
 
-if properties.defaults["display_type"].lower() in ["i2c"]:
+def secrets_changed(path, exists):
+    # Hot reload, the controller picks up new values through its properties listener
+    if exists:
+        properties.reload()
+        config_watcher.interval = properties.config.config_check_interval
+
+
+# Checks the debug flag file and secrets.json with os.stat at most every config_check_interval seconds
+config_watcher = ConfigWatcher(properties.config.config_check_interval)
+config_watcher.watch(DEBUG_FLAG_FILE, lambda path, exists: debug.set_debug_enabled(exists))
+config_watcher.watch("secrets.json", secrets_changed)
+
+if properties.config.display_type.lower() in ["i2c"]:
     from util.pumping_display import PumpingDisplay_i2c
     display = PumpingDisplay_i2c(debug, properties)
 else:
     from util.pumping_display import PumpingDisplay
     display = PumpingDisplay(debug, properties)
+boot_phase_done("display")
 
 buttons = Button([board.D0, board.D1, board.D2])
 # buttons = Button([board.D10, board.D6, board.D9])
 
-# Create the pump control object (turns pump on/off)                                    78
-# Can be any GPIO pin, match accordingly
-pump = PumpMotorController(board.D12, debug)
+# Times each phase of the main loop and tracks what it allocates, read out with the "profile" and "memory"
+# serial commands and in the status object
+memory = MemoryMonitor()
+profiler = TickProfiler(memory=memory)
+profiler.set_boot_timings(boot_timings)
 
-# Create the two water sensor controllers, (bottom, and top)
-# Needs all the A pins, match bottom, middle, top sensors accord
-if properties.defaults["wiring_option"] is None or properties.defaults["wiring_option"].lower() in ['2','t','test']:
-    water_level_readers = [WaterLevelReader("Bottom", properties, board.D9, board.D6, debug),  # Bottom sensor
-                           WaterLevelReader("Top", properties, board.D10, board.D10, debug)]  # Top sensor
-else:
-    water_level_readers = [WaterLevelReader("Bottom", properties, board.D5, board.D5, debug),  # Bottom sensor
-                           WaterLevelReader("Top", properties, board.D6, board.D6, debug)]  # Top sensor
+# One pumping controller per station (pump, its water level sensors bottom to top), declared in secrets.json
+# "stations" or the single wiring_option station. They share the connection and are stepped in one scheduler.
+# Levels, pump runs and HTTP outcomes, kept on flash across reboots when CIRCUITPY is writable for the code
+history = TimeSeriesLog(flush_seconds=properties.config.history_flush_seconds)
+scheduler = StationScheduler(build_stations(properties, display, debug, profiler, history), debug)
+environment = None  # Enclosure temperature, humidity and pressure (BME280), see start_features
+metrics = None
+console = None
+# The first station is on the display and the buttons
+pumping = scheduler.primary
+pump = pumping.pump
+
+
+def profile_command(args):
+    if args and args[0] == "reset":
+        profiler.reset()
+        return "profile reset"
+    return profiler.format_table()
+
+
+def memory_command(args):
+    if args and args[0] == "reset":
+        memory.reset()
+        return "memory reset"
+    return memory.format_table()
+
+
+def history_command(args):
+    hours = 24
+    if args:
+        try:
+            hours = int(args[0])
+        except ValueError:
+            return "history [hours]"
+    return history.format_table(hours)
+
+
+# Created when the first byte arrives on the USB serial console
+def create_console():
+    from util.serial_console import SerialConsole
+    serial_console = SerialConsole()
+    serial_console.register("profile", profile_command, "[reset]")
+    serial_console.register("memory", memory_command, "[reset]")
+    serial_console.register("history", history_command, "[hours]")
+    return serial_console
+
+
+# Called once, right after the first float check
+def start_features():
+    global environment, metrics
+    # Enclosure temperature, humidity and pressure (BME280), summed up in the status object. 0 leaves the sensor alone.
+    if properties.config.env_sample_seconds > 0:
+        from util.environment_sensor import QUANTITIES, EnvironmentSensor
+        environment = EnvironmentSensor(properties, debug)
+        scheduler.attach_environment(environment)
+
+    # Scraped from the board at http://<ip>:<metrics_port>/metrics (and /metrics.json) once Wi-Fi is up, 0 is off
+    if properties.config.metrics_port == 0:
+        return
+    from util.metrics_server import MetricsServer
+    metrics = MetricsServer(debug, properties.config.metrics_port)
+    scheduler.register_metrics(metrics)
+    metrics.register("pump_uptime_seconds", "Seconds since power on", "gauge", lambda: int(time.monotonic()))
+    metrics.register("pump_tick_phase_ms", "Main loop phase time over the last ticks", "summary",
+                     profiler.metric_values)
+    if memory.enabled():
+        metrics.register("pump_heap_free_bytes", "Free heap", "gauge", gc.mem_free)
+        metrics.register("pump_heap_min_free_bytes", "Lowest free heap seen by the loop", "gauge",
+                         lambda: memory.min_free)
+        metrics.register("pump_gc_unplanned_total", "Collections the VM ran on its own", "counter",
+                         lambda: memory.unplanned_collects)
+    if environment is not None and environment.enabled():
+        metrics.register("pump_env_temperature_celsius", "Enclosure temperature, last reading", "gauge",
+                         lambda: environment.last(QUANTITIES.index("temperature")))
+        metrics.register("pump_env_humidity_percent", "Enclosure relative humidity, last reading", "gauge",
+                         lambda: environment.last(QUANTITIES.index("humidity")))
+        metrics.register("pump_env_pressure_hpa", "Air pressure, last reading", "gauge",
+                         lambda: environment.last(QUANTITIES.index("pressure")))
+    metrics.register("pump_metrics_scrape_microseconds", "Time to render the previous scrape", "gauge",
+                     lambda: metrics.last_scrape_us)
 
-# Create the pumping controller
-pumping = PumpingController(display, properties, board.LED, pump, water_level_readers, debug)
 
 pump_start_time = None
 pumping_state = "Not Started"
 loop_count = 0
 
 program_start_time = time.monotonic()
-
-hello_response = pumping.remote_notifier.http.do_hello()
-if not pumping.remote_notifier.http.success(hello_response):
-    if isinstance(hello_response, dict):
-        debug.print_debug("code","hello error  " + hello_response["text"])
+boot_phase_done("hardware")
 
 display_timer = Timer()
+ERROR_DISPLAY_SECONDS = 10
+error_display_timer = Timer()  # Keeps an exception from the main loop on the display, the loop carries on meanwhile
+
+
+# The pause at the end of every loop, from sleep_time kept between 0.2 and 5 s
+def loop_sleep_time():
+    sleep_time = properties.config.sleep_time
+    if sleep_time <1:
+        sleep_time = .2
+    elif sleep_time > 5:
+        sleep_time = 5
+    return sleep_time
+
 
 while True:
+    profiler.begin_tick()
     if not have_sent_startup_notification:
         # Only send startup notification once
         # This will keep attempting the notification every 30 seconds until successful
         if pumping.remote_notifier.http.last_http_status_success():
             if startup_notification_timer is None or startup_notification_timer.is_timed_out():
                 display.display_remote("startup notification")
-                response = pumping.remote_notifier.send_startup_notification(properties.defaults)
+                startup_status = dict(properties.defaults)
+                startup_status["boot_timings"] = boot_timings
+                if len(scheduler.stations) > 1:
+                    startup_status["stations"] = scheduler.summary()
+                response = pumping.remote_notifier.send_startup_notification(startup_status)
                 if pumping.remote_notifier.http.success(response):
                     have_sent_startup_notification = True
                 else:
@@ -76,6 +199,7 @@ while True:
                     startup_notification_timer.start_timer(30)
         else:
             debug.print_debug("code", "Didn't sent startup remote notification due to http error")
+    profiler.mark("startup")
 
     this_address = pumping.remote_notifier.http.ip_address
     button_value = buttons.button_pushed()
@@ -94,7 +218,9 @@ while True:
             pump_timer.start_timer(30) # Will run pump max of 30 seconds (or when empty)
             pump.pump_on()
             while True:
-                if not water_level_readers[0].water_present() and not water_level_readers[1].water_present():
+                # Fused like the state machine's, a faulty float is replaced by its estimate
+                bottom_has_water, top_has_water = pumping.fusion.peek()
+                if not bottom_has_water and not top_has_water:
                     break
                 if pump_timer.is_timed_out():
                     break
@@ -109,51 +235,110 @@ while True:
             display.display_messages(["remote-debug "+str(debug.remote_set),"debug "+str(debug.debug)])
             time.sleep(5)
         display.display_status(this_address, pumping.pump_state, pumping.remote_notifier,
-                               program_start_time, pump_start_time, water_level_readers)
+                               program_start_time, pump_start_time, pumping.fusion)
+    profiler.mark("buttons")
 
     loop_count += 1
-    debug.check_debug_enable()
+    if console is None and supervisor.runtime.serial_bytes_available:
+        console = create_console()
+    if console is not None:
+        console.poll()
+    config_watcher.check()
+    profiler.mark("debug_check")
     try:
         if loop_count % 5 is 0:
-            pumping.remote_notifier.send_debug_logs_to_remote()
+            # Bulk traffic, held back while a pump runs (see OutboundQueue)
+            pumping.remote_notifier.send_debug_logs_to_remote(scheduler.any_pump_running())
+        profiler.mark("log_flush")
+
+        scheduler.check_all()
+        profiler.mark("check_state")
+        if "first_check" not in boot_timings:
+            # Time from power on until the floats were read and the pump state decided
+            boot_timings["first_check"] = int((time.monotonic() - boot_start_time) * 1000)
+            boot_phase_start = time.monotonic()
+            start_features()
+            boot_phase_done("features")
 
-        pumping.check_water_level_state()
+        if not network_ready:
+            # One bounded step per loop, the floats keep getting checked while Wi-Fi comes up
+            network_ready = pumping.remote_notifier.http.bring_up_network()
+            if network_ready:
+                boot_timings["network_ready"] = int((time.monotonic() - boot_start_time) * 1000)
+                for step, ms in pumping.remote_notifier.http.boot_timings.items():
+                    boot_timings["net_" + step] = ms
+                debug.print_info("code", "Network up, boot timings %s, network %s", boot_timings,
+                                 pumping.remote_notifier.http.boot_timings)
+        profiler.mark("network")
 
         if pumping.pump_state is pumping.ENGAGE_PUMP and  pumping.last_pump_state is pumping.PUMPING_VERIFIED:
             debug.print_debug("code", "Setting : pump_start_time")
             pump_start_time = time.monotonic()
 
-        if pumping.last_pump_state != pumping.pump_state or display_timer.start_time is None or display_timer.is_timed_out():
+        if error_display_timer.is_timed_out():
+            error_display_timer.cancel_timer()
+            display_timer.cancel_timer()  # Back to the status screen right away
+        if not error_display_timer.is_timing() and (pumping.last_pump_state != pumping.pump_state or
+                                                    display_timer.start_time is None or display_timer.is_timed_out()):
             display.display_status(this_address, pumping.pump_state, pumping.remote_notifier,
-                                   program_start_time, pump_start_time, water_level_readers)
-            display_timer.start_timer(properties.defaults["display_interval"])
+                                   program_start_time, pump_start_time, pumping.fusion)
+            display_timer.start_timer(properties.config.display_interval)
+        profiler.mark("display")
 
-        # notify_remote sends messages to remote
-        if pumping.notify_remote():
+        # notify_remote sends messages to remote, for every station over the one connection.
+        # poll first so a cmd pushed over mqtt is handled this tick.
+        pumping.remote_notifier.http.poll()
+        if scheduler.notify_all():
             display.display_status(this_address, pumping.pump_state, pumping.remote_notifier,
-                                   program_start_time, pump_start_time, water_level_readers)
+                                   program_start_time, pump_start_time, pumping.fusion)
+        pumping.remote_notifier.send_errors()
+        profiler.mark("notify")
 
         # If http failed, then ping again to attempt to reset http error and start communicating again with remote.
-        if not pumping.remote_notifier.http.last_http_status_success():
+        if network_ready and not pumping.remote_notifier.http.last_http_status_success():
             # This is an important call. Continued ping failure will lead to a device reboot to attempt to re-enable
             # the device http functionality.
             pumping.remote_notifier.http.ping_default()
+        profiler.mark("ping")
+
+        # At most one step of a scrape, never waits on the scraper
+        if metrics is not None:
+            metrics.poll(pumping.remote_notifier.http.pool if network_ready else None)
+        profiler.mark("metrics")
+
+        # Powers the radio down while everything is idle (radio_idle_seconds), up again for a pump cycle
+        if network_ready:
+            pumping.remote_notifier.http.radio_power.tick(scheduler.any_active() or
+                                                          not pumping.remote_notifier.quiet())
+        profiler.mark("radio")
+
+        # Off the control path: after the notifications, and not while a pump runs
+        if environment is not None:
+            environment.tick(scheduler.any_pump_running())
+        profiler.mark("env")
+
+        # Collect here, while nothing else is going on, rather than letting a full heap force it in the middle
+        # of a pump cycle
+        history.tick()
+        memory.collect_if_idle(scheduler.any_pump_running())
+        profiler.mark("gc")
 
-        sleep_time = properties.defaults["sleep_time"]
-        if sleep_time <1:
-            sleep_time = .2
-        elif sleep_time > 5:
-            sleep_time = 5
-        time.sleep(sleep_time)
+        time.sleep(loop_sleep_time())
+        profiler.mark("sleep")
+        profiler.end_tick()
 
     except Exception as e:
         # error = pumping.remote_notifier.http.str(format_exception(e))
         error = str(format_exception(e))
         pumping.remote_notifier.http.do_error_post("MAIN LOOP", "Error: " + error)
-        debug.print_debug("code","Exception in main: "+error)
-        display.display_error(["Exception in main",str(e)])
+        debug.print_error("code","Exception in main: %s", error)
+        if not error_display_timer.is_timing():
+            display.display_error(["Exception in main",str(e)])
+        # Shown for ERROR_DISPLAY_SECONDS while the loop goes on at its usual pace, rather than a 10 s sleep
+        # with the floats unchecked
+        error_display_timer.start_timer(ERROR_DISPLAY_SECONDS)
         pumping_state = "error"
-        time.sleep(10)
+        time.sleep(loop_sleep_time())
         # display.display_status(this_address, pumping_state, program_start_time, pump_start_time, water_level_readers,
         #                       "Err")
         continue
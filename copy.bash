@@ -11,7 +11,8 @@ function get_mount_point()
 }
 function copy_updated_files()
 {
-  if [[ ! $1 =~ "/lib/" ]]; then
+  # lib/ is managed with circup, bench/ only runs on the host
+  if [[ ! $1 =~ "/lib/" && ! $1 =~ "/bench/" ]]; then
     local from=$1
     local to="$MOUNT_POINT/${from/\.\//}"
     # echo "from                     $from ($(date -r $from))"
@@ -4,21 +4,41 @@ from traceback import format_exception
 import board
 import digitalio
 
+from util.common import BOOT_NONCE
 from util.debug import Debug
+from util.fill_rate_model import FillRateModel
 from util.http_functions import get_response_text
 from util.properties import Properties
 from util.pump_motor_controller import PumpMotorController
 from util.remote_event_notifier import RemoteEventNotifier
+from util.sensor_fusion import SensorFusion
 from util.simple_timer import Timer
+from util.tick_profiler import TickProfiler
+from util.time_series_log import SENSOR, STATE, TimeSeriesLog
 from util.water_level import WaterLevelReader
 from util.pumping_display import PumpingDisplay
 
-# Variables to help keep track of which water level sensor is the top and which to bottom.
+# Indexes of the bottom and top water level sensors, the readers are ordered bottom to top (two or more)
 bottom = 0
-top = 1
+top = -1
 
-def get_pumping_id():
-    return str(int(time.time() * 1000))
+# Get the connection ready when the top float is predicted to trip within this many seconds
+PREWARM_SECONDS = 15
+
+# Because of the gap between the bottom float and the bottom of the reservoir, keep pumping this long after the
+# bottom float goes dry
+PUMP_OVERRUN_SECONDS = 20
+
+pumping_id_count = 0
+
+
+# Event id for a pumping cycle, minted on the device so the cycle doesn't wait on the remote for one:
+# component id, the boot's random nonce and a count, e.g. "1-3fa9c2d1-7". Ids from different boards and boots don't
+# collide, and it doesn't need the clock to be set.
+def get_pumping_id(component_id: str):
+    global pumping_id_count
+    pumping_id_count += 1
+    return "%s-%s-%d" % (component_id, BOOT_NONCE, pumping_id_count)
 
 class PumpingController:
     IDLE = "idle"
@@ -34,15 +54,24 @@ class PumpingController:
     PUMPING_TIMED_OUT = "timed_out"
     REMOTE_NOTIFIER_ERROR = "remote_error"
     UNKNOWN = "unknown"
+    # Recorded in the history log by index, only append
+    STATES = (IDLE, READY_TO_PUMP, PUMPING_CANCELED, PUMPING_STOPPED, PUMPING_STARTED, START_PUMPING, STOP_PUMPING,
+              ENGAGE_PUMP, PUMPING_VERIFY, PUMPING_VERIFIED, PUMPING_TIMED_OUT, REMOTE_NOTIFIER_ERROR, UNKNOWN)
 
 
 
+    # With several stations on one board (see stations.py) each gets its own controller, they share the display and
+    # the connection through remote_notifier. Only one of them can own the led, the others pass None.
     def __init__(self,display:PumpingDisplay, properties: Properties, led: board.pin, pump: PumpMotorController,
-                 water_level_readers: list[WaterLevelReader], debug: Debug):
+                 water_level_readers: list[WaterLevelReader], debug: Debug, profiler: TickProfiler = None,
+                 remote_notifier: RemoteEventNotifier = None, name: str = None):
         self.display = display
         self.properties = properties
-        self.led = digitalio.DigitalInOut(led)
-        self.led.direction = digitalio.Direction.OUTPUT
+        self.name = name
+        self.led = None
+        if led is not None:
+            self.led = digitalio.DigitalInOut(led)
+            self.led.direction = digitalio.Direction.OUTPUT
         self.water_level_readers = water_level_readers
         self.debug = debug
         self.error_string = "No Error"
@@ -57,14 +86,41 @@ class PumpingController:
         self.need_to_send_remote_pumping_started = False
         self.pump_start_time = None
         self.pump_event_count = 0
-        self.remote_notifier = RemoteEventNotifier(properties, debug)
+        self.profiler = profiler
+        self.bottom_has_water = False
+        self.top_has_water = False
+        self.fill_model = FillRateModel()
+        self.fusion = SensorFusion(water_level_readers, self.fill_model)
+        self.pump_degraded_reported = False
+        self.prewarmed = False
+        if remote_notifier is None:
+            remote_notifier = RemoteEventNotifier(properties, debug)
+        self.remote_notifier = remote_notifier
         self.timer = Timer()
         self.idle_timer = Timer()
-        self.seconds_to_wait_for_pumping_verification = self.properties.defaults["seconds_to_wait_for_pumping_verification"]
-        self.seconds_between_pumping_status_to_remote = self.properties.defaults["seconds_between_pumping_status_to_remote"]
-        self.seconds_to_pump_before_timeout = self.properties.defaults["seconds_to_pump_before_timeout"]
+        self.overrun_timer = Timer()
+        self.pump_overrun_seconds = PUMP_OVERRUN_SECONDS
+        self.history = None
+        self.history_subject = 0
+        self.environment = None  # EnvironmentSensor of the enclosure, shared by the stations
+        self.config_changed(self.properties.config)
+        self.properties.add_listener(self.config_changed)
+
+    # Also called by Properties when secrets.json is reloaded, new timings apply from the next timer start
+    def config_changed(self, config, changed=None):
+        self.seconds_to_wait_for_pumping_verification = config.seconds_to_wait_for_pumping_verification
+        self.seconds_between_pumping_status_to_remote = config.seconds_between_pumping_status_to_remote
+        self.seconds_to_pump_before_timeout = config.seconds_to_pump_before_timeout
+
+    # Records the state transitions, float edges and pump runs of this station in the history log as subject
+    def attach_history(self, history: TimeSeriesLog, subject: int):
+        self.history = history
+        self.history_subject = subject
+        self.pump.attach_history(history, subject)
 
     def set_and_return_state(self, state):
+        if state != self.pump_state and self.history is not None and state in self.STATES:
+            self.history.record(STATE, self.history_subject, self.STATES.index(state))
         self.last_pump_state = self.pump_state
         self.pump_state = state
         return state
@@ -83,16 +139,26 @@ class PumpingController:
             return self.REMOTE_NOTIFIER_ERROR
 
     def stop_pumping(self,pumping_state):
-        self.debug.print_debug("controller","**** stop_pumping **** ("+pumping_state+")")
+        self.debug.print_debug("controller","**** stop_pumping **** (%s)", pumping_state)
         self.pump.pump_off()
         self.timer.cancel_timer()
         self.pumping_started_flag = False
         self.pumping_verified_flag = False
-        self.remote_notifier.http.reset_id()
+        self.overrun_timer.cancel_timer()
+        if not self.need_to_send_remote_pumping_started:
+            # Otherwise the cycle's id is cleared once its pump_event is out, see notify_remote
+            self.remote_notifier.reset_id()
+
+    # A pumping cycle starts: mints its event id, every post until the cycle ends carries it
+    def begin_event(self):
+        if not self.remote_notifier.minted:
+            self.remote_notifier.begin_event(get_pumping_id(self.properties.config.component_id))
 
     def create_status_object(self):
-        water_level_state = self.get_water_state_action()
+        # The readings from this tick's check, a second read would count the sensor evidence twice
+        water_level_state = self.get_water_state_action(fresh=False)
         return {
+            "station": self.name,
             "pump_state": self.pump_state,
             "water_level_state": water_level_state,
             "pumping_started_flag": str(self.pumping_started_flag),
@@ -102,14 +168,36 @@ class PumpingController:
             "last_pump_elapsed_time": self.last_pump_elapsed_time,
             "pump_event_count": self.pump_event_count,
             "last_http_code": self.remote_notifier.http.last_status_code,
-            "last_http_error": self.remote_notifier.http.last_error
+            "last_http_error": self.remote_notifier.http.last_error,
+            "debug_lines_dropped": self.debug.get_remote_dropped_count(),
+            "config_version": self.properties.remote_version,
+            "profile": None if self.profiler is None else self.profiler.summary(),
+            "memory": None if self.profiler is None or self.profiler.memory is None else self.profiler.memory.summary(),
+            "fill_model": self.fill_model.summary(),
+            "sensors": self.fusion.summary(),
+            "history": None if self.history is None else self.history.summary(self.history_subject),
+            "outbound": self.remote_notifier.outbound.summary(),
+            "errors": self.remote_notifier.http.errors.summary(),
+            "recovery": self.remote_notifier.http.recovery.summary(),
+            "dns": self.remote_notifier.http.dns.summary(),
+            "radio": self.remote_notifier.http.radio_power.summary(),
+            "env": None if self.environment is None else self.environment.summary()
         }
 
     # Uses water level in the two water measurement sensors to return a water state action
     # This method is highly coupled with check_water_level_state to walk through the pumping lifecycle
-    def get_water_state_action(self):
-        bottom_has_water = self.water_level_readers[bottom].water_present()
-        top_has_water = self.water_level_readers[top].water_present()
+    def get_water_state_action(self, fresh=True):
+        # Fused over all the readers, a stuck sensor is replaced by an estimate instead of stalling the pump
+        if fresh:
+            bottom_has_water, top_has_water = self.fusion.read(self.pump.running)
+            if self.fusion.fault_changed:
+                self.report_sensor_faults()
+            if self.fusion.changed and self.history is not None:
+                self.record_sensor_edges()
+        else:
+            bottom_has_water, top_has_water = self.fusion.fused
+        self.bottom_has_water = bottom_has_water
+        self.top_has_water = top_has_water
 
         if not bottom_has_water and not top_has_water:
             return self.IDLE
@@ -131,15 +219,15 @@ class PumpingController:
             return self.ENGAGE_PUMP
 
         else:
-            self.debug.print_debug("controller","UNKNOWN STATE: bottom has water %s, top has water %s, pumping_started %s"
-                                   % (str(bottom_has_water), str(top_has_water), str(self.pumping_started_flag)))
+            self.debug.print_warning("controller","UNKNOWN STATE: bottom has water %s, top has water %s, pumping_started %s",
+                                     bottom_has_water, top_has_water, self.pumping_started_flag)
             return self.UNKNOWN
 
     # This is the main pumping logic method
     def check_water_level_state(self):
         self.error_string = "No Error"  # If an error is generated, the error string only lasts for one call
-        self.debug.print_debug("controller","check_state: pump_state[%s], last_pump_state[%s], pumping_started_flag[%s], pumping_verified[%s]" %
-                               (self.pump_state, self.last_pump_state, self.pumping_started_flag, self.pumping_verified_flag))
+        self.debug.print_debug("controller","check_state: pump_state[%s], last_pump_state[%s], pumping_started_flag[%s], pumping_verified[%s]",
+                               self.pump_state, self.last_pump_state, self.pumping_started_flag, self.pumping_verified_flag)
 
         if self.pump_state is None:
             self.pump.pump_off()
@@ -152,30 +240,33 @@ class PumpingController:
         # Timer starts when pumping starts.
         # Timer canceled as soon as the pumping verification happens
         if self.timer.is_timed_out():
-            self.debug.print_debug("controller","TIMED OUT. Elapsed: " + self.timer.get_elapsed())
+            self.debug.print_warning("controller","TIMED OUT. Elapsed: %s", self.timer.get_elapsed)
             self.pump.pump_off()
             if self.pumping_verified_flag:
                 # Have verification but pumping didn't finish on time so send pumping timeout
                 self.display.display_remote("pumping timeout")
-                self.remote_notifier.http.do_error_post("Pumping TIMED OUT", "Elapsed: " + self.timer.get_elapsed())
+                self.remote_notifier.error_post("Pumping TIMED OUT", "Elapsed: " + self.timer.get_elapsed())
                 self.remote_notifier.pumping_timout(self.pump_state,
                                             {"pumping_started_flag": str(self.pumping_started_flag),
                                                        "pumping_verified_flag": str(self.pumping_verified_flag)})
             else:
                 # Haven't gotten pumping verification so send verification timeout
                 self.display.display_remote("verification timeout")
-                self.remote_notifier.http.do_error_post("PUMPING TIMED OUT", "Elapsed: " + self.timer.get_elapsed())
+                self.remote_notifier.error_post("PUMPING TIMED OUT", "Elapsed: " + self.timer.get_elapsed())
                 self.remote_notifier.missed_pumping_verification(self.pump_state)
 
             self.need_to_send_remote_pumping_started = False # Gets set when pumping_verified_flag gets set
             self.pumping_started_flag = False
             self.pumping_verified_flag = False
             self.timer.cancel_timer()
+            self.remote_notifier.reset_id()  # The timeout notification went out (or was queued) with the cycle's id
             return self.set_and_return_state(self.IDLE)
 
         # After remote status and timer check, it's time to read the water levels
         # and see if we need to change state, i.e. start or stop pump
         water_level_state = self.get_water_state_action()
+        # Before acting on it, so the drain time doesn't include the extra pumping after the bottom goes dry
+        self.update_fill_model()
 
         # If we get weird, bogus reading and water level state can't be computed, then return to try again
 
@@ -197,10 +288,20 @@ class PumpingController:
         try:
             # If we've been pumping and the bottom water measurement has no water, stop pumping
             if water_level_state == self.IDLE:
-                if self.pumping_started_flag:
+                if self.pumping_started_flag and self.pump_overrun_seconds > 0:
                     # For now... because of the extra gap between the bottom float and the bottom of the reservoir,
-                    # if we've been pumping, keep pumping for another 30 seconds.
-                    time.sleep(20)
+                    # if we've been pumping, keep pumping a little longer. Timed rather than slept, so the other
+                    # stations keep being checked meanwhile.
+                    if not self.overrun_timer.is_timing():
+                        # The pumping finished in time. The pumping timeout keeps running as the guard of the overrun
+                        # (the bottom float coming back wet resumes pumping under it), the overrun ends before it.
+                        seconds = self.pump_overrun_seconds
+                        remaining = self.timer.get_remaining()
+                        if remaining is not None:
+                            seconds = max(0, min(seconds, remaining - 1))
+                        self.overrun_timer.start_timer(seconds)
+                    if not self.overrun_timer.is_timed_out():
+                        return self.set_and_return_state(self.pump_state)
                 # Turn off pump and reset pumping and verification flags
                 self.stop_pumping(self.STOP_PUMPING)
                 return self.set_and_return_state(self.IDLE)
@@ -211,6 +312,7 @@ class PumpingController:
                 self.pumping_started_flag = False
                 self.pumping_verified_flag = False
                 self.need_to_send_remote_pumping_started = False
+                self.begin_event()
                 return self.set_and_return_state(self.READY_TO_PUMP)
 
             # If the last state was READY_TO_PUMP and the top water level still has no water, then keep READY_TO_PUMP
@@ -246,25 +348,87 @@ class PumpingController:
             if self.pump_start_time is None:
                 self.pump_start_time = time.monotonic()
 
+            self.begin_event()  # Straight from idle to pumping, e.g. a full reservoir at power on
+
             self.pumping_started_flag = True
+            self.overrun_timer.cancel_timer()
             self.pump.pump_on()
             self.idle_timer.reset_timer(self.seconds_between_pumping_status_to_remote)
             return self.set_and_return_state(self.ENGAGE_PUMP)
         except Exception as e:
             self.error_string = str(format_exception(e))
-            self.remote_notifier.http.do_error_post("check_water_level_state", str(e))
+            self.remote_notifier.error_post("check_water_level_state", str(e))
             return self.REMOTE_NOTIFIER_ERROR
 
+    def record_sensor_edges(self):
+        for i in range(len(self.water_level_readers)):
+            if self.fusion.changed & (1 << i):
+                self.history.record(SENSOR, self.history_subject * 16 + i, 1 if self.fusion.raw[i] else 0)
+
+    def report_sensor_faults(self):
+        self.fusion.fault_changed = False
+        faults = self.fusion.faults()
+        if faults:
+            self.debug.print_error("controller", "Sensor fault: %s, running on the remaining sensors",
+                                   lambda: ",".join(faults))
+            self.remote_notifier.error_post("sensor fault", ",".join(faults))
+        else:
+            self.debug.print_warning("controller", "All level sensors healthy again")
+
+    # Feeds the float readings and relay state to the fill rate model
+    def update_fill_model(self):
+        if not self.fusion.all_healthy():
+            # The fused readings are partly made from the model, don't learn from them
+            return
+        reader = self.water_level_readers[bottom]
+        if hasattr(reader, "get_level") and reader.top_level is not None:
+            self.fill_model.add_level(reader.get_level(), reader.top_level)
+        if not self.fill_model.observe(self.bottom_has_water, self.top_has_water, self.pump.running):
+            return
+        if self.fill_model.degraded and not self.pump_degraded_reported:
+            self.debug.print_warning("controller", "Pump degrading: drain %.1fs, baseline %.1fs",
+                                     self.fill_model.drain_seconds, self.fill_model.drain_baseline)
+        self.pump_degraded_reported = self.fill_model.degraded
+
+    # While filling, use the predicted top float trip to get ready for pumping:
+    # make sure the connection is up now rather than when the pump event is due, and if the periodic status would
+    # come due while pumping, send it now.
+    def check_predicted_pumping(self):
+        if self.pump_state != self.READY_TO_PUMP:
+            self.prewarmed = False
+            return
+        trip = self.fill_model.seconds_until_top_trip()
+        if self.prewarmed or trip is None or trip > PREWARM_SECONDS:
+            return
+        self.prewarmed = True
+        http = self.remote_notifier.http
+        self.debug.print_debug("controller", "top float predicted in %ds, prewarming", trip)
+        if http.network_ready:
+            http.check_connection()
+        remaining = self.idle_timer.get_remaining()
+        if remaining is not None and remaining < trip + (self.fill_model.drain_seconds or 0):
+            self.idle_timer.cancel_timer()
+            self.check_idle_timer()
+
     # Handles the high level remote calls to send pumping info to the backend
     # The remote call can take some time so the backend calls are timed to avoid interfere with the pumping.
     def notify_remote(self):
         did_remote_display = False
+        # Control notifications that couldn't be sent earlier go first
+        self.remote_notifier.send_queued()
         if self.last_pump_state is self.READY_TO_PUMP and self.pump_state == self.IDLE:
             # Can miss notify if state goes from ready back to idle
             self.last_remote_cmd = self.IDLE
 
         if self.pump_state == self.READY_TO_PUMP:
             self.check_idle_timer()
+        self.check_predicted_pumping()
+
+        # A cmd the remote pushed (mqtt) is handled right away instead of at the next status handshake
+        pushed_cmd = self.remote_notifier.take_pushed_cmd()
+        if pushed_cmd is not None:
+            self.debug.print_info("notify_remote", "Pushed remote cmd %s", pushed_cmd)
+            self.handle_remote_cmd(pushed_cmd)
 
         if self.pump_state == self.IDLE:
             if (self.need_to_send_remote_pumping_started):
@@ -283,19 +447,18 @@ class PumpingController:
                 self.timer.cancel_timer()
                 self.remote_notifier.pump_event(self.ENGAGE_PUMP,
         {"last_pump_elapsed_time": self.last_pump_elapsed_time,"pump_event_count": self.pump_event_count})
+                self.remote_notifier.reset_id()  # The cycle is over
 
             self.check_idle_timer()
 
         elif (self.last_remote_cmd != self.READY_TO_PUMP and
               (self.last_pump_state != self.READY_TO_PUMP and self.pump_state == self.READY_TO_PUMP)):
-            # If Ping failed, then no need to do remote command, display error and return
-            if not self.remote_notifier.http.last_http_status_success():
-                return
+            # The event id is already minted, nothing waits on the answer: queued, and sent from send_queued on the
+            # next notify, after that tick's pump check. Also kept until the connection is back.
             self.last_remote_cmd = self.READY_TO_PUMP
             self.display.display_remote("ready to pump")
             did_remote_display = True
-            self.handle_remote_response(self.READY_TO_PUMP,
-                                               self.remote_notifier.send_ready_to_pump(self.pump_state))
+            self.remote_notifier.queue_ready_to_pump(self.pump_state)
 
         # elif self.last_remote_cmd != self.PUMPING_VERIFIED and self.pump_state == self.PUMPING_VERIFIED:
         #     if self.remote_notifier.http.last_status_code == "Ping Fail":
@@ -304,7 +467,20 @@ class PumpingController:
         #     return self.handle_remote_response(self.PUMPING_VERIFIED,
         #                                        self.remote_notifier.pumping_confirmed(self.pump_state))
 
+        self.check_remote_config()
         return did_remote_display
+
+    # The remote can piggyback a versioned config patch on any mission response.
+    # Apply it live (listeners update the timers) and ack the version, applied or not.
+    def check_remote_config(self):
+        patch = self.remote_notifier.http.remote_config
+        if patch is None:
+            return
+        self.remote_notifier.http.remote_config = None
+        applied, errors = self.properties.apply_remote_patch(patch)
+        self.remote_notifier.send_config_ack(self.pump_state, patch.get("version") if isinstance(patch, dict) else None,
+                                             applied, errors)
+
     def check_idle_timer(self):
         if self.idle_timer.start_time is None or self.idle_timer.is_timed_out():
             # Don't flood the server with pumping status
@@ -323,29 +499,30 @@ class PumpingController:
                 self.idle_timer.start_timer(self.seconds_between_pumping_status_to_remote)
 
                 if hasattr(response, "status_code"):
-                    self.debug.print_debug("notify_remote", "remote_cmd return-code " + str(
-                        response.status_code) + " text " + get_response_text(response))
+                    self.debug.print_debug("notify_remote", "remote_cmd return-code %s text %s",
+                                           response.status_code, lambda: get_response_text(response))
 
                 remote_cmd = self.remote_notifier.http.remote_cmd  # remote_cmd is returned in server json.
-
-                if remote_cmd == self.PUMPING_CANCELED:
-                    # Canceled happens during pumping when pump verification times out on remote,
-                    # and it attempts a stop us.
-                    # This should only happen if there is something wrong with pump, and it's not pumping.
-                    # NOTE: Both sides go into idle and this side will attempt to start pumping again
-                    #       if the water level measurements trigger the pump.
-                    # This is like a reset. There is no "permanent" stop pumping.
-                    self.stop_pumping(self.PUMPING_CANCELED)
-                    self.remote_notifier.send_pumping_canceled_ack(self.pump_state)
-                elif remote_cmd == self.START_PUMPING:
-                    # For what ever reason, the remote can turn on pump
-                    # This has not been tested to see if this code will handle gracefully
-                    self.pump_state = self.ENGAGE_PUMP
-                    self.pump.pump_on()
-                    self.remote_notifier.send_start_pumping_ack(self.pump_state)
+                self.handle_remote_cmd(remote_cmd)
             except Exception as e:
-                self.remote_notifier.http.do_error_post("status handshake", str(format_exception(e)))
+                self.remote_notifier.error_post("status handshake", str(format_exception(e)))
                 self.display.display_error(["Error sending to remote. ", str(e)])
-                self.debug.print_debug("notify_remote",
-                                       "WARNING: Remote communication failed. Error: %s" % str(format_exception(e)))
-
+                self.debug.print_warning("notify_remote", "WARNING: Remote communication failed. Error: %s",
+                                         lambda: str(format_exception(e)))
+
+    def handle_remote_cmd(self, remote_cmd):
+        if remote_cmd == self.PUMPING_CANCELED:
+            # Canceled happens during pumping when pump verification times out on remote,
+            # and it attempts a stop us.
+            # This should only happen if there is something wrong with pump, and it's not pumping.
+            # NOTE: Both sides go into idle and this side will attempt to start pumping again
+            #       if the water level measurements trigger the pump.
+            # This is like a reset. There is no "permanent" stop pumping.
+            self.stop_pumping(self.PUMPING_CANCELED)
+            self.remote_notifier.send_pumping_canceled_ack(self.pump_state)
+        elif remote_cmd == self.START_PUMPING:
+            # For what ever reason, the remote can turn on pump
+            # This has not been tested to see if this code will handle gracefully
+            self.pump_state = self.ENGAGE_PUMP
+            self.pump.pump_on()
+            self.remote_notifier.send_start_pumping_ack(self.pump_state)
@@ -0,0 +1,210 @@
+import board
+
+from pumping_controller import PumpingController
+from util.debug import Debug
+from util.properties import Properties
+from util.pump_motor_controller import PumpMotorController
+from util.remote_event_notifier import RemoteEventNotifier
+from util.tick_profiler import TickProfiler
+from util.time_series_log import TimeSeriesLog
+from util.water_level import WaterLevelReader, WaterLevelReaderAnalog
+
+
+# The single station of the wiring_option layouts, used when secrets.json has no "stations"
+def wiring_stations(wiring_option: str):
+    if wiring_option.lower() in ['2', 't', 'test']:
+        sensors = [{"name": "Bottom", "enable": "D9", "pin": "D6"}, {"name": "Top", "enable": "D10", "pin": "D10"}]
+    else:
+        sensors = [{"name": "Bottom", "enable": "D5", "pin": "D5"}, {"name": "Top", "enable": "D6", "pin": "D6"}]
+    return [{"pump": "D12", "led": "LED", "sensors": sensors}]
+
+
+def pin(name: str):
+    if not hasattr(board, name):
+        raise ValueError("no pin board." + str(name))
+    return getattr(board, name)
+
+
+# Builds one PumpingController per station declared in secrets.json:
+#     "stations": [{"name": "North", "pump": "D12", "led": "LED",
+#                   "sensors": [{"name": "Bottom", "enable": "D5", "pin": "D5"},
+#                               {"name": "Top", "enable": "D6", "pin": "D6"}]},
+#                  {"name": "South", "pump": "D11",
+#                   "sensors": [{"name": "S Bottom", "enable": "D13", "pin": "A0", "analog": true}, ...]}]
+# Sensors are listed bottom to top. "analog": true makes a WaterLevelReaderAnalog, its thresholds are the
+# water_levels entry of the same name, so sensor names are unique across stations.
+# A station with a bad declaration is skipped with a warning, if none is left the wiring_option layout is used.
+# All the stations share the display, one connection (the first station's notifier) and the history log, where
+# each station records under its index.
+def build_stations(properties: Properties, display, debug: Debug, profiler: TickProfiler = None,
+                   history: TimeSeriesLog = None):
+    declared = properties.config.stations
+    stations = []
+    notifier = None
+    for index in range(len(declared)):
+        try:
+            station = build_station(declared[index], index, properties, display, debug, profiler, notifier)
+        except Exception as e:
+            debug.print_error("stations", "Station %d skipped: %s", index, str(e))
+            continue
+        if notifier is None:
+            notifier = station.remote_notifier
+        stations.append(station)
+    if not stations:
+        stations.append(build_station(wiring_stations(properties.config.wiring_option)[0], 0, properties, display,
+                                      debug, profiler, None))
+    if history is not None:
+        stations[0].remote_notifier.http.history = history
+        for index in range(len(stations)):
+            stations[index].attach_history(history, index)
+    return stations
+
+
+def build_station(declaration: dict, index: int, properties: Properties, display, debug: Debug,
+                  profiler: TickProfiler, notifier: RemoteEventNotifier):
+    name = declaration.get("name")
+    sensors = declaration.get("sensors", [])
+    if len(sensors) < 2:
+        raise ValueError("needs a bottom and a top sensor")
+    readers = []
+    for sensor in sensors:
+        reader_class = WaterLevelReaderAnalog if sensor.get("analog", False) else WaterLevelReader
+        readers.append(reader_class(sensor["name"], properties, pin(sensor["enable"]), pin(sensor["pin"]), debug))
+    pump = PumpMotorController(pin(declaration["pump"]), debug)
+    led = declaration.get("led")
+    if notifier is None:
+        notifier = RemoteEventNotifier(properties, debug, name)
+    else:
+        notifier = notifier.for_station(name)
+    debug.print_info("stations", "Station %d %s: pump %s, sensors %s", index, name, declaration["pump"],
+                     lambda: ",".join([sensor["name"] for sensor in sensors]))
+    return PumpingController(display, properties, None if led is None else pin(led), pump, readers, debug, profiler,
+                             notifier, name)
+
+
+# Steps every station's state machine once per main loop tick. The cost of a tick is one check (and one notify)
+# per station, all remote traffic goes out over the shared connection in station order.
+# A failing station is reported and skipped for the tick, it doesn't stop the others.
+class StationScheduler:
+    def __init__(self, stations: list, debug: Debug):
+        self.stations = stations
+        self.debug = debug
+        self.primary = stations[0]  # Shown on the display, drives the buttons and the startup notification
+        self.errors = [0] * len(stations)
+
+    def check_all(self):
+        for i in range(len(self.stations)):
+            station = self.stations[i]
+            try:
+                station.check_water_level_state()
+            except Exception as e:
+                # Don't leave a pump running on a state machine that can't be stepped
+                station.pump.pump_off()
+                self.station_failed(i, "check_water_level_state", e)
+
+    # Returns True if any station put something on the display
+    def notify_all(self):
+        did_remote_display = False
+        for i in range(len(self.stations)):
+            station = self.stations[i]
+            try:
+                if station.notify_remote():
+                    did_remote_display = True
+            except Exception as e:
+                self.station_failed(i, "notify_remote", e)
+        return did_remote_display
+
+    def station_failed(self, index: int, step: str, e: Exception):
+        station = self.stations[index]
+        self.errors[index] += 1
+        self.debug.print_error("stations", "Station %s %s failed: %s", station.name, step, str(e))
+        station.remote_notifier.error_post(step, str(e))
+
+    def any_pump_running(self):
+        for station in self.stations:
+            if station.pump.running:
+                return True
+        return False
+
+    # The enclosure's EnvironmentSensor, reported in every station's status object
+    def attach_environment(self, environment):
+        for station in self.stations:
+            station.environment = environment
+
+    # Any station past idle, from ready to pump until its pump event
+    def any_active(self):
+        for station in self.stations:
+            if station.pump_state != station.IDLE:
+                return True
+        return False
+
+    # {name: [pump_state, errors]}
+    def summary(self):
+        states = {}
+        for i in range(len(self.stations)):
+            states[str(self.stations[i].name)] = [self.stations[i].pump_state, self.errors[i]]
+        return states
+
+    # Station, sensor and connection metrics for the MetricsServer
+    def register_metrics(self, metrics):
+        http = self.primary.remote_notifier.http
+        metrics.register("pump_state", "Current state of each station", "gauge",
+                         lambda: [('station="%s",state="%s"' % (station.name, station.pump_state), 1)
+                                  for station in self.stations])
+        metrics.register("pump_running", "Pump relay on", "gauge",
+                         lambda: self.station_values(lambda station: station.pump.running))
+        metrics.register("pump_events_total", "Pump events reported", "counter",
+                         lambda: self.station_values(lambda station: station.pump_event_count))
+        metrics.register("pump_station_errors_total", "Failed station steps", "counter",
+                         lambda: [('station="%s"' % self.stations[i].name, self.errors[i])
+                                  for i in range(len(self.stations))])
+        metrics.register("pump_sensor_wet", "Float switch reading", "gauge",
+                         lambda: self.sensor_values(lambda fusion, i: fusion.raw[i]))
+        metrics.register("pump_sensor_health", "Sensor health score, faulty below 50", "gauge",
+                         lambda: self.sensor_values(lambda fusion, i: fusion.health[i]))
+        metrics.register("pump_transactions_total", "Remote requests since boot", "counter",
+                         lambda: http.transaction_count)
+        metrics.register("pump_remote_errors", "Remote errors since the last successful ping", "gauge",
+                         lambda: http.error_count)
+        metrics.register("pump_remote_last_status", "Status of the last remote request, 0 when it failed", "gauge",
+                         lambda: http.last_status_code)
+        outbound = self.primary.remote_notifier.outbound
+        metrics.register("pump_outbound_sent_total", "Posts sent per priority class", "counter",
+                         lambda: outbound.metric_values(0))
+        metrics.register("pump_outbound_deferred_total", "Posts held back per priority class", "counter",
+                         lambda: outbound.metric_values(1))
+        metrics.register("pump_outbound_dropped_total", "Queued posts dropped per priority class", "counter",
+                         lambda: outbound.metric_values(2))
+        metrics.register("pump_outbound_depth", "Posts (debug lines for bulk) waiting per priority class", "gauge",
+                         lambda: outbound.metric_values(3))
+        metrics.register("pump_outbound_wait_ms", "Longest wait to send per priority class", "gauge",
+                         lambda: outbound.metric_values(5))
+        metrics.register("pump_error_reports_total", "Errors reported, sent, merged into a summary and dropped",
+                         "counter", http.errors.metric_values)
+        metrics.register("pump_recovery_tries_total", "Network recovery steps tried per rung", "counter",
+                         lambda: http.recovery.metric_values(0))
+        metrics.register("pump_recovery_recovered_total", "Outages that ended after each rung", "counter",
+                         lambda: http.recovery.metric_values(1))
+        metrics.register("pump_recovery_ms", "Mean time from each rung to the end of the outage", "gauge",
+                         lambda: http.recovery.metric_values(2))
+        metrics.register("pump_dns_lookups_total", "Remote host lookups per outcome: from the cache, resolved, "
+                         "stale, negative and failed", "counter", http.dns.metric_values)
+        metrics.register("pump_radio_associations_total", "Wi-Fi associations, full scan or fast", "counter",
+                         lambda: http.radio_power.metric_values(0))
+        metrics.register("pump_radio_association_ms", "Mean Wi-Fi association time, full scan or fast", "gauge",
+                         lambda: http.radio_power.metric_values(1))
+        metrics.register("pump_radio_on_seconds_per_day", "Radio on time, scaled to a day", "gauge",
+                         http.radio_power.on_seconds_per_day)
+
+    # [(labels, value)] with value(station) for every station
+    def station_values(self, value):
+        return [('station="%s"' % station.name, value(station)) for station in self.stations]
+
+    # [(labels, value)] with value(fusion, index) for every sensor of every station
+    def sensor_values(self, value):
+        values = []
+        for station in self.stations:
+            readers = station.water_level_readers
+            for i in range(len(readers)):
+                values.append(('station="%s",sensor="%s"' % (station.name, readers[i].name), value(station.fusion, i)))
+        return values
@@ -1,5 +1,10 @@
+import os
 import time
 
+# Drawn once per boot: with it a count is enough for ids that don't collide across boards and boots
+# (see get_pumping_id and the idempotency key of the mission posts)
+BOOT_NONCE = "%02x%02x%02x%02x" % tuple(os.urandom(4))
+
 class CommonFunctions:
     def __init__(self):
         pass
@@ -0,0 +1,48 @@
+import os
+import time
+
+DEFAULT_CHECK_INTERVAL = 2  # seconds
+
+# os.stat() result fields (CircuitPython returns a plain tuple)
+ST_SIZE = 6
+ST_MTIME = 8
+
+
+# Watches a few control files (the "debug" flag file, secrets.json, ...) for changes.
+# Each watched path is checked with a single os.stat(), and at most once every interval seconds,
+# instead of scanning the root directory every loop.
+# The callback is called as callback(path, exists) whenever the file appears, disappears or its size/mtime changes.
+class ConfigWatcher:
+    def __init__(self, interval: float = DEFAULT_CHECK_INTERVAL):
+        self.interval = interval
+        self.watches = []  # [path, callback, last signature]
+        self.last_check = None
+        self.stat_count = 0
+
+    def watch(self, path: str, callback):
+        self.watches.append([path, callback, self.signature(path)])
+
+    # Call every loop, it returns right away unless the interval has elapsed (or force is set).
+    # Returns True if any watched file changed.
+    def check(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self.last_check is not None and now - self.last_check < self.interval:
+            return False
+        self.last_check = now
+
+        changed = False
+        for watch in self.watches:
+            signature = self.signature(watch[0])
+            if signature != watch[2]:
+                watch[2] = signature
+                changed = True
+                watch[1](watch[0], signature is not None)
+        return changed
+
+    def signature(self, path: str):
+        self.stat_count += 1
+        try:
+            stat = os.stat(path)
+            return stat[ST_SIZE], stat[ST_MTIME]
+        except OSError:
+            return None
@@ -1,17 +1,49 @@
 import os
 
+from util.log_aggregator import LogAggregator
+from util.log_ring_buffer import LogRingBuffer
+
+DEBUG_FLAG_FILE = "debug"
+
+# Remote debug lines are held in a fixed-size buffer so a long outage can't run the board out of RAM
+REMOTE_BUFFER_BYTES = 8192
+
+# Log levels, lowest to highest. A line is emitted when its level is >= the level set for its caller (category).
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
 
 class Debug:
+    DEBUG = DEBUG
+    INFO = INFO
+    WARNING = WARNING
+    ERROR = ERROR
 
-    def __init__(self):
+    def __init__(self, remote_buffer_bytes: int = REMOTE_BUFFER_BYTES):
         self.debug = False
         self.remote_set = False
+        self.level = DEBUG
+        self.category_levels = {}
         self.check_debug_enable()
-        self.remote_lines = []
+        self.remote_lines = LogRingBuffer(remote_buffer_bytes)
+        self.remote_lines_sequence = 0
+        # Repeated debug lines are collapsed before they reach remote_lines, set to False to send every line
+        self.aggregate_remote = True
+        self.remote_aggregator = LogAggregator(self.remote_lines)
 
+    # Debug output is on while a file named "debug" exists in the root of the feather.
+    # NOTE: code.py watches the file with ConfigWatcher, this is only needed for a one off check.
     def check_debug_enable(self):
-        files_in_dir = os.listdir()
-        a_debug = "debug" in files_in_dir
+        try:
+            os.stat(DEBUG_FLAG_FILE)
+            a_debug = True
+        except OSError:
+            a_debug = False
+        return self.set_debug_enabled(a_debug)
+
+    def set_debug_enabled(self, a_debug: bool):
         if a_debug != self.debug:
             if self.debug:
                 print("Debug OFF")
@@ -30,17 +62,87 @@ class Debug:
     def debug_enabled(self):
         return self.debug
 
-    def print_debug(self, caller, message):
-        # if self.remote_set:
-        debug_line = "[" + '%-10s' % caller + "] "+ message
+    # Sets the minimum level for one caller (category), e.g. set_category_level("-->http", WARNING)
+    def set_category_level(self, caller, level):
+        if level is None:
+            self.category_levels.pop(caller, None)
+        else:
+            self.category_levels[caller] = level
+
+    # Cheap check callers can use to guard blocks of debug-only work
+    def is_enabled(self, caller, level=DEBUG):
+        if not self.debug and not self.remote_set:
+            return False
+        return level >= self.category_levels.get(caller, self.level)
+
+    # message is a %-style template. args are only formatted when the line is emitted,
+    # and any callable arg (or a callable message) is only called at that point.
+    def log(self, level, caller, message, *args):
+        if not self.debug and not self.remote_set:
+            return
+        if level < self.category_levels.get(caller, self.level):
+            return
+
+        if callable(message):
+            message = message()
+        template = message
+        if args:
+            message = message % tuple([arg() if callable(arg) else arg for arg in args])
+
+        debug_line = "[" + '%-10s' % caller + "] " + str(message)
         if self.debug:
             print(debug_line)
 
         if self.remote_set:
-            self.remote_lines.append(debug_line)
+            if self.aggregate_remote and level == DEBUG:
+                self.remote_aggregator.add(caller, template, debug_line)
+            else:
+                # Anything above debug chatter keeps its exact place in the log
+                self.remote_aggregator.flush()
+                self.remote_lines.append(caller, debug_line)
+
+    def print_debug(self, caller, message, *args):
+        self.log(DEBUG, caller, message, *args)
+
+    def print_info(self, caller, message, *args):
+        self.log(INFO, caller, message, *args)
+
+    def print_warning(self, caller, message, *args):
+        self.log(WARNING, caller, message, *args)
+
+    def print_error(self, caller, message, *args):
+        self.log(ERROR, caller, message, *args)
+
+    # Limits how many bytes of the remote buffer one caller can hold, e.g. set_remote_quota("-->http", 2048)
+    def set_remote_quota(self, caller, quota_bytes):
+        self.remote_lines.set_quota(caller, quota_bytes)
+
+    # Keeps 1 of every rate remote debug lines from caller, e.g. set_remote_sample_rate("-->http", 10)
+    def set_remote_sample_rate(self, caller, rate):
+        self.remote_aggregator.set_sample_rate(caller, rate)
 
     def clear_remote_lines(self):
-        self.remote_lines = []
+        self.remote_aggregator.clear()
+        self.remote_lines.clear()
 
+    # Returns the pending remote lines, oldest first. They stay buffered until ack_remote_lines is called.
     def get_remote_lines(self):
-        return self.remote_lines
+        self.remote_aggregator.flush()
+        self.remote_lines_sequence, lines = self.remote_lines.snapshot()
+        return lines
+
+    # Same as get_remote_lines without building a list: returns (first_sequence, line iterator).
+    # Pass first_sequence + lines delivered to remote_lines.ack() to free them.
+    def iter_remote_lines(self):
+        self.remote_aggregator.flush()
+        return self.remote_lines.head_sequence, self.remote_lines.iter_lines()
+
+    # Frees the first count lines returned by the last get_remote_lines call
+    def ack_remote_lines(self, count):
+        self.remote_lines.ack(self.remote_lines_sequence + count)
+
+    def get_remote_dropped_count(self):
+        return self.remote_lines.dropped
+
+    def get_remote_dropped_counts(self):
+        return self.remote_lines.dropped_counts()
@@ -0,0 +1,116 @@
+import time
+
+from util.debug import Debug
+from util.properties import Properties
+
+NEGATIVE_SECONDS = 10  # A failed lookup is not tried again for this long
+NXDOMAIN_SECONDS = 60  # or this long when the resolver answered that the name doesn't exist
+STALE_SECONDS = 3600  # How long past its TTL an address is still used while lookups fail
+EAI_NONAME = -2  # gaierror code of a name the resolver says doesn't exist, a resolver that doesn't answer is another
+
+# Entry fields
+RESULT = 0  # The getaddrinfo result, None until a lookup went through
+EXPIRES = 1
+RETRY_AT = 2  # After a failed lookup, when to try again. None while the last lookup went through.
+ERROR = 3  # The exception of the last failed lookup
+
+OUTCOMES = ("hit", "miss", "stale", "negative", "failed")
+
+
+# Stands in for the socket pool in adafruit_requests and MiniMQTT, which call getaddrinfo for every new socket.
+# Everything else goes to the pool.
+#   - an address younger than dns_ttl is used without a lookup (hit)
+#   - an older one is looked up again inline (miss), there are no threads to refresh it in the background
+#   - a lookup that fails is remembered for NEGATIVE_SECONDS, meanwhile the last address is used for up to
+#     STALE_SECONDS past its TTL (stale), or the failure is raised again without a lookup (negative)
+#   - a name that doesn't exist (NXDOMAIN) loses its last address, it's only kept through a resolver that doesn't
+#     answer, and is remembered for NXDOMAIN_SECONDS
+# HttpFunctions asks unresolved() before a post, so it isn't even tried while the failure is remembered.
+# The addresses outlive the pool, so a DNS outage doesn't take the connection down with it after a new pool.
+class DnsCache:
+    def __init__(self, properties: Properties, debug: Debug):
+        self.properties = properties
+        self.debug = debug
+        self.pool = None
+        self.entries = {}  # (host, port) -> [result, expires, retry at, error]
+        self.stats = [0, 0, 0, 0, 0]  # OUTCOMES
+        self.lookup_ms = 0  # Time spent in the lookups that went to the resolver
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        now = time.monotonic()
+        key = (host, port)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[RESULT] is not None and now < entry[EXPIRES]:
+                self.stats[0] += 1
+                return entry[RESULT]
+            if entry[RETRY_AT] is not None and now < entry[RETRY_AT]:
+                return self.fallback(entry, now, 3)
+        else:
+            entry = [None, 0, None, None]
+            self.entries[key] = entry
+        try:
+            result = self.pool.getaddrinfo(host, port, family, type, proto, flags)
+        except Exception as e:
+            self.lookup_ms += int((time.monotonic() - now) * 1000)
+            self.debug.print_warning("dns", "%s lookup failed: %s", host, str(e))
+            entry[RETRY_AT] = now + NEGATIVE_SECONDS
+            entry[ERROR] = e
+            if name_unknown(e):
+                entry[RETRY_AT] = now + NXDOMAIN_SECONDS
+                entry[RESULT] = None
+            return self.fallback(entry, now, 4)
+        self.lookup_ms += int((time.monotonic() - now) * 1000)
+        self.stats[1] += 1
+        entry[RESULT] = result
+        entry[EXPIRES] = now + self.properties.config.dns_ttl
+        entry[RETRY_AT] = None
+        entry[ERROR] = None
+        return result
+
+    # While lookups fail: the last address if it isn't too old, else the failure counted as outcome
+    def fallback(self, entry, now, outcome: int):
+        if entry[RESULT] is not None and now < entry[EXPIRES] + STALE_SECONDS:
+            self.stats[2] += 1
+            return entry[RESULT]
+        self.stats[outcome] += 1
+        raise entry[ERROR]
+
+    # True while the failure of the last lookup of host is remembered and there is no address to fall back on,
+    # a request to it can only fail. Counted as negative.
+    def unresolved(self, host):
+        now = time.monotonic()
+        for key in self.entries:
+            entry = self.entries[key]
+            if key[0] == host and entry[RETRY_AT] is not None and now < entry[RETRY_AT] and \
+                    (entry[RESULT] is None or now >= entry[EXPIRES] + STALE_SECONDS):
+                self.stats[3] += 1
+                return True
+        return False
+
+    # The next lookup of every host goes to the resolver, after a reconnect the network may be another one
+    def flush(self):
+        self.entries = {}
+
+    # {outcome: count, "hit_rate", "lookup_ms"}, hit_rate counts everything answered from the cache
+    def summary(self):
+        summary = {}
+        for i in range(len(OUTCOMES)):
+            summary[OUTCOMES[i]] = self.stats[i]
+        total = sum(self.stats)
+        summary["hit_rate"] = round((self.stats[0] + self.stats[2] + self.stats[3]) / total, 3) if total else 0
+        summary["lookup_ms"] = self.lookup_ms
+        return summary
+
+    # [(labels, value)] per outcome, for the MetricsServer
+    def metric_values(self):
+        return [('outcome="%s"' % OUTCOMES[i], self.stats[i]) for i in range(len(OUTCOMES))]
+
+
+# The resolver answered that the name doesn't exist, as opposed to not answering (EAI_AGAIN, a timeout).
+# A port whose socketpool raises every lookup failure as EAI_NONAME gets no stale addresses from this cache.
+def name_unknown(e):
+    return isinstance(e, OSError) and len(e.args) > 0 and e.args[0] == EAI_NONAME
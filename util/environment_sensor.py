@@ -0,0 +1,98 @@
+from array import array
+
+from util.debug import Debug
+from util.properties import Properties
+from util.simple_timer import Timer
+
+WINDOW = 60  # Samples in the rolling aggregate, an hour at the default env_sample_seconds
+
+# Readings kept as int16 in these units: temperature and humidity in 1/100 (C, %), pressure in 1/10 hPa
+QUANTITIES = ("temperature", "humidity", "pressure")
+SCALES = (100, 100, 10)
+
+
+# Enclosure temperature, humidity and pressure from the BME280 in lib/adafruit_bme280, one reading every
+# env_sample_seconds (0 leaves the sensor alone).
+# The sensor runs in normal mode: it measures on its own every second, 16x oversampled and IIR filtered, so a
+# reading is a few register reads and never waits for a conversion. Nothing is read while a pump runs.
+# The last WINDOW readings are kept, the status object gets last/min/mean/max of them rather than the readings.
+class EnvironmentSensor:
+    def __init__(self, properties: Properties, debug: Debug, i2c=None):
+        self.properties = properties
+        self.debug = debug
+        self.sensor = None
+        self.readings = [array("h", [0] * WINDOW) for name in QUANTITIES]
+        self.count = 0  # Readings taken, the window holds the last min(count, WINDOW)
+        self.errors = 0
+        self.timer = Timer()
+        if properties.config.env_sample_seconds > 0:
+            self.start(i2c)
+
+    def start(self, i2c):
+        try:
+            # Only boards with the sensor pay for the driver import
+            import board
+            from adafruit_bme280 import advanced as adafruit_bme280
+
+            sensor = adafruit_bme280.Adafruit_BME280_I2C(board.I2C() if i2c is None else i2c,
+                                                         address=self.properties.config.env_i2c_address)
+            sensor.overscan_temperature = adafruit_bme280.OVERSCAN_X16
+            sensor.overscan_humidity = adafruit_bme280.OVERSCAN_X16
+            sensor.overscan_pressure = adafruit_bme280.OVERSCAN_X16
+            sensor.iir_filter = adafruit_bme280.IIR_FILTER_X16
+            sensor.standby_period = adafruit_bme280.STANDBY_TC_1000
+            sensor.mode = adafruit_bme280.MODE_NORMAL
+            self.sensor = sensor
+            self.debug.print_info("env", "BME280 at 0x%x", self.properties.config.env_i2c_address)
+        except Exception as e:
+            self.debug.print_warning("env", "No BME280, environment not sampled: %s", str(e))
+
+    def enabled(self):
+        return self.sensor is not None
+
+    # Called every loop, after the control and network work. busy while a pump runs.
+    def tick(self, busy: bool):
+        seconds = self.properties.config.env_sample_seconds
+        if self.sensor is None or busy or seconds == 0:
+            return
+        if self.timer.is_timing() and not self.timer.is_timed_out():
+            return
+        self.timer.start_timer(seconds)
+        try:
+            values = (self.sensor.temperature, self.sensor.relative_humidity, self.sensor.pressure)
+        except Exception as e:
+            self.errors += 1
+            self.debug.print_warning("env", "BME280 read error: %s", str(e))
+            return
+        slot = self.count % WINDOW
+        for i in range(len(QUANTITIES)):
+            self.readings[i][slot] = max(-32768, min(32767, int(round(values[i] * SCALES[i]))))
+        self.count += 1
+        self.debug.print_debug("env", "%.2f C %.2f %% %.1f hPa", values[0], values[1], values[2])
+
+    # The last reading of quantity i in its unit, None before the first one
+    def last(self, i: int):
+        if self.count == 0:
+            return None
+        return self.readings[i][(self.count - 1) % WINDOW] / SCALES[i]
+
+    # {"samples", "errors", quantity: [last, min, mean, max]} over the window, None when there is no sensor
+    def summary(self):
+        if self.sensor is None:
+            return None
+        summary = {"samples": self.count, "errors": self.errors}
+        size = min(self.count, WINDOW)
+        for i in range(len(QUANTITIES)):
+            if size == 0:
+                summary[QUANTITIES[i]] = None
+                continue
+            readings = self.readings[i]
+            low = high = total = readings[0]
+            for j in range(1, size):
+                value = readings[j]
+                low = min(low, value)
+                high = max(high, value)
+                total += value
+            scale = SCALES[i]
+            summary[QUANTITIES[i]] = [self.last(i), low / scale, round(total / size / scale, 2), high / scale]
+        return summary
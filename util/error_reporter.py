@@ -0,0 +1,125 @@
+import time
+
+from util.debug import Debug
+from util.outbound_queue import TokenBucket
+
+# Error reports sent per second and burst
+ERROR_LIMIT = (1 / 30, 3)
+SUMMARY_SECONDS = 60  # Repeats of an error already sent are summed up and sent at most this often
+MAX_ERRORS = 16  # Different errors kept, the oldest is dropped beyond this
+
+# Entry fields
+ACTION = 0
+ERROR = 1
+STATION = 2
+EVENT_ID = 3
+COUNT = 4  # Occurrences not sent yet
+FIRST = 5  # When the first of them happened
+LAST = 6
+SENT = 7  # When this error was last sent, None before that
+
+OUTCOMES = ("reported", "sent", "merged", "dropped")
+
+
+# The exception type in an error text, e.g. "OSError" in "['Traceback ...', 'OSError: [Errno 113] ECONNABORTED']".
+# Texts without one (e.g. "Elapsed: 40.2") go by what is in front of the first colon, without the numbers.
+def error_kind(error):
+    if error is None:
+        return ""
+    text = str(error)
+    end = -1
+    for name in ("Error:", "Exception:", "Error", "Exception"):
+        end = text.rfind(name)
+        if end >= 0:
+            end += len(name.rstrip(":"))
+            break
+    if end < 0:
+        return "".join([c for c in text.split(":", 1)[0][:32] if not c.isdigit()])
+    start = end - 1
+    while start > 0 and (text[start - 1].isalpha() or text[start - 1].isdigit() or text[start - 1] == "_"):
+        start -= 1
+    return text[start:end]
+
+
+# Collects the errors do_error_post is called with and sends them from the main loop, one per loop at most.
+# Before this every error was posted where it happened: ping, then up to 3 tries 2 s apart, so during an outage
+# every failing request added its own error post (which failed the same way) and the loop stood still for minutes.
+#
+# An error is identified by its station, action and exception type:
+#   - the first one is sent on the next loop with a free token (ERROR_LIMIT)
+#   - repeats are counted, and sent as one report with "count" and "overSeconds" SUMMARY_SECONDS after the last
+#     report of that error
+# A report is tried once, one that fails stays for a later loop. report() never touches the network.
+class ErrorReporter:
+    def __init__(self, debug: Debug, limit=ERROR_LIMIT):
+        self.debug = debug
+        self.bucket = TokenBucket(limit[0], limit[1])
+        self.errors = {}  # fingerprint -> [action, error, station, event id, count, first, last, sent]
+        self.stats = [0, 0, 0, 0]  # OUTCOMES
+
+    def report(self, action, error, station, event_id):
+        now = time.monotonic()
+        fingerprint = "%s|%s|%s" % (station, action, error_kind(error))
+        entry = self.errors.get(fingerprint)
+        if entry is None:
+            if len(self.errors) >= MAX_ERRORS:
+                self.drop_oldest()
+            entry = [action, error, station, event_id, 0, now, now, None]
+            self.errors[fingerprint] = entry
+        elif entry[COUNT] > 0 or entry[SENT] is not None:
+            self.stats[2] += 1
+        if entry[COUNT] == 0:
+            entry[FIRST] = now
+        entry[COUNT] += 1
+        entry[ERROR] = error
+        entry[EVENT_ID] = event_id
+        entry[LAST] = now
+        self.stats[0] += 1
+        self.debug.print_debug("errors", "%s %s, %d pending", fingerprint, lambda: entry[COUNT], lambda: self.pending())
+
+    # Makes room: an error with nothing left to send goes first, else the one waiting longest
+    def drop_oldest(self):
+        oldest = None
+        for fingerprint, entry in self.errors.items():
+            key = (entry[COUNT] > 0, entry[LAST])
+            if oldest is None or key < oldest[0]:
+                oldest = (key, fingerprint)
+        dropped = self.errors.pop(oldest[1])
+        if dropped[COUNT] > 0:
+            self.stats[3] += dropped[COUNT]
+            self.debug.print_warning("errors", "Too many errors, dropped %s", oldest[1])
+
+    # The error to send now, oldest first, or None when nothing is due or over the rate
+    def next_due(self):
+        now = time.monotonic()
+        due = None
+        for entry in self.errors.values():
+            if entry[COUNT] == 0 or (entry[SENT] is not None and now - entry[SENT] < SUMMARY_SECONDS):
+                continue
+            if due is None or entry[FIRST] < due[FIRST]:
+                due = entry
+        if due is None or not self.bucket.take():
+            return None
+        return due
+
+    def sent(self, entry):
+        self.stats[1] += 1
+        entry[COUNT] = 0
+        entry[SENT] = time.monotonic()
+
+    def pending(self):
+        count = 0
+        for entry in self.errors.values():
+            count += entry[COUNT]
+        return count
+
+    # {outcome: count}, pending is the occurrences not sent yet
+    def summary(self):
+        summary = {"pending": self.pending()}
+        for i in range(len(OUTCOMES)):
+            summary[OUTCOMES[i]] = self.stats[i]
+        return summary
+
+    # [(labels, value)] per outcome, for the MetricsServer
+    def metric_values(self):
+        return [('outcome="%s"' % OUTCOMES[i], self.stats[i]) for i in range(len(OUTCOMES))]
@@ -0,0 +1,171 @@
+import time
+from array import array
+
+HISTORY = 32  # Transitions kept in the rolling buffer
+FAST_ALPHA = 0.3  # EWMA weight of the latest fill/drain time
+SLOW_ALPHA = 0.05  # Long term baseline for the drain time
+DEGRADED_RATIO = 1.25  # Recent drain time this much above the baseline flags the pump
+MIN_DRAINS = 5  # Drains seen before the trend is trusted
+MIN_PHASE_SECONDS = 2  # Shorter fills/drains are float bounce, not a measurement
+
+# Transition codes in the buffer: source * 2 + new value
+BOTTOM = 0
+TOP = 1
+PUMP = 2
+NAMES = ("bottom", "top", "pump")
+
+
+def now_ms():
+    return time.monotonic_ns() // 1000000
+
+
+# Learns how fast the reservoir fills and how fast the pump empties it, from the float (and pump) transitions.
+#
+# Every transition is kept as (ms since start, code) in two small arrays, newest overwriting oldest.
+# The estimates are updated incrementally when a transition completes a phase:
+#   fill  - bottom float wet -> top float wet, pump off. The inflow rate is 1 band (bottom..top) per fill time.
+#   drain - pump on -> bottom float dry. The pump rate is the drain rate plus the inflow it works against.
+# From those it predicts when the top float will trip, and it flags a degrading pump when the recent drain time
+# trends above the long term baseline.
+# Analog readings (add_level) refine the prediction with the measured slope when a sensor is fitted.
+class FillRateModel:
+    def __init__(self, history: int = HISTORY):
+        self.start_ms = now_ms()
+        self.times = array("L", [0] * history)
+        self.codes = array("B", [0] * history)
+        self.history = history
+        self.index = 0
+        self.count = 0
+        self.states = [None, None, None]
+
+        self.bottom_wet_at = None
+        self.pump_on_at = None
+        self.fill_seconds = None
+        self.drain_seconds = None
+        self.drain_baseline = None
+        self.fills = 0
+        self.drains = 0
+        self.degraded = False
+
+        self.last_level = None
+        self.last_level_ms = None
+        self.level_slope = None  # level units per second, EWMA
+        self.top_level = None
+
+    # Call every check with the current float readings and pump relay state. Returns True on any transition.
+    def observe(self, bottom_wet: bool, top_wet: bool, pump_running: bool, at_ms: int = None):
+        if at_ms is None:
+            at_ms = now_ms()
+        changed = False
+        # A pump that just stopped is handled before the floats (the refill starts with it off),
+        # a pump that just started after them (the top float trip that started it ends a fill)
+        if pump_running:
+            order = ((BOTTOM, bottom_wet), (TOP, top_wet), (PUMP, pump_running))
+        else:
+            order = ((PUMP, pump_running), (BOTTOM, bottom_wet), (TOP, top_wet))
+        for source, value in order:
+            if self.states[source] is None:
+                self.states[source] = value
+            elif self.states[source] != value:
+                self.states[source] = value
+                self.transition(source, value, at_ms)
+                changed = True
+        return changed
+
+    def transition(self, source: int, value: bool, at_ms: int):
+        self.times[self.index] = (at_ms - self.start_ms) & 0xFFFFFFFF
+        self.codes[self.index] = source * 2 + (1 if value else 0)
+        self.index = (self.index + 1) % self.history
+        self.count += 1
+
+        if source == BOTTOM and value and not self.states[PUMP]:
+            self.bottom_wet_at = at_ms
+        elif source == TOP and value and self.bottom_wet_at is not None and not self.states[PUMP]:
+            seconds = (at_ms - self.bottom_wet_at) / 1000
+            if seconds >= MIN_PHASE_SECONDS:
+                self.fill_seconds = self.ewma(self.fill_seconds, seconds, FAST_ALPHA)
+                self.fills += 1
+            self.bottom_wet_at = None
+        elif source == PUMP and value:
+            self.pump_on_at = at_ms
+            self.bottom_wet_at = None
+        elif source == BOTTOM and not value and self.pump_on_at is not None:
+            seconds = (at_ms - self.pump_on_at) / 1000
+            if seconds >= MIN_PHASE_SECONDS:
+                self.add_drain(seconds)
+            self.pump_on_at = None
+        elif source == PUMP and not value:
+            self.pump_on_at = None
+
+    def add_drain(self, seconds: float):
+        self.drain_seconds = self.ewma(self.drain_seconds, seconds, FAST_ALPHA)
+        self.drain_baseline = self.ewma(self.drain_baseline, seconds, SLOW_ALPHA)
+        self.drains += 1
+        self.degraded = self.drains >= MIN_DRAINS and self.drain_seconds > self.drain_baseline * DEGRADED_RATIO
+
+    @staticmethod
+    def ewma(current, sample, alpha):
+        if current is None:
+            return sample
+        return current + alpha * (sample - current)
+
+    # Analog level reading, top_level is the level at which the top float trips
+    def add_level(self, level: float, top_level: float = None, at_ms: int = None):
+        if at_ms is None:
+            at_ms = now_ms()
+        if top_level is not None:
+            self.top_level = top_level
+        if self.last_level is not None and at_ms > self.last_level_ms and not self.states[PUMP]:
+            slope = (level - self.last_level) * 1000 / (at_ms - self.last_level_ms)
+            self.level_slope = self.ewma(self.level_slope, slope, FAST_ALPHA)
+        self.last_level = level
+        self.last_level_ms = at_ms
+
+    # Inflow in bands (bottom float to top float) per hour
+    def inflow_per_hour(self):
+        if not self.fill_seconds:
+            return None
+        return 3600 / self.fill_seconds
+
+    # Pump capacity in bands per hour: it drains the band while the inflow keeps adding to it
+    def pump_per_hour(self):
+        if not self.drain_seconds:
+            return None
+        inflow = self.inflow_per_hour() or 0
+        return 3600 / self.drain_seconds + inflow
+
+    # Seconds until the top float is expected to trip, None when it can't be predicted (not filling, no history)
+    def seconds_until_top_trip(self, at_ms: int = None):
+        if self.states[PUMP] or self.states[TOP]:
+            return None
+        if at_ms is None:
+            at_ms = now_ms()
+        if self.top_level is not None and self.last_level is not None and self.level_slope and self.level_slope > 0:
+            return max(0, (self.top_level - self.last_level) / self.level_slope)
+        if self.bottom_wet_at is None or self.fill_seconds is None:
+            return None
+        return max(0, self.fill_seconds - (at_ms - self.bottom_wet_at) / 1000)
+
+    # Oldest first [(seconds since start, "bottom"/"top"/"pump", value)], for debugging
+    def transitions(self):
+        result = []
+        filled = min(self.count, self.history)
+        for n in range(filled):
+            i = (self.index - filled + n) % self.history
+            result.append((self.times[i] / 1000, NAMES[self.codes[i] // 2], self.codes[i] % 2 == 1))
+        return result
+
+    # Sent in the status object
+    def summary(self):
+        trip = self.seconds_until_top_trip()
+        return {
+            "fill_s": None if self.fill_seconds is None else round(self.fill_seconds, 1),
+            "drain_s": None if self.drain_seconds is None else round(self.drain_seconds, 1),
+            "drain_baseline_s": None if self.drain_baseline is None else round(self.drain_baseline, 1),
+            "inflow_per_h": None if self.fill_seconds is None else round(self.inflow_per_hour(), 2),
+            "pump_per_h": None if self.drain_seconds is None else round(self.pump_per_hour(), 2),
+            "top_trip_in_s": None if trip is None else round(trip),
+            "pump_degraded": self.degraded,
+            "fills": self.fills,
+            "drains": self.drains
+        }
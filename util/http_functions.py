@@ -1,21 +1,26 @@
 import os
-import gc
 # import uuid
 import ipaddress
 import json
-import ssl
 import time
 from traceback import format_exception
 
-import adafruit_requests
-import microcontroller
 import socketpool
 import wifi
 
 from util.debug import Debug
 from util.properties import Properties
-from util.common import CommonFunctions
+from util.common import BOOT_NONCE, CommonFunctions
+from util.error_reporter import ACTION, COUNT, ERROR, EVENT_ID, FIRST, LAST, STATION, ErrorReporter
+from util.dns_cache import DnsCache
+from util.network_recovery import NetworkRecovery
+from util.radio_power import RadioPower
 from util.simple_timer import Timer
+from util.time_series_log import HTTP
+
+
+# Seconds between the tries of a post. Short: a post is safe to send again (see do_post)
+RETRY_SECONDS = (0.25, 0.5)
 
 
 def get_response_text(response):
@@ -39,14 +44,28 @@ class HttpFunctions:
         self.debug.print_debug("-->http","init in HttpFunctions")
         self.ip_address = "None"
         self.event_id = "None"
+        self.station = None  # Set by the station's RemoteEventNotifier before each post when there are several
         self.remote_url = os.getenv("REMOTE_URL")
         self.last_status_code = 200  # FYI - Used in display in code.py
         self.last_error = "N"
         self.need_to_connect = True
         self.last_action = None
         self.remote_cmd = None
+        self.remote_config = None  # Versioned config patch from the last mission response, cleared once applied
         self.error_timer = Timer()
-        self.get_pool()
+        # The network is brought up from the main loop by bring_up_network(), one step per loop,
+        # so the floats are read and the pump can run while Wi-Fi is still coming up
+        self.network_ready = False
+        self.bring_up_timer = Timer()
+        self.boot_timings = {}  # ms spent in each bring-up step, sent in the startup notification
+        self.history = None  # TimeSeriesLog, every request outcome is recorded when set
+        self.pushed = {}  # station name -> reply the remote sent outside a request, see poll()
+        self.errors = ErrorReporter(debug)
+        self.sequence = 0  # Of the mission posts since boot, see next_sequence
+        self.request_seq = None  # Set by the RemoteEventNotifier for the post, like station and event_id
+        self.recovery = NetworkRecovery(self, debug)  # Takes over once requests or pings keep failing
+        self.dns = DnsCache(properties, debug)  # The sessions get this in place of the pool
+        self.radio_power = RadioPower(self, debug)  # Every association goes through it
 
     # ***********************
     # Low level get and post functions
@@ -58,7 +77,7 @@ class HttpFunctions:
         if not self.success(connect_response):
             return connect_response
 
-        self.debug.print_debug("-->http","Get "+caller_id+", url: " + url)
+        self.debug.print_debug("-->http","Get %s, url: %s", caller_id, url)
 
         tries = 0
         last_exception = None
@@ -68,8 +87,8 @@ class HttpFunctions:
             try:
                 response = self.requests.get(url)
                 if hasattr(response, "status_code"):
-                    self.debug.print_debug("-->http",
-                                           caller_id + " get elapsed " + CommonFunctions.format_elapsed_ms(start_time))
+                    self.debug.print_debug("-->http", "%s get elapsed %s", caller_id,
+                                           lambda: CommonFunctions.format_elapsed_ms(start_time))
                     self.process_response(response,caller_id+" get return code ", tries, start_time)
                     self.transaction_count += 1
                     return {
@@ -89,54 +108,66 @@ class HttpFunctions:
                 }
 
             except Exception as e:
-                error = str(format_exception(e))
-                self.debug.print_debug("-->http","GET Error "+caller_id+". Error: "+error)
+                self.debug.print_warning("-->http","GET Error %s. Error: %s", caller_id, lambda: str(format_exception(e)))
                 tries += 1
                 last_exception = e  # Can't be too long for display, may need to truncate
                 self.last_status_code = 0
-                self.need_to_connect = True
                 time.sleep(3)
 
-        self.debug.print_debug("-->http", "do_get "+caller_id+" Error -- Error: " + str(format_exception(last_exception)))
+        self.debug.print_error("-->http", "do_get %s Error -- Error: %s", caller_id,
+                               lambda: str(format_exception(last_exception)))
         self.last_error = str(last_exception)  # Can't be too long for display, may need to truncate
         self.do_error_post("get")
-        self.need_to_connect = True
+        self.record_outcome(0)
         self.error_count += 1
-
-        if self.error_count > 20:
-            microcontroller.reset()  # When 20 error threshold is hit, then reboot the device.
+        self.recovery.failed()
         return {
             "status_code": 0,
             "text": "Couldn't Get"
         }
 
     # ***********************
+    # post_body is either json-able data or an already serialized body (bytes, bytearray or memoryview)
     def do_post(self, url, headers, post_body, caller_id:str):
+        # The remote host didn't resolve a moment ago, the post (and the ping before it) would only fail again
+        host = url.split("/")[2]
+        if self.dns.unresolved(host):
+            self.debug.print_debug("-->http", "%s not sent, %s doesn't resolve", caller_id, host)
+            self.last_error = "Unresolved " + host
+            self.last_status_code = 0
+            return {
+                "status_code": 0,
+                "text": "Unresolved"
+            }
+
         connect_response = self.check_connection()
         if not self.success(connect_response):
-            self.debug.print_debug("-->http",caller_id+" not success check_connection: code " + str(connect_response["status_code"])+ ", " + get_response_text(connect_response))
+            self.debug.print_warning("-->http","%s not success check_connection: code %s, %s", caller_id,
+                                     connect_response["status_code"], lambda: get_response_text(connect_response))
             return connect_response
 
-        self.debug.print_debug("-->http","Post "+caller_id+" url: " + url+", post_body " + str(post_body))
+        if isinstance(post_body, (bytes, bytearray, memoryview)):
+            data = post_body
+            self.debug.print_debug("-->http","Post %s url: %s, post_body %d bytes", caller_id, url, len(post_body))
+        else:
+            data = json.dumps(post_body)
+            self.debug.print_debug("-->http","Post %s url: %s, post_body %s", caller_id, url, post_body)
 
         last_exception = None
         tries = 0
-        # Wi-Fi can be a little flaky so try a few times before recording an error
+        # Wi-Fi can be a little flaky so try a few times before recording an error.
+        # Every post is safe to repeat, the remote drops a mission post it already has by its idempotencyKey and
+        # a debug chunk by its stream offset. So a slow try is cut off after post_timeout and sent again soon,
+        # instead of waiting out the 60 s default of adafruit_requests and 2 s between tries.
         while tries < 3:
             try:
                 start_time = time.monotonic()
-                response = self.requests.post(url=url, headers=headers, data=json.dumps(post_body))
-                self.debug.print_debug("-->http","post reply elapsed " + CommonFunctions.format_elapsed_ms(start_time))
+                response = self.requests.post(url=url, headers=headers, data=data,
+                                              timeout=self.properties.config.post_timeout)
+                self.debug.print_debug("-->http","post reply elapsed %s", lambda: CommonFunctions.format_elapsed_ms(start_time))
                 if hasattr(response, "status_code"):
                     try:
-                        res = json.loads(response.text)
-                        if "eventId" in res:
-                            self.event_id = res["eventId"]
-                            self.debug.print_debug("-->http","Got remote eventId " + self.event_id)
-                        if "cmd" in res:
-                            self.remote_cmd = res["cmd"]
-                        else:
-                            self.remote_cmd = None
+                        self.apply_reply(json.loads(response.text))
                     except Exception as e:
                         self.remote_cmd = None
 
@@ -149,7 +180,7 @@ class HttpFunctions:
                     }
                 else:
                     self.last_status_code = 0
-                    self.debug.print_debug("-->http","Post: Unknown response. type: " + type(response) + " - dir: ".join(dir(response)))
+                    self.debug.print_warning("-->http","Post: Unknown response. type: %s - dir: %s", type(response), lambda: dir(response))
                     self.last_error = "Post: Unknown response. type: " + type(response) + " - dir: ".join(dir(response))
                     return {
                         "status_code": 0,
@@ -157,22 +188,20 @@ class HttpFunctions:
                     }
 
             except Exception as e:
-                error = str(format_exception(e))
-                # self.debug.print_debug("-->http","POST Error "+caller_id+". Error: "+error)
+                # self.debug.print_debug("-->http","POST Error %s. Error: %s", caller_id, lambda: str(format_exception(e)))
                 tries += 1
                 last_exception = e  # Can't be too long for display, may need to truncate
                 self.last_status_code = 0
-                self.need_to_connect = True
-                time.sleep(2)
+                if tries < 3:
+                    time.sleep(RETRY_SECONDS[tries - 1])
 
         self.last_error = str(last_exception)  # Can't be too long for display, may need to truncate
         formatted_exception = str(format_exception(last_exception))
-        self.debug.print_debug("-->http", "do_post "+caller_id+". Failed")
-        self.do_error_post("post", formatted_exception)#Since post failed, this may fail as well, but try anyway
-        self.need_to_connect = True
+        self.debug.print_error("-->http", "do_post %s. Failed", caller_id)
+        self.do_error_post("post", formatted_exception)  # Sent from the main loop, see ErrorReporter
+        self.record_outcome(0)
         self.error_count += 1
-        if self.error_count > 20:
-            microcontroller.reset()  # When 20 error threshold is hit, then reboot the device.
+        self.recovery.failed()
         return {
             "status_code": 0,
             "text": "Couldn't Post"
@@ -192,119 +221,138 @@ class HttpFunctions:
     def do_action_post(self, api_action: str, pump_state: str, misc_status):
         headers = {'Content-Type': 'application/json'}
 
-        # Don't change the contents of post_body without coordinating with the server side
-        post_body = {"action": api_action, "eventId": self.event_id, "pumpState": pump_state,
-                     "componentId": str(self.properties.defaults["component_id"]),
-                     "miscStatus": misc_status, "errorCount": str(self.error_count)}
-
         # eventid = str(uuid.uuid4())
         url = '{}/component/mission?mission=Pump1Mission'.format(self.remote_url)
 
-        return self.do_post(url, headers, post_body,"debug_action_post")
-
-    # ***********************
-    def do_debug_log_post(self, log_lines):
-        if self.requests is None or log_lines is None:
-            return {
-                "status_code": 0,
-                "text": "Couldn't do_log_post"
-            }
-        if len(log_lines) <1:
-            # No debug lines, not an error, return success
-            self.debug.print_debug("-->http", "NO LOG LINES.")
-            return {
-                "status_code": 200,
-                "text": ""
-            }
-
-        headers = {'Content-Type': 'application/json'}
+        return self.do_post(url, headers, self.action_body(api_action, pump_state, misc_status),"debug_action_post")
 
-        post_body = []
-        if isinstance(log_lines, list):
-            # self.debug.print_debug("-->http", "making post body, "+str(len(log_lines))+" size.")
-            for log_line in log_lines:
-                post_body.append(log_line)
+    # Don't change the contents of post_body without coordinating with the server side
+    def action_body(self, api_action: str, pump_state: str, misc_status):
+        post_body = {"action": api_action, "eventId": self.event_id, "pumpState": pump_state,
+                     "componentId": self.properties.config.component_id,
+                     "miscStatus": misc_status, "errorCount": str(self.error_count)}
+        if self.station is not None:
+            post_body["station"] = self.station
+        if self.request_seq is not None:
+            post_body["seq"] = self.request_seq
+            post_body["idempotencyKey"] = "{}-{}-{}".format(self.properties.config.component_id, BOOT_NONCE,
+                                                            self.request_seq)
+        return post_body
+
+    # Sequence number of a new mission post. Its retries (do_post's and the outbound queue's) keep the number, so
+    # the remote can tell a repeat from a new post.
+    def next_sequence(self):
+        self.sequence += 1
+        return self.sequence
+
+    def error_body(self, action, error=None):
+        post_body = {"type": "error", "eventId": self.event_id, "componentId": "1",
+                     "action": action,
+                     "errorCount": str(self.error_count), "lastError": error}
+        if self.station is not None:
+            post_body["station"] = self.station
+        return post_body
+
+    # The remote's answer to a mission post: the event id, a command and maybe a config patch
+    def apply_reply(self, res: dict):
+        if "eventId" in res:
+            self.event_id = res["eventId"]
+            self.debug.print_debug("-->http","Got remote eventId %s", self.event_id)
+        if "cmd" in res:
+            self.remote_cmd = res["cmd"]
         else:
-            # self.debug.print_debug("-->http", "making post body, single line.")
-            post_body.append(log_lines)
-
-        url = '{}/component/debug?mission=Pump1Mission'.format(self.remote_url)
-
-        return self.do_post(url, headers, post_body,"debug_log_post")
+            self.remote_cmd = None
+        if "config" in res and res["config"] is not None:
+            self.remote_config = res["config"]
+
+    # One chunk of the debug log stream, see LogUploader
+    def do_debug_post(self, stream_id: str, sequence: int, headers: dict, body):
+        url = '{}/component/debug?mission=Pump1Mission&stream={}&seq={}'.format(self.remote_url, stream_id, sequence)
+        return self.do_post(url, headers, body, "debug_log_post")
+
+    # Called once per main loop. Replies only come back with the response here, a transport with a push channel
+    # (MqttFunctions) delivers what the remote sent on its own into pushed.
+    def poll(self):
+        return
 
     # ***********************
-    # It's important that this doesn't call do_post because it causes an infinite loop.
+    # Only records the error, it is sent later from the main loop by send_next_error (see ErrorReporter).
+    # It's important that sending doesn't call do_post because it causes an infinite loop.
     def do_error_post(self, action, error=None):
-        if self.requests is None:
-            return
-
-        start = time.monotonic()
-
-        if self.pool is None or self.ip_address is None:
-            self.debug.print_debug("*http*","do_error_post no connection")
-            return {
-                "status_code": 0,
-                "text": "Couldn't do_error_post"
-            }
+        self.errors.report(action, error, self.station, self.event_id)
+        return {
+            "status_code": 202,
+            "text": "Queued"
+        }
 
-        # If we can't ping, there is no reason to attempt a POST
-        if not self.ping_default():
-            self.need_to_connect = True
+    # Sends the next error report that is due, if any, for the station and event id it happened on
+    def send_next_error(self):
+        entry = self.errors.next_due()
+        if entry is None:
+            return None
+        station = self.station
+        event_id = self.event_id
+        self.station = entry[STATION]
+        self.event_id = entry[EVENT_ID]
+        post_body = self.error_body(entry[ACTION], entry[ERROR])
+        self.station = station
+        self.event_id = event_id
+        if entry[COUNT] > 1:
+            post_body["count"] = entry[COUNT]
+            post_body["overSeconds"] = int(entry[LAST] - entry[FIRST])
+        response = self.send_error(post_body)
+        if 200 <= response["status_code"] < 300:
+            self.errors.sent(entry)
+        return response
+
+    # One try, no ping and no sleep: a report that fails stays queued for a later loop
+    def send_error(self, post_body):
+        if self.requests is None or self.pool is None or self.ip_address is None:
+            self.debug.print_debug("*http*","send_error no connection")
             return {
                 "status_code": 0,
-                "text": "Ping Failed"
+                "text": "Couldn't send error"
             }
 
         start_time = time.monotonic()
-
         headers = {'Content-Type': 'application/json'}
-        post_body = {"type": "error", "eventId": self.event_id, "componentId": "1",
-                     "action": action,
-                     "errorCount": str(self.error_count), "lastError": error}
         url = '{}/component/error?mission=Pump1Mission'.format(self.remote_url)
-        self.debug.print_debug("-->http","Post url: " + url)
-        last_exception = None
-        tries = 0
-        # Wi-Fi can be a little flaky so try a few times before recording an error
-        while tries < 3:
-            try:
-                response = self.requests.post(url=url, headers=headers, data=json.dumps(post_body))
-                self.process_response(response,"error_post response code: ",tries, start_time)
-                self.transaction_count += 1
-                self.debug.print_debug("-->http","do_error_post elapsed " + CommonFunctions.format_elapsed_ms(start))
-                self.last_status_code = response.status_code
-                return {
-                    "status_code": response.status_code,
-                    "text": response.text
-                }
-            except Exception as e:
-                tries += 1
-                last_exception = e  # Can't be too long for display, may need to truncate
-                self.last_status_code = 0
-                time.sleep(2)
+        self.debug.print_debug("-->http","Post url: %s", url)
+        try:
+            response = self.requests.post(url=url, headers=headers, data=json.dumps(post_body))
+            self.process_response(response,"error_post response code: ", 0, start_time)
+            self.transaction_count += 1
+            self.last_status_code = response.status_code
+            return {
+                "status_code": response.status_code,
+                "text": response.text
+            }
+        except Exception as e:
+            self.last_error = str(e)  # Can't be too long for display, may need to truncate
+            self.debug.print_error("-->http","send_error Error -- Error:   error %s", lambda: str(format_exception(e)))
+            self.last_status_code = 0
+            self.record_outcome(0)
+            self.error_count += 1
+            self.recovery.failed()
+            return {
+                "status_code": 0,
+                "text": "Couldn't send error"
+            }
 
-        self.last_error = str(last_exception)  # Can't be too long for display, may need to truncate
-        formatted_exception = str(format_exception(last_exception))
-        self.debug.print_debug("-->http","do_error_post Error -- Error:  " + " error " + formatted_exception)
-        self.need_to_connect = True
-        self.error_count += 1
-        if self.error_count > 200:
-            microcontroller.reset()  # When 200 error threshold is hit, then reboot the device.
-        return {
-            "status_code": 0,
-            "text": "Couldn't send error"
-        }
     # ***********************
     # Support functions
     # ***********************
     def last_http_status_success(self):
+        if not self.network_ready:
+            # Still booting, don't let callers block in connect()
+            return False
         if (self.last_status_code >= 200 and self.last_status_code < 300) or self.error_timer.is_timed_out():
             if self.error_timer.is_timed_out():
                 # Goal here is to keep trying to do http every 30 seconds after an error
                 # A connect && pianf success cancels the error timer.
                 self.error_timer.reset_timer(60)
             return True
-        self.debug.print_debug("-->http", "last_http_status_success error: " + self.last_error)
+        self.debug.print_debug("-->http", "last_http_status_success error: %s", self.last_error)
         return False
 
     # ***********************
@@ -319,30 +367,36 @@ class HttpFunctions:
         return False
 
     # ***********************
-    def get_pool(self):
+    def get_pool(self, max_tries: int = 10):
         tries = 0
         # Wi-Fi can be a little flaky so try a few times before recording an error
-        while tries < 10:
+        while tries < max_tries:
             try:
                 self.pool = socketpool.SocketPool(wifi.radio)
+                self.dns.pool = self.pool
                 return
             except Exception as e:
                 self.pool = None
                 tries += 1
                 self.last_error = str(format_exception(e))
                 self.need_to_connect = True
-                self.debug.print_debug("-->http","GetPool error: "+self.last_error+". Tries: " + str(tries))
-                time.sleep(2)
-        self.debug.print_debug("-->http","**ERROR*** Failed to get SocketPool")
+                self.debug.print_warning("-->http","GetPool error: %s. Tries: %d", self.last_error, tries)
+                if tries < max_tries:
+                    time.sleep(2)
+        self.debug.print_error("-->http","**ERROR*** Failed to get SocketPool")
 
     # ***********************
-    def connect(self):
+    def connect(self, max_tries: int = 10):
+        # Only needed once there is something to connect, keeps them out of the boot path
+        import adafruit_requests
+        import ssl
+
         start = time.monotonic()
         tries = 0
         self.ip_address = None
-        while not self.ip_address and tries < 10:
+        while not self.ip_address and tries < max_tries:
             if self.pool is None:
-                self.get_pool()
+                self.get_pool(max_tries)
 
             if self.pool is None:
                 self.debug.print_debug("-->http","No pool")
@@ -355,13 +409,13 @@ class HttpFunctions:
 
             self.debug.print_debug("-->http","Connecting to WiFi...")
             try:
-                self.requests = adafruit_requests.Session(self.pool, ssl.create_default_context())
-                wifi.radio.connect(os.getenv("CIRCUITPY_WIFI_SSID"), os.getenv("CIRCUITPY_WIFI_PASSWORD"))
+                self.requests = adafruit_requests.Session(self.dns, ssl.create_default_context())
+                self.radio_power.associate(os.getenv("CIRCUITPY_WIFI_SSID"), os.getenv("CIRCUITPY_WIFI_PASSWORD"))
                 self.ip_address = str(wifi.radio.ipv4_address)
                 self.need_to_connect = False
                 self.last_status_code = 200
                 self.last_error = ""
-                self.debug.print_debug("-->http","Connected! IP: " + self.ip_address)
+                self.debug.print_info("-->http","Connected! IP: %s", self.ip_address)
                 if not self.ping(os.getenv("PING_IP")):
                     self.need_to_connect = True
                     return {
@@ -369,7 +423,7 @@ class HttpFunctions:
                         "text": "Ping Failed"
                     }
 
-                self.debug.print_debug("-->http","connect elapsed " + CommonFunctions.format_elapsed_ms(start))
+                self.debug.print_debug("-->http","connect elapsed %s", lambda: CommonFunctions.format_elapsed_ms(start))
                 self.error_timer.cancel_timer()
                 return {
                     "status_code": 200,
@@ -383,35 +437,122 @@ class HttpFunctions:
                 self.last_status_code = 0
                 self.last_error = str(format_exception(e))
                 self.need_to_connect = True
-                self.debug.print_debug("-->http","Connection Error:"+ self.last_error)
-                time.sleep(2)
-                gc.collect()
+                self.debug.print_warning("-->http","Connection Error:%s", self.last_error)
+                if tries < max_tries:
+                    time.sleep(2)
         self.error_timer.start_timer(60)
-        self.debug.print_debug("-->http","**ERROR***  Didn't Connect!")
-        self.debug.print_debug(self.last_error)
+        self.debug.print_error("-->http","**ERROR***  Didn't Connect!")
+        self.debug.print_error("-->http", self.last_error)
         self.do_error_post("connect", self.last_error)  # This will send self.last_error to remote
         return
 
+    # ***********************
+    # Non-blocking network bring-up, call once per main loop until it returns True.
+    # Each call does a single bounded step (socket pool, one Wi-Fi connect attempt, hello) and a failed step
+    # is retried on a later loop, so a slow access point never holds up reading the floats.
+    def bring_up_network(self):
+        if self.network_ready:
+            return True
+        if self.bring_up_timer.is_timing() and not self.bring_up_timer.is_timed_out():
+            return False
+
+        start = time.monotonic()
+        if self.pool is None:
+            step = "pool"
+            self.get_pool(1)
+            done = self.pool is not None
+        elif self.need_to_connect or self.ip_address in (None, "None"):
+            step = "connect"
+            self.connect(1)
+            done = not self.need_to_connect
+        else:
+            step = "hello"
+            response = self.do_hello()
+            if not self.success(response) and isinstance(response, dict):
+                self.debug.print_warning("-->http", "hello error  %s", response["text"])
+            # The hello is informational, carry on either way. Errors from here on go through the usual recovery.
+            done = True
+            self.network_ready = True
+
+        self.boot_timings[step] = self.boot_timings.get(step, 0) + int((time.monotonic() - start) * 1000)
+        if done:
+            self.bring_up_timer.cancel_timer()
+        else:
+            self.bring_up_timer.start_timer(2)
+        self.debug.print_debug("-->http", "bring_up_network %s done %s, timings %s", step, done, self.boot_timings)
+        return self.network_ready
+
     # ***********************
     def process_response(self, response, debug_txt, tries, start):
-        self.debug.print_debug("-->http",
-                               debug_txt + str(response.status_code) + " text " +
-                               get_response_text(response))
-        self.debug.print_debug("-->http", "tries " + str(tries))
+        self.debug.print_debug("-->http", "%s%s text %s", debug_txt, response.status_code,
+                               lambda: get_response_text(response))
+        self.debug.print_debug("-->http", "tries %d", tries)
 
-        self.debug.print_debug("-->http", "elapsed: "+CommonFunctions.format_elapsed_ms(start))
+        self.debug.print_debug("-->http", "elapsed: %s", lambda: CommonFunctions.format_elapsed_ms(start))
 
         self.last_status_code = response.status_code
         self.last_error = ""
+        self.record_outcome(response.status_code)
         if response.status_code < 200 or response.status_code > 299:
             self.last_error = "Remote code " + response.status_code
 
+    def record_outcome(self, status_code: int):
+        if self.history is not None:
+            self.history.record(HTTP, 0, status_code)
+        self.radio_power.traffic()
+        if 200 <= status_code < 300:
+            self.recovery.recovered()
+
+    # ***********************
+    # Recovery steps, cheapest first, see NetworkRecovery
+    # ***********************
+    def drop_session(self):
+        import adafruit_requests
+        import ssl
+
+        if self.pool is not None:
+            self.requests = adafruit_requests.Session(self.dns, ssl.create_default_context())
+
+    def renew_pool(self):
+        self.pool = None
+        self.get_pool(1)
+        self.drop_session()
+
+    def cycle_radio(self):
+        wifi.radio.enabled = False
+        wifi.radio.enabled = True
+        self.ip_address = None
+        self.need_to_connect = True
+
+    # connect() reads the SSID and password from settings.toml again
+    def reconnect_fresh(self):
+        try:
+            wifi.radio.stop_station()
+        except Exception as e:
+            self.debug.print_debug("-->http", "stop_station %s", str(e))
+        self.dns.flush()
+        self.radio_power.forget()
+        self.pool = None
+        self.ip_address = None
+        self.need_to_connect = True
+        self.connect(1)
+
+    # RadioPower, between transmissions while idle. The next check_connection() connects again.
+    def power_down_radio(self):
+        self.drop_session()
+        wifi.radio.enabled = False
+        self.pool = None
+        self.ip_address = None
+        self.need_to_connect = True
+
     # ***********************
     def check_connection(self):
         start = time.monotonic()
         try:
             if self.need_to_connect:
-                self.connect()
+                # Waking the radio is a single attempt like RadioPower.tick's, a gone access point would otherwise
+                # hold up the first post after a sleep for connect's 10 tries
+                self.connect(1 if self.radio_power.asleep else 10)
 
             if self.pool is None:
                 self.need_to_connect = True
@@ -432,19 +573,19 @@ class HttpFunctions:
                 }
 
             if not self.ping(os.getenv("PING_IP")):
-                self.need_to_connect = True
+                # Counted by ping(), NetworkRecovery decides when to reconnect
                 return {
                     "status_code": 0,
                     "text": "Ping Failed"
                 }
-            self.debug.print_debug("-->http","check_connection elapsed "+CommonFunctions.format_elapsed_ms(start))
+            self.debug.print_debug("-->http","check_connection elapsed %s", lambda: CommonFunctions.format_elapsed_ms(start))
             return {
                 "status_code": 200,
                 "text": "Connected"
             }
         except ConnectionError as e:
             self.last_error = str(format_exception(e))
-            self.debug.print_debug("-->http",self.last_error)
+            self.debug.print_error("-->http",self.last_error)
             self.do_error_post("check_connection", self.last_error)  # This will send self.last_error to remote
             return {
                 "status_code": 0,
@@ -468,7 +609,7 @@ class HttpFunctions:
     # ***********************
     def ping(self, ip):
         try:
-            self.debug.print_debug("-->http","Ping address ip "+ip)
+            self.debug.print_debug("-->http","Ping address ip %s", ip)
             ping_ip = ipaddress.IPv4Address(ip)
             tries = 0
             while tries < 5:
@@ -479,24 +620,23 @@ class HttpFunctions:
                     self.debug.print_debug("-->http", "Ping SUCCESS ")
                     self.error_timer.cancel_timer()
                     self.error_count = 0 # Reset. Things look good here.
+                    self.recovery.recovered(ping=True)
                     return True
                 else:
                     tries += 1
 
             self.last_error = "Ping Error"
             self.last_status_code = 0
-            self.debug.print_debug("-->http", "Ping FAIL ")
+            self.debug.print_warning("-->http", "Ping FAIL ")
         except Exception as e:
             self.last_error = str(e)# Can't be too long for display, may need to truncate
             self.last_status_code = 0
             # To avoid over communicating, just return false, if we get exception
             # If the connect to Wi-Fi failed, then this will fail as well
-            self.debug.print_debug("-->http","ping error "+str(format_exception(e)))
+            self.debug.print_warning("-->http","ping error %s", lambda: str(format_exception(e)))
 
         self.error_count += 1
-        if self.error_count > 40:
-            # Ping error count is likely higher here because this gets called until ping is successful.
-            # The get/post error only happens once ping is successful and an error occurs in the http call.
-            microcontroller.reset()  # When the 40 error threshold is hit, then reboot the device.
+        # Called every loop until the ping is back, so this is what climbs the recovery ladder while the link is down
+        self.recovery.failed(ping=True)
         self.error_timer.start_timer(30)
         return False
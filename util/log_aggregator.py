@@ -0,0 +1,113 @@
+import time
+
+from util.log_ring_buffer import LogRingBuffer
+
+# Most remote debug traffic is the same lines every tick (check_state, Ping SUCCESS, elapsed times...).
+# Only repeats that follow each other are collapsed, so the log keeps its order: a line repeated in a row, or a
+# block of lines (one tick's worth) repeated as a whole. Each line of the block becomes one record:
+#     <last line> [x<count> <first>-<last>s]
+# A pass of the block that breaks off part way is written out line by line after the folded block, e.g.
+# A,B,A,B,A,C gives "A [x2]", "B [x2]", A, C.
+# Timestamps are time.monotonic() seconds, so the remote can still place the record in time.
+# Callers can also be sampled, i.e. only 1 of every N of their lines is kept.
+
+MAX_OPEN_RECORDS = 16  # Longest block that is folded
+
+
+class LogAggregator:
+    def __init__(self, ring: LogRingBuffer, max_open_records: int = MAX_OPEN_RECORDS):
+        self.ring = ring
+        self.max_open_records = max_open_records
+        # The block, in order. Each entry is [caller, template, line, count, first_time, last_time]
+        self.open_records = []
+        # The lines of the current pass over the block, [caller, template, line, time], folded once it is complete
+        self.pass_lines = []
+        self.sample_rates = {}
+        self.sample_counters = {}
+        self.sampled_out = 0
+
+    # Keeps 1 of every rate lines from caller. None or 1 keeps every line.
+    def set_sample_rate(self, caller: str, rate: int):
+        if rate is None or rate <= 1:
+            self.sample_rates.pop(caller, None)
+            self.sample_counters.pop(caller, None)
+        else:
+            self.sample_rates[caller] = rate
+            self.sample_counters[caller] = 0
+
+    def add(self, caller: str, template: str, line: str):
+        rate = self.sample_rates.get(caller)
+        if rate is not None:
+            counter = self.sample_counters[caller]
+            self.sample_counters[caller] = (counter + 1) % rate
+            if counter != 0:
+                self.sampled_out += 1
+                return
+        self.fold(caller, template, line, time.monotonic())
+
+    def fold(self, caller: str, template: str, line: str, now):
+        records = self.open_records
+        position = len(self.pass_lines)
+        if position < len(records) and records[position][1] == template and records[position][0] == caller:
+            # The next line of the block
+            self.pass_lines.append([caller, template, line, now])
+            if len(self.pass_lines) == len(records):
+                for i in range(len(records)):
+                    record = records[i]
+                    record[2] = self.pass_lines[i][2]
+                    record[3] += 1
+                    record[5] = self.pass_lines[i][3]
+                self.pass_lines = []
+            return
+
+        if position == 0 and (not records or records[0][3] == 1):
+            # Still the first pass: the block grows, or starts over at the line that came again
+            start = self.index(caller, template)
+            if start < 0 and len(records) < self.max_open_records:
+                records.append([caller, template, line, 1, now, now])
+                return
+            if start > 0:
+                for record in records[:start]:
+                    self.close_record(record)
+                self.open_records = records[start:]
+                self.fold(caller, template, line, now)
+                return
+
+        # The order broke: the block is done, the lines of the broken pass start the next one
+        pass_lines = self.pass_lines
+        for record in records:
+            self.close_record(record)
+        self.clear()
+        for pass_line in pass_lines:
+            self.fold(pass_line[0], pass_line[1], pass_line[2], pass_line[3])
+        self.fold(caller, template, line, now)
+
+    # Where caller's template is in the block, -1 if it isn't
+    def index(self, caller: str, template: str):
+        for i in range(len(self.open_records)):
+            record = self.open_records[i]
+            if record[1] == template and record[0] == caller:
+                return i
+        return -1
+
+    # Writes the block and the lines of an unfinished pass to the ring buffer
+    def flush(self):
+        if not self.open_records:
+            return
+        for record in self.open_records:
+            self.close_record(record)
+        for pass_line in self.pass_lines:
+            self.ring.append(pass_line[0], pass_line[2])
+        self.open_records = []
+        self.pass_lines = []
+
+    # Drops what is open without writing it
+    def clear(self):
+        self.open_records = []
+        self.pass_lines = []
+
+    def close_record(self, record):
+        if record[3] == 1:
+            self.ring.append(record[0], record[2])
+        else:
+            self.ring.append(record[0], "%s [x%d %.1f-%.1fs]" % (record[2], record[3], record[4], record[5]))
@@ -0,0 +1,160 @@
+# Fixed-capacity, bytearray-backed FIFO for remote debug lines.
+#
+# Record layout: [length high byte, length low byte, category slot] + utf-8 line bytes.
+# Drop policy:
+#   - When the buffer is full, the oldest records are dropped to make room (oldest-first).
+#   - Each category has a byte quota (default: half the buffer). A line that would push its category over
+#     quota is dropped instead, so one chatty caller can't push every other caller out of the buffer.
+# Lines are only freed by ack(), after the remote post succeeded.
+
+HEADER_SIZE = 3
+MAX_CATEGORIES = 32
+OTHER_CATEGORY = "other"
+
+
+class LogRingBuffer:
+    def __init__(self, capacity: int = 8192, max_line_bytes: int = 240, default_quota: int = None):
+        self.capacity = capacity
+        self.max_line_bytes = min(max_line_bytes, capacity - HEADER_SIZE)
+        self.default_quota = capacity // 2 if default_quota is None else default_quota
+        self.buffer = bytearray(capacity)
+        self.head = 0  # Offset of the oldest record
+        self.used = 0  # Bytes in use
+        self.count = 0  # Records in use
+        self.head_sequence = 0  # Sequence number of the oldest record, used by ack()
+        self.categories = []
+        self.category_bytes = []
+        self.category_dropped = []
+        self.quotas = {}
+        self.dropped = 0
+
+    # Sets the byte quota for one category. None restores the default quota.
+    def set_quota(self, category: str, quota_bytes: int):
+        if quota_bytes is None:
+            self.quotas.pop(category, None)
+        else:
+            self.quotas[category] = quota_bytes
+
+    def append(self, category: str, line: str):
+        data = line.encode()
+        if len(data) > self.max_line_bytes:
+            data = data[:self.max_line_bytes]
+        size = HEADER_SIZE + len(data)
+
+        slot = self.category_slot(category)
+        if self.category_bytes[slot] + size > self.quotas.get(self.categories[slot], self.default_quota):
+            self.category_dropped[slot] += 1
+            self.dropped += 1
+            return False
+
+        while self.capacity - self.used < size:
+            self.drop_oldest()
+
+        tail = (self.head + self.used) % self.capacity
+        self.write_bytes(tail, bytes((len(data) >> 8, len(data) & 0xFF, slot)))
+        self.write_bytes((tail + HEADER_SIZE) % self.capacity, data)
+        self.used += size
+        self.count += 1
+        self.category_bytes[slot] += size
+        return True
+
+    # Returns (first_sequence, lines) for up to max_count pending records, oldest first.
+    # Nothing is freed, pass first_sequence + len(lines) to ack() once the lines have been delivered.
+    def snapshot(self, max_count: int = None):
+        lines = []
+        for line in self.iter_lines(max_count):
+            lines.append(line)
+        return self.head_sequence, lines
+
+    # Yields pending lines oldest first without copying the whole buffer
+    def iter_lines(self, max_count: int = None):
+        offset = self.head
+        remaining = self.count if max_count is None else min(max_count, self.count)
+        sequence = self.head_sequence
+        while remaining > 0:
+            # Records can be dropped while a caller is iterating (e.g. new lines logged during a post)
+            if sequence < self.head_sequence:
+                return
+            length, slot = self.read_header(offset)
+            data = self.read_bytes((offset + HEADER_SIZE) % self.capacity, length)
+            try:
+                yield data.decode()
+            except UnicodeError:
+                yield str(data)
+            offset = (offset + HEADER_SIZE + length) % self.capacity
+            sequence += 1
+            remaining -= 1
+
+    # Frees every record with a sequence number lower than end_sequence.
+    # Records already dropped because of overflow are skipped.
+    def ack(self, end_sequence: int):
+        while self.count > 0 and self.head_sequence < end_sequence:
+            self.free_oldest()
+
+    def clear(self):
+        while self.count > 0:
+            self.free_oldest()
+
+    def end_sequence(self):
+        return self.head_sequence + self.count
+
+    def dropped_counts(self):
+        counts = {}
+        for slot in range(len(self.categories)):
+            if self.category_dropped[slot] > 0:
+                counts[self.categories[slot]] = self.category_dropped[slot]
+        return counts
+
+    def __len__(self):
+        return self.count
+
+    # ***********************
+    # Support functions
+    # ***********************
+    def category_slot(self, category: str):
+        try:
+            return self.categories.index(category)
+        except ValueError:
+            pass
+        if len(self.categories) >= MAX_CATEGORIES - 1:
+            category = OTHER_CATEGORY
+            if category in self.categories:
+                return self.categories.index(category)
+        self.categories.append(category)
+        self.category_bytes.append(0)
+        self.category_dropped.append(0)
+        return len(self.categories) - 1
+
+    def drop_oldest(self):
+        slot = self.free_oldest()
+        self.category_dropped[slot] += 1
+        self.dropped += 1
+
+    def free_oldest(self):
+        length, slot = self.read_header(self.head)
+        size = HEADER_SIZE + length
+        self.head = (self.head + size) % self.capacity
+        self.used -= size
+        self.count -= 1
+        self.head_sequence += 1
+        self.category_bytes[slot] -= size
+        return slot
+
+    def read_header(self, offset: int):
+        header = self.read_bytes(offset, HEADER_SIZE)
+        return (header[0] << 8) | header[1], header[2]
+
+    def read_bytes(self, offset: int, length: int):
+        end = offset + length
+        if end <= self.capacity:
+            return bytes(self.buffer[offset:end])
+        return bytes(self.buffer[offset:]) + bytes(self.buffer[:end - self.capacity])
+
+    def write_bytes(self, offset: int, data):
+        end = offset + len(data)
+        if end <= self.capacity:
+            self.buffer[offset:end] = data
+        else:
+            split = self.capacity - offset
+            self.buffer[offset:] = data[:split]
+            self.buffer[:end - self.capacity] = data[split:]
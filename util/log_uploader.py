@@ -0,0 +1,103 @@
+import json
+import os
+from binascii import hexlify
+
+from util.debug import Debug
+
+DEFAULT_CHUNK_SIZE = 1024
+OPEN_BRACKET = ord("[")
+CLOSE_BRACKET = ord("]")
+COMMA = ord(",")
+DEFERRED = {
+    "status_code": 202,
+    "text": "Deferred"
+}
+
+
+# Streams the remote debug lines to /component/debug in fixed-size chunks.
+#
+# Each chunk is a JSON array of lines serialized straight into one preallocated bytearray, so a flush never
+# holds more than a chunk (plus the line being encoded) no matter how large the backlog is. Chunks aren't
+# compressed, a compressor's state would be many times the chunk.
+# Chunks carry the stream id (one per boot) and the ring buffer sequence number of their first line:
+#     /component/debug?mission=Pump1Mission&stream=<id>&seq=<sequence number of the first line>
+# The lines in a chunk are acked (freed) as soon as that chunk was accepted. If a post fails, the rest stays
+# buffered and the next flush starts again at the first line that wasn't acked, its chunks can be cut differently.
+# The remote keeps the next sequence number it expects per stream: lines below it are repeats and dropped, a
+# sequence number above it means lines were dropped on the device (ring buffer full).
+class LogUploader:
+    def __init__(self, http, debug: Debug, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.http = http
+        self.debug = debug
+        self.chunk_size = chunk_size
+        self.chunk = bytearray(chunk_size)
+        self.stream_id = hexlify(os.urandom(4)).decode()
+        self.chunks_sent = 0
+        self.bytes_sent = 0
+
+    # allow(size) is asked before each chunk goes out, False stops the upload there (it resumes at the same line
+    # next time) and returns DEFERRED
+    def upload(self, allow=None):
+        if self.http.requests is None:
+            return {
+                "status_code": 0,
+                "text": "Couldn't do_log_post"
+            }
+
+        start_sequence, lines = self.debug.iter_remote_lines()
+        response = {
+            "status_code": 200,
+            "text": ""
+        }
+        sent_lines = 0
+        chunk_lines = 0
+        used = 1
+        self.chunk[0] = OPEN_BRACKET
+
+        for line in lines:
+            data = json.dumps(line).encode()
+            if len(data) + 2 > self.chunk_size:
+                data = json.dumps(line[:self.chunk_size // 8]).encode()
+
+            # Leave room for the separator and closing bracket
+            if used + len(data) + 2 > self.chunk_size:
+                if allow is not None and not allow(used + 1):
+                    return DEFERRED
+                response = self.post_chunk(used, start_sequence + sent_lines)
+                if not self.http_ok(response):
+                    return response
+                sent_lines += chunk_lines
+                self.debug.remote_lines.ack(start_sequence + sent_lines)
+                chunk_lines = 0
+                used = 1
+
+            if chunk_lines > 0:
+                self.chunk[used] = COMMA
+                used += 1
+            self.chunk[used:used + len(data)] = data
+            used += len(data)
+            chunk_lines += 1
+
+        if chunk_lines > 0:
+            if allow is not None and not allow(used + 1):
+                return DEFERRED
+            response = self.post_chunk(used, start_sequence + sent_lines)
+            if self.http_ok(response):
+                sent_lines += chunk_lines
+                self.debug.remote_lines.ack(start_sequence + sent_lines)
+        return response
+
+    def post_chunk(self, used: int, sequence: int):
+        self.chunk[used] = CLOSE_BRACKET
+        used += 1
+        body = memoryview(self.chunk)[:used]
+        response = self.http.do_debug_post(self.stream_id, sequence, {'Content-Type': 'application/json'}, body)
+        if self.http_ok(response):
+            self.chunks_sent += 1
+            self.bytes_sent += len(body)
+        return response
+
+    # NOTE: Not using http.success() here, it would start the http error timer for a failed debug post.
+    @staticmethod
+    def http_ok(response):
+        return response is not None and 200 <= response["status_code"] < 300
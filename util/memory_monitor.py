@@ -0,0 +1,128 @@
+import gc
+import time
+
+COLLECT_EVERY_TICKS = 30  # Idle collect at least this often
+LOW_WATER_BYTES = 24 * 1024  # Or as soon as free heap drops below this
+
+
+# Heap telemetry for the main loop, driven by TickProfiler.mark() so every phase is measured at the same points.
+#
+# Between collections gc.mem_alloc() only grows, so the growth over a phase is what the phase allocated.
+# If it shrinks, the VM ran a collection on its own inside that phase (a heap-full collect, possibly mid-pump):
+# that is counted as an unplanned gc against the phase.
+# collect_if_idle() runs gc.collect() at a point the loop chooses (pump off, right before the sleep),
+# so the automatic collections should stay at zero.
+#
+# Host Python has no gc.mem_alloc()/mem_free(), pass mem_alloc (e.g. from tracemalloc) to measure anyway.
+class MemoryMonitor:
+    def __init__(self, mem_alloc=None, mem_free=None, collect_every: int = COLLECT_EVERY_TICKS,
+                 low_water: int = LOW_WATER_BYTES):
+        self.mem_alloc = mem_alloc if mem_alloc is not None else getattr(gc, "mem_alloc", None)
+        self.mem_free = mem_free if mem_free is not None else getattr(gc, "mem_free", None)
+        self.collect_every = collect_every
+        self.low_water = low_water
+        # phase -> [ticks that allocated, bytes last tick, max bytes, unplanned gc runs]
+        self.phases = {}
+        self.phase_order = []
+        self.last_alloc = None
+        self.min_free = None
+        self.ticks_since_collect = 0
+        self.planned_collects = 0
+        self.unplanned_collects = 0
+        self.last_collect_ms = 0
+
+    def enabled(self):
+        return self.mem_alloc is not None
+
+    def begin_tick(self):
+        if self.mem_alloc is not None:
+            self.last_alloc = self.mem_alloc()
+
+    def mark(self, phase: str):
+        if self.mem_alloc is None:
+            return
+        alloc = self.mem_alloc()
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = [0, 0, 0, 0]
+            self.phases[phase] = stats
+            self.phase_order.append(phase)
+        if self.last_alloc is not None:
+            allocated = alloc - self.last_alloc
+            if allocated < 0:
+                stats[3] += 1
+                self.unplanned_collects += 1
+                allocated = 0
+            stats[1] = allocated
+            if allocated > 0:
+                stats[0] += 1
+                if allocated > stats[2]:
+                    stats[2] = allocated
+        self.last_alloc = alloc
+
+    # Call at an idle point of the loop. Returns True if it collected.
+    def collect_if_idle(self, busy: bool):
+        self.ticks_since_collect += 1
+        free = None
+        if self.mem_free is not None:
+            free = self.mem_free()
+            if self.min_free is None or free < self.min_free:
+                self.min_free = free
+        if busy:
+            # Never while pumping, a collect there delays turning the pump off
+            return False
+        if self.ticks_since_collect < self.collect_every and (free is None or free >= self.low_water):
+            return False
+
+        start = time.monotonic_ns()
+        gc.collect()
+        self.last_collect_ms = (time.monotonic_ns() - start) // 1000000
+        self.planned_collects += 1
+        self.ticks_since_collect = 0
+        if self.mem_alloc is not None:
+            # The drop is ours, don't count it as an unplanned collect
+            self.last_alloc = self.mem_alloc()
+        return True
+
+    # Phases that allocated in more than one tick, these are the ones to look at first
+    def allocating_phases(self):
+        phases = []
+        for phase in self.phase_order:
+            if self.phases[phase][0] > 1 and phase != "tick":
+                phases.append(phase)
+        return phases
+
+    def reset(self):
+        self.phases = {}
+        self.phase_order = []
+        self.min_free = None
+        self.planned_collects = 0
+        self.unplanned_collects = 0
+
+    # Sent in the status object
+    def summary(self):
+        phases = {}
+        for phase in self.phase_order:
+            stats = self.phases[phase]
+            phases[phase] = [stats[0], stats[2], stats[3]]
+        return {
+            "free": None if self.mem_free is None else self.mem_free(),
+            "alloc": None if self.mem_alloc is None else self.mem_alloc(),
+            "min_free": self.min_free,
+            "gc_planned": self.planned_collects,
+            "gc_unplanned": self.unplanned_collects,
+            "gc_last_ms": self.last_collect_ms,
+            "phases": phases  # phase: [ticks allocating, max bytes, unplanned gc]
+        }
+
+    # Table for the serial console
+    def format_table(self):
+        summary = self.summary()
+        lines = ["free %s alloc %s min_free %s gc planned %d unplanned %d last %d ms" % (
+            summary["free"], summary["alloc"], summary["min_free"], self.planned_collects, self.unplanned_collects,
+            self.last_collect_ms),
+            "%-12s %9s %9s %9s %9s" % ("phase", "alloc_tk", "last_B", "max_B", "gc")]
+        for phase in self.phase_order:
+            stats = self.phases[phase]
+            lines.append("%-12s %9d %9d %9d %9d" % (phase, stats[0], stats[1], stats[2], stats[3]))
+        return "\n".join(lines)
@@ -0,0 +1,234 @@
+import json
+import time
+
+from util.debug import Debug
+from util.simple_timer import Timer
+
+EAGAIN = 11
+RETRY_SECONDS = 30  # Between tries to listen again
+REQUEST_SIZE = 512
+BUFFER_SIZE = 4096
+CLIENT_TIMEOUT_MS = 2000  # A client that hasn't sent its request (or taken the response) by then is dropped
+
+STATUS_200 = b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Type: "
+STATUS_404 = b"HTTP/1.1 404 Not Found\r\nConnection: close\r\nContent-Length: 0\r\n\r\n"
+PROMETHEUS_TYPE = b"text/plain; version=0.0.4"
+JSON_TYPE = b"application/json"
+
+
+# Metrics scraped over HTTP from the board itself, so a scraper can poll the fleet without going through the
+# backend:
+#     GET /metrics       Prometheus text format
+#     GET /metrics.json  the same values as {name: value} ({name: {labels: value}} for labeled ones)
+#
+# poll() is called once per main loop and never blocks: the listening and the client sockets are non-blocking,
+# each call does whatever step is ready (accept, read the request, send the response) and returns.
+# One client at a time, the next one waits in the listen backlog.
+# The HELP/TYPE lines and the response headers are encoded once at register time, a scrape only formats the values
+# into the preallocated response buffer.
+class MetricsServer:
+    def __init__(self, debug: Debug, port: int):
+        self.debug = debug
+        self.port = port
+        self.metrics = []  # [name, encoded name, encoded HELP/TYPE lines, collect]
+        self.listener = None
+        self.client = None
+        self.client_start = 0
+        self.request = bytearray(REQUEST_SIZE)
+        self.received = 0
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.used = 0
+        self.pending = None  # memoryview of the response still to send
+        self.scrapes = 0
+        self.last_scrape_us = 0
+        self.retry_timer = Timer()
+        self.pool = None
+
+    # collect() returns a number, or a list of (labels, value) where labels is the text between the braces,
+    # e.g. 'station="North",sensor="Top"'
+    def register(self, name: str, help_text: str, metric_type: str, collect):
+        header = ("# HELP %s %s\n# TYPE %s %s\n" % (name, help_text, name, metric_type)).encode()
+        self.metrics.append([name, name.encode(), header, collect])
+
+    # Listens on the socket pool, again after the pool was replaced by a reconnect. Returns True when listening.
+    def start(self, pool):
+        if self.listener is not None and pool is self.pool:
+            return True
+        if pool is None or self.port == 0 or (self.retry_timer.is_timing() and not self.retry_timer.is_timed_out()):
+            return False
+        self.stop()
+        self.pool = pool
+        try:
+            listener = pool.socket(pool.AF_INET, pool.SOCK_STREAM)
+            listener.setsockopt(pool.SOL_SOCKET, pool.SO_REUSEADDR, 1)
+            listener.bind(("0.0.0.0", self.port))
+            listener.listen(2)
+            listener.setblocking(False)
+            self.listener = listener
+            self.retry_timer.cancel_timer()
+            self.debug.print_info("metrics", "Serving /metrics on port %d", self.port)
+            return True
+        except Exception as e:
+            self.retry_timer.start_timer(RETRY_SECONDS)
+            self.debug.print_warning("metrics", "Can't listen on port %d: %s", self.port, str(e))
+            return False
+
+    def stop(self):
+        self.close_client()
+        if self.listener is not None:
+            try:
+                self.listener.close()
+            except Exception:
+                pass
+        self.listener = None
+
+    # pool is the connection's socket pool, None while the network is down
+    def poll(self, pool):
+        if not self.start(pool):
+            return
+        try:
+            if self.client is None:
+                self.accept()
+            elif self.pending is None:
+                self.read_request()
+            else:
+                self.send_pending()
+        except OSError as e:
+            # EAGAIN: nothing to accept, read or send right now
+            if e.args[0] != EAGAIN:
+                self.debug.print_debug("metrics", "socket error %s", str(e))
+                if self.client is None:
+                    # The listener itself is broken, listen again later
+                    self.stop()
+                    self.retry_timer.start_timer(RETRY_SECONDS)
+                self.close_client()
+                return
+        except Exception as e:
+            # Never let a scrape end up in the main loop's error handling
+            self.debug.print_warning("metrics", "scrape failed %s", str(e))
+            self.close_client()
+            return
+        if self.client is not None and time.monotonic_ns() // 1000000 - self.client_start > CLIENT_TIMEOUT_MS:
+            self.close_client()
+
+    def accept(self):
+        client, address = self.listener.accept()
+        client.setblocking(False)
+        self.client = client
+        self.client_start = time.monotonic_ns() // 1000000
+        self.received = 0
+        # The request usually comes with the connection, no need to wait for the next loop
+        self.read_request()
+
+    def read_request(self):
+        count = self.client.recv_into(memoryview(self.request)[self.received:])
+        if count == 0:
+            self.close_client()
+            return
+        self.received += count
+        if self.request[self.received - 4:self.received] != b"\r\n\r\n" and self.received < REQUEST_SIZE:
+            return
+        words = bytes(self.request[:self.received]).split(b" ", 2)
+        path = words[1].split(b"?")[0] if len(words) > 1 else b""
+        start = time.monotonic_ns()
+        if path == b"/metrics":
+            self.render_prometheus()
+            self.pending = memoryview(self.buffer)[:self.used]
+        elif path == b"/metrics.json":
+            self.render_json()
+            self.pending = memoryview(self.buffer)[:self.used]
+        else:
+            self.pending = memoryview(STATUS_404)
+        self.scrapes += 1
+        self.last_scrape_us = (time.monotonic_ns() - start) // 1000
+        self.send_pending()
+
+    def send_pending(self):
+        sent = self.client.send(self.pending)
+        self.pending = self.pending[sent:]
+        if len(self.pending) == 0:
+            self.close_client()
+
+    def close_client(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+        self.pending = None
+
+    # ***********************
+    # Rendering into the response buffer
+    # ***********************
+
+    def put(self, data):
+        end = self.used + len(data)
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(end - len(self.buffer) + BUFFER_SIZE))
+        self.buffer[self.used:end] = data
+        self.used = end
+
+    # The headers go first with a fixed width Content-Length, filled in once the body is done
+    def begin(self, content_type: bytes):
+        self.used = 0
+        self.put(STATUS_200)
+        self.put(content_type)
+        self.put(b"\r\nContent-Length: ")
+        length_at = self.used
+        self.put(b"        \r\n\r\n")
+        return length_at
+
+    def finish(self, length_at: int):
+        body = self.used - length_at - 12
+        length = str(body).encode()
+        self.buffer[length_at:length_at + len(length)] = length
+
+    def render_prometheus(self):
+        length_at = self.begin(PROMETHEUS_TYPE)
+        for name, encoded, header, collect in self.metrics:
+            value = collect()
+            if value is None:
+                continue
+            self.put(header)
+            if isinstance(value, list):
+                for labels, sample in value:
+                    if sample is None:
+                        continue  # No reading yet, the sample is left out like an unlabeled None
+                    self.put(encoded)
+                    self.put(b"{")
+                    self.put(labels.encode())
+                    self.put(b"} ")
+                    self.put(format_value(sample))
+                    self.put(b"\n")
+            else:
+                self.put(encoded)
+                self.put(b" ")
+                self.put(format_value(value))
+                self.put(b"\n")
+        self.finish(length_at)
+
+    def render_json(self):
+        values = {}
+        for name, encoded, header, collect in self.metrics:
+            value = collect()
+            if value is None:
+                continue
+            if isinstance(value, list):
+                labeled = {}
+                for labels, sample in value:
+                    if sample is not None:
+                        labeled[labels] = sample
+                value = labeled
+            values[name] = value
+        length_at = self.begin(JSON_TYPE)
+        self.put(json.dumps(values).encode())
+        self.finish(length_at)
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return b"1" if value else b"0"
+    if isinstance(value, int):
+        return str(value).encode()
+    return ("%.3f" % value).encode()
@@ -0,0 +1,275 @@
+import json
+import os
+import time
+from traceback import format_exception
+
+from util.debug import Debug
+from util.http_functions import HttpFunctions, RETRY_SECONDS
+from util.properties import Properties
+from util.simple_timer import Timer
+
+# Feeds under <ADAFRUIT_AIO_USERNAME>/feeds/, one set per component_id:
+#     pump-<component_id>-mission  action posts (the same JSON as the http mission post)
+#     pump-<component_id>-error    error posts
+#     pump-<component_id>-debug    debug log chunks, "<stream> <seq>\n" followed by the chunk
+#     pump-<component_id>-cmd      subscribed, the remote's replies: {"action": ..., "station": ..., "eventId": ...,
+#                                  "cmd": ..., "config": ...}
+FEED_PREFIX = "pump-"
+
+# Seconds one loop() waits on the socket, the main loop polls with it once every POLL_SECONDS
+SOCKET_TIMEOUT = 0.05
+POLL_SECONDS = 1
+
+
+# Posts over one persistent MQTT connection (adafruit_io's IO_MQTT on adafruit_minimqtt) instead of an HTTPS
+# request per event. Selected with "transport": "mqtt" in secrets.json.
+#
+# Wi-Fi, ping and the error bookkeeping are HttpFunctions', only the posts change:
+# an action post is published and the reply the remote publishes on the cmd feed (matched on action and station)
+# is waited for up to mqtt_reply_timeout, so eventId/cmd/config work as with http. A reply that comes later, or a
+# cmd the remote sends on its own, lands in pushed and is picked up by the station on its next notify_remote.
+#
+# adafruit_minimqtt isn't bundled in lib/ (circup install adafruit_minimqtt), it is only imported when the
+# transport is used.
+class MqttFunctions(HttpFunctions):
+    def __init__(self, properties: Properties, debug: Debug):
+        super().__init__(properties, debug)
+        prefix = FEED_PREFIX + properties.config.component_id
+        self.mission_feed = prefix + "-mission"
+        self.error_feed = prefix + "-error"
+        self.debug_feed = prefix + "-debug"
+        self.cmd_feed = prefix + "-cmd"
+        self.io = None
+        self.waiting_for = None  # (action, station) of the action post waiting for its reply
+        self.reply = None
+        self.reply_text = None
+        self.poll_timer = Timer()
+
+    # ***********************
+    # Connection
+    # ***********************
+
+    # Wi-Fi and ping as for http, then the broker connection and the cmd subscription
+    def connect(self, max_tries: int = 10):
+        response = super().connect(max_tries)
+        if self.need_to_connect or self.pool is None:
+            return response
+        if not self.connect_broker():
+            self.need_to_connect = True
+            self.last_status_code = 0
+            self.error_timer.start_timer(30)
+            return {
+                "status_code": 0,
+                "text": "Broker connect failed"
+            }
+        return response
+
+    def connect_broker(self):
+        start = time.monotonic()
+        self.disconnect_broker()
+        try:
+            import ssl
+            import adafruit_minimqtt.adafruit_minimqtt as MQTT
+            from adafruit_io.adafruit_io import IO_MQTT
+
+            config = self.properties.config
+            client = MQTT.MQTT(broker=config.mqtt_broker, port=config.mqtt_port,
+                               username=os.getenv("ADAFRUIT_AIO_USERNAME"), password=os.getenv("ADAFRUIT_AIO_KEY"),
+                               socket_pool=self.dns, ssl_context=ssl.create_default_context(),
+                               socket_timeout=SOCKET_TIMEOUT, connect_retries=1)
+            io = IO_MQTT(client)
+            io.on_message = self.on_message
+            io.connect()
+            io.subscribe(self.cmd_feed)
+            self.io = io
+            self.debug.print_info("-->mqtt", "Connected to %s:%d, subscribed to %s", config.mqtt_broker,
+                                  config.mqtt_port, self.cmd_feed)
+            self.debug.print_debug("-->mqtt", "connect_broker elapsed %s",
+                                   lambda: int((time.monotonic() - start) * 1000))
+            return True
+        except Exception as e:
+            self.io = None
+            self.last_error = str(e)
+            self.debug.print_error("-->mqtt", "Broker connect failed: %s", lambda: str(format_exception(e)))
+            return False
+
+    # The first recovery step also drops the broker connection, the next publish makes a new one
+    def drop_session(self):
+        self.disconnect_broker()
+        super().drop_session()
+
+    def disconnect_broker(self):
+        if self.io is None:
+            return
+        try:
+            self.io.disconnect()
+        except Exception:
+            pass
+        self.io = None
+
+    # The broker connection is the health check, no ping before every publish
+    def check_connection(self):
+        if not self.need_to_connect and self.io is not None:
+            return {
+                "status_code": 200,
+                "text": "Connected"
+            }
+        response = super().check_connection()
+        if self.success(response) and self.io is None and not self.connect_broker():
+            self.need_to_connect = True
+            self.last_status_code = 0
+            return {
+                "status_code": 0,
+                "text": "Broker connect failed"
+            }
+        return response
+
+    # The hello is the broker connect, REMOTE_URL may not even be set
+    def do_hello(self):
+        return {
+            "status_code": 200 if self.io is not None else 0,
+            "text": "mqtt"
+        }
+
+    # ***********************
+    # Publish and replies
+    # ***********************
+
+    def do_action_post(self, api_action: str, pump_state: str, misc_status):
+        self.remote_cmd = None
+        self.reply = None
+        self.waiting_for = (api_action, self.station)
+        response = self.publish(self.mission_feed, json.dumps(self.action_body(api_action, pump_state, misc_status)),
+                                "action_publish")
+        if self.success(response):
+            response = self.wait_for_reply()
+        self.waiting_for = None
+        return response
+
+    def wait_for_reply(self):
+        start = time.monotonic()
+        try:
+            while self.reply is None and time.monotonic() - start < self.properties.config.mqtt_reply_timeout:
+                self.io.loop(SOCKET_TIMEOUT)
+        except Exception as e:
+            return self.publish_failed("reply", e)
+        self.debug.print_debug("-->mqtt", "reply elapsed %s", lambda: int((time.monotonic() - start) * 1000))
+        if self.reply is None:
+            # Published, the reply is picked up from pushed when it comes
+            self.last_status_code = 202
+            return {
+                "status_code": 202,
+                "text": ""
+            }
+        self.apply_reply(self.reply)
+        self.last_status_code = 200
+        return {
+            "status_code": 200,
+            "text": self.reply_text
+        }
+
+    def publish(self, feed: str, data, caller_id: str):
+        connect_response = self.check_connection()
+        if not self.success(connect_response):
+            self.debug.print_warning("-->mqtt", "%s not success check_connection: code %s", caller_id,
+                                     connect_response["status_code"])
+            return connect_response
+
+        self.debug.print_debug("-->mqtt", "Publish %s feed: %s, %d bytes", caller_id, feed, len(data))
+        last_exception = None
+        tries = 0
+        # Wi-Fi can be a little flaky so try a few times before recording an error, with do_post's short pauses
+        while tries < 3:
+            try:
+                if self.io is None and not self.connect_broker():
+                    raise ConnectionError("No broker connection")
+                self.io.publish(feed, data)
+                self.transaction_count += 1
+                self.last_status_code = 200
+                self.last_error = ""
+                self.record_outcome(200)
+                return {
+                    "status_code": 200,
+                    "text": ""
+                }
+            except Exception as e:
+                tries += 1
+                last_exception = e
+                self.disconnect_broker()
+                if tries < 3:
+                    time.sleep(RETRY_SECONDS[tries - 1])
+        return self.publish_failed(caller_id, last_exception)
+
+    def publish_failed(self, caller_id: str, e: Exception):
+        self.last_error = str(e)  # Can't be too long for display, may need to truncate
+        self.debug.print_error("-->mqtt", "%s failed: %s", caller_id, lambda: str(format_exception(e)))
+        self.disconnect_broker()
+        self.record_outcome(0)
+        self.last_status_code = 0
+        self.error_count += 1
+        self.recovery.failed()  # The broker is connected again on the next publish
+        return {
+            "status_code": 0,
+            "text": "Couldn't Publish"
+        }
+
+    # Over the current connection only, like the http one this must not end up back in do_error_post
+    def send_error(self, post_body):
+        if self.io is None:
+            self.debug.print_debug("*mqtt*", "send_error no connection")
+            return {
+                "status_code": 0,
+                "text": "Couldn't send error"
+            }
+        try:
+            self.io.publish(self.error_feed, json.dumps(post_body))
+            self.transaction_count += 1
+            self.record_outcome(200)
+            return {
+                "status_code": 200,
+                "text": ""
+            }
+        except Exception as e:
+            self.last_error = str(e)
+            self.debug.print_error("-->mqtt", "send_error Error -- Error: %s", lambda: str(format_exception(e)))
+            self.disconnect_broker()
+            self.record_outcome(0)
+            self.error_count += 1
+            self.recovery.failed()
+            return {
+                "status_code": 0,
+                "text": "Couldn't send error"
+            }
+
+    def do_debug_post(self, stream_id: str, sequence: int, headers: dict, body):
+        header = "{} {}\n".format(stream_id, sequence).encode()
+        return self.publish(self.debug_feed, header + bytes(body), "debug_log_publish")
+
+    # Delivers what the remote published on the cmd feed, at most every POLL_SECONDS
+    def poll(self):
+        if self.io is None or (self.poll_timer.is_timing() and not self.poll_timer.is_timed_out()):
+            return
+        self.poll_timer.start_timer(POLL_SECONDS)
+        try:
+            self.io.loop(SOCKET_TIMEOUT)
+        except Exception as e:
+            self.debug.print_warning("-->mqtt", "poll error %s", lambda: str(format_exception(e)))
+            self.disconnect_broker()
+            self.recovery.failed()
+
+    # IO_MQTT callback for every message on a subscribed feed
+    def on_message(self, client, feed_id: str, payload):
+        if feed_id != self.cmd_feed:
+            return
+        try:
+            reply = json.loads(payload)
+        except ValueError:
+            self.debug.print_warning("-->mqtt", "Not a json reply: %s", payload)
+            return
+        station = reply.get("station")
+        if self.waiting_for is not None and self.waiting_for == (reply.get("action"), station):
+            self.reply = reply
+            self.reply_text = payload
+        else:
+            self.debug.print_debug("-->mqtt", "Pushed for station %s: %s", station, payload)
+            self.pushed[station] = reply
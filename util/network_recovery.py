@@ -0,0 +1,113 @@
+import time
+
+import microcontroller
+
+from util.debug import Debug
+
+# The ladder, cheapest first. "none" is an outage that ended before any rung was needed.
+NONE = 0
+SESSION = 1  # A new adafruit_requests session (and broker connection) over the same socket pool
+POOL = 2  # A new socket pool and session
+RADIO = 3  # wifi.radio.enabled off and on, then connect again
+RECONNECT = 4  # Leave the access point, connect again with the credentials read fresh from settings.toml
+REBOOT = 5  # microcontroller.reset(), only when nothing else worked
+RUNGS = ("none", "session", "pool", "radio", "reconnect", "reboot")
+
+# Consecutive failures (requests, pings) at which each rung is tried
+RUNG_AT = (0, 1, 2, 4, 6, 40)
+RECONNECT_EVERY = 5  # Failures between reconnects once on that rung
+
+
+# Brings the connection back after failures, one step further up the ladder each time the previous one didn't help,
+# instead of rebooting once the error count passed a threshold (20 for get/post, 40 for ping, 200 for error posts).
+# A reboot costs the boot, Wi-Fi association, hello and startup notification, and drops what is only kept in RAM
+# (pump_event_count, the queues).
+# The outage ends with the next request that goes through. A ping that comes back only ends an outage in which the
+# pings were failing too, i.e. the link was down: while the ping works throughout, it says nothing about the session.
+# A failure while a step is being tried (reconnect_fresh connects and pings) is part of that step, not a new one.
+# Per rung it keeps [tries, recovered, total ms, max ms], recovered meaning the outage ended before the next rung
+# and the ms counted from the rung to the end of the outage.
+class NetworkRecovery:
+    def __init__(self, http, debug: Debug):
+        self.http = http
+        self.debug = debug
+        self.failures = 0
+        self.rung = NONE  # The last one tried in this outage
+        self.outage_start = None
+        self.rung_start = None
+        self.ping_failed = False  # A ping failed in this outage
+        self.climbing = False
+        self.stats = [[0, 0, 0, 0] for name in RUNGS]
+        self.outages = 0
+        self.outage_ms = 0
+
+    def failed(self, ping: bool = False):
+        if self.climbing:
+            return
+        now = time.monotonic()
+        if self.outage_start is None:
+            self.outage_start = now
+            self.rung_start = now
+        self.failures += 1
+        self.ping_failed = self.ping_failed or ping
+        rung = self.rung
+        if rung < REBOOT and self.failures >= RUNG_AT[rung + 1]:
+            rung += 1
+        elif rung != RECONNECT or (self.failures - RUNG_AT[RECONNECT]) % RECONNECT_EVERY != 0:
+            return
+        self.rung = rung
+        self.rung_start = now
+        self.stats[rung][0] += 1
+        self.debug.print_warning("recovery", "%d failures, trying %s", self.failures, RUNGS[rung])
+        self.climbing = True
+        try:
+            self.climb(rung)
+        except Exception as e:
+            self.debug.print_warning("recovery", "%s failed: %s", RUNGS[rung], str(e))
+        finally:
+            self.climbing = False
+
+    def climb(self, rung: int):
+        if rung == SESSION:
+            self.http.drop_session()
+        elif rung == POOL:
+            self.http.renew_pool()
+        elif rung == RADIO:
+            self.http.cycle_radio()
+        elif rung == RECONNECT:
+            self.http.reconnect_fresh()
+        elif rung == REBOOT:
+            microcontroller.reset()
+
+    def recovered(self, ping: bool = False):
+        if self.outage_start is None or (ping and not self.ping_failed):
+            return
+        now = time.monotonic()
+        stats = self.stats[self.rung]
+        if self.rung == NONE:
+            stats[0] += 1
+        ms = int((now - self.rung_start) * 1000)
+        stats[1] += 1
+        stats[2] += ms
+        stats[3] = max(stats[3], ms)
+        self.outages += 1
+        self.outage_ms += int((now - self.outage_start) * 1000)
+        self.debug.print_info("recovery", "Recovered after %d failures, %s, %d ms", self.failures, RUNGS[self.rung],
+                              lambda: int((now - self.outage_start) * 1000))
+        self.failures = 0
+        self.rung = NONE
+        self.outage_start = None
+        self.ping_failed = False
+
+    # {"outages", "mean_ms", rung: [tries, recovered, mean ms, max ms]}
+    def summary(self):
+        summary = {"outages": self.outages, "mean_ms": self.outage_ms // self.outages if self.outages else 0}
+        for i in range(len(RUNGS) - 1):
+            stats = self.stats[i]
+            summary[RUNGS[i]] = [stats[0], stats[1], stats[2] // stats[1] if stats[1] else 0, stats[3]]
+        return summary
+
+    # [(labels, value)] of one summary column per rung, for the MetricsServer
+    def metric_values(self, column: int):
+        summary = self.summary()
+        return [('rung="%s"' % RUNGS[i], summary[RUNGS[i]][column]) for i in range(len(RUNGS) - 1)]
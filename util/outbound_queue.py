@@ -0,0 +1,165 @@
+import time
+
+from util.debug import Debug
+
+# Priority classes, lower goes first
+CONTROL = 0
+STATUS = 1
+BULK = 2
+CLASS_NAMES = ("control", "status", "bulk")
+
+# Per class (rate per second, burst), None is unlimited. Control and status count messages, bulk counts bytes.
+# The bulk rate is well above what the remote debug log produces with every line kept (about 500 B/s), it only
+# spreads a backlog out. The burst bounds how long a control notification can wait behind the debug upload.
+CLASS_LIMITS = (None, (0.1, 3), (2048, 8192))
+
+# action -> (class, retry). A control notification that couldn't be sent is queued and sent again before anything
+# else once the connection is back. The rest are answered in the call (cmd), a late copy is no use.
+ACTIONS = {
+    "pumping_timeout": (CONTROL, True),
+    "missed_pumping_verification": (CONTROL, True),
+    "pump_event": (CONTROL, True),
+    "ready_to_pump": (CONTROL, True),
+    "pumping_canceled_ack": (CONTROL, False),
+    "start_pumping_ack": (CONTROL, False),
+    "stop_pumping_ack": (CONTROL, False),
+    "pumping_confirmed": (CONTROL, False),
+}
+
+MAX_RETRIES = 8  # Queued control notifications, the oldest is dropped beyond this
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    # More than the burst waits for a full bucket and empties it, so it still goes out
+    def take(self, amount: int = 1):
+        self.refill()
+        amount = min(amount, self.burst)
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    # Gives back what a take spent on something that didn't go out
+    def give(self, amount: int):
+        self.tokens = min(self.burst, self.tokens + min(amount, self.burst))
+
+
+# Orders the traffic on the shared connection so control events never wait behind status or debug logs.
+# Everything is still sent in the caller's tick (the posts are blocking), the queue decides what may go now:
+#   control  - always sent right away. A pump_event/pumping_timeout/missed_pumping_verification that can't be sent
+#              is queued with its event id and sent again, oldest first, before any other post.
+#   status   - handshakes and the other status posts, rate limited. Over the limit the post is skipped, the next
+#              handshake carries the same information.
+#   bulk     - debug log chunks, rate limited in bytes. Yields between chunks to queued control notifications and
+#              sends one chunk per upload while a pump runs.
+# Per class it keeps [sent, deferred, dropped, depth, last wait ms, max wait ms], the wait being the time from the
+# first deferred send until the class got to send again.
+class OutboundQueue:
+    def __init__(self, debug: Debug, limits=CLASS_LIMITS):
+        self.debug = debug
+        self.buckets = []
+        for limit in limits:
+            self.buckets.append(None if limit is None else TokenBucket(limit[0], limit[1]))
+        self.retries = []  # [queued at, notifier, event id, api_action, pump_state, misc_status, seq]
+        self.stats = [[0, 0, 0, 0, 0, 0] for name in CLASS_NAMES]
+        self.waiting_since = [None] * len(CLASS_NAMES)
+        self.bulk_depth = None  # Callable returning the debug lines waiting, for the bulk depth
+        self.bulk_taken = 0  # Bytes of the last chunk allow_bulk let through
+
+    @staticmethod
+    def classify(api_action: str):
+        return ACTIONS.get(api_action, (STATUS, False))
+
+    def allow(self, priority: int, amount: int = 1):
+        bucket = self.buckets[priority]
+        if bucket is None or bucket.take(amount):
+            return True
+        self.deferred(priority)
+        return False
+
+    def deferred(self, priority: int):
+        self.stats[priority][1] += 1
+        if self.waiting_since[priority] is None:
+            self.waiting_since[priority] = time.monotonic()
+
+    def sent(self, priority: int, count: int = 1):
+        stats = self.stats[priority]
+        stats[0] += count
+        if self.waiting_since[priority] is not None:
+            stats[4] = int((time.monotonic() - self.waiting_since[priority]) * 1000)
+            stats[5] = max(stats[5], stats[4])
+            self.waiting_since[priority] = None
+
+    # A control notification to send again later, with the event id it belongs to
+    def queue_retry(self, notifier, api_action: str, pump_state: str, misc_status, seq: int):
+        if len(self.retries) >= MAX_RETRIES:
+            dropped = self.retries.pop(0)
+            self.stats[CONTROL][2] += 1
+            self.debug.print_warning("outbound", "Retry queue full, dropped %s", dropped[3])
+        self.retries.append([time.monotonic(), notifier, notifier.event_id, api_action, pump_state, misc_status, seq])
+        self.deferred(CONTROL)
+        self.debug.print_info("outbound", "Queued %s, %d queued", api_action, len(self.retries))
+
+    # Sends the queued control notifications, oldest first, stops at the first failure.
+    # Returns True when nothing is left queued.
+    def send_retries(self, http):
+        while self.retries and http.last_http_status_success():
+            queued_at, notifier, event_id, api_action, pump_state, misc_status, seq = self.retries[0]
+            response = notifier.post(api_action, pump_state, misc_status, event_id, seq)
+            if not ok(response):
+                return False
+            self.retries.pop(0)
+            self.sent(CONTROL)
+            self.debug.print_info("outbound", "Sent queued %s after %d ms", api_action,
+                                  lambda: int((time.monotonic() - queued_at) * 1000))
+        return not self.retries
+
+    # Checked before each debug log chunk: False makes the upload stop and resume from there next time.
+    # While busy (a pump runs) one chunk per upload goes out, so the log keeps up and a control notification of the
+    # same tick waits for one chunk at most.
+    def allow_bulk(self, size: int, busy: bool):
+        if self.retries or (busy and self.bulk_taken):
+            self.deferred(BULK)
+            return False
+        if not self.allow(BULK, size):
+            return False
+        self.bulk_taken = size
+        return True
+
+    # The chunk allow_bulk let through wasn't accepted, it is sent again next time and pays then
+    def bulk_failed(self):
+        bucket = self.buckets[BULK]
+        if bucket is not None:
+            bucket.give(self.bulk_taken)
+        self.bulk_taken = 0
+
+    # {class: [sent, deferred, dropped, depth, last wait ms, max wait ms]}
+    def summary(self):
+        self.stats[CONTROL][3] = len(self.retries)
+        if self.bulk_depth is not None:
+            self.stats[BULK][3] = self.bulk_depth()
+        classes = {}
+        for i in range(len(CLASS_NAMES)):
+            classes[CLASS_NAMES[i]] = self.stats[i]
+        return classes
+
+    # [(labels, value)] of one summary column per class, for the MetricsServer
+    def metric_values(self, column: int):
+        self.summary()
+        return [('class="%s"' % CLASS_NAMES[i], self.stats[i][column]) for i in range(len(CLASS_NAMES))]
+
+
+# NOTE: Not http.success(), that would restart the http error timer for every failed post
+def ok(response):
+    return response is not None and 200 <= response["status_code"] < 300
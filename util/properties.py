@@ -2,35 +2,226 @@ import json
 
 from util.debug import Debug
 
+SECRETS_FILE = "secrets.json"
+
+# Every setting read from secrets.json: (name, type, default, minimum, maximum)
+# A missing or invalid value falls back to the default, so a bad secrets.json can't crash the main loop.
+FIELDS = (
+    ("component_id", str, "1", None, None),
+    ("debug_sleep_time", int, 6, 0, None),
+    ("display_interval", int, 5, 1, None),
+    ("sleep_time", float, 1.0, 0, None),
+    ("wiring_option", str, "default", None, None),
+    ("display_type", str, "spi", None, None),
+    ("seconds_to_pump_before_timeout", int, 40, 1, None),
+    ("seconds_to_wait_for_pumping_verification", int, 30, 1, None),
+    ("seconds_between_pumping_status_to_remote", int, 300, 1, None),
+    ("config_check_interval", float, 2.0, 0, None),
+    ("debug_log_chunk_size", int, 1024, 256, 16384),
+    ("water_levels", dict, {}, None, None),
+    ("stations", list, [], None, None),
+    ("history_flush_seconds", int, 1800, 60, None),
+    ("transport", str, "http", None, None),
+    ("mqtt_broker", str, "io.adafruit.com", None, None),
+    ("mqtt_port", int, 8883, 1, 65535),
+    ("mqtt_reply_timeout", float, 3.0, 0, 30),
+    ("metrics_port", int, 9100, 0, 65535),
+    ("post_timeout", float, 5.0, 0.5, 60),
+    ("dns_ttl", int, 300, 0, 86400),
+    ("radio_idle_seconds", int, 0, 0, None),
+    ("env_sample_seconds", int, 60, 0, None),
+    ("env_i2c_address", int, 0x77, 0, 127),
+)
+
+# These are only used when the hardware objects are created in code.py, a reload can't apply them
+RESTART_FIELDS = ("wiring_option", "display_type", "debug_log_chunk_size", "stations", "history_flush_seconds",
+                  "transport", "mqtt_broker", "mqtt_port", "metrics_port", "env_i2c_address")
+
+# Sent in the startup notification when secrets.json can't be read, otherwise it has the fields set in the file
+FALLBACK_STARTUP_FIELDS = ("debug_sleep_time", "display_interval", "seconds_to_wait_for_pumping_verification",
+                           "seconds_between_pumping_status_to_remote", "component_id")
+
+# Tuning values the remote is allowed to change with a config patch (see Properties.apply_remote_patch)
+REMOTE_FIELDS = ("sleep_time", "display_interval", "config_check_interval",
+                 "seconds_to_pump_before_timeout", "seconds_to_wait_for_pumping_verification",
+                 "seconds_between_pumping_status_to_remote")
+
+
+class PumpConfig:
+    __slots__ = tuple([field[0] for field in FIELDS]) + ("errors", "present")
+
+    def __init__(self):
+        for name, field_type, default, minimum, maximum in FIELDS:
+            setattr(self, name, default)
+        self.errors = []
+        self.present = FALLBACK_STARTUP_FIELDS  # Names of the fields set in secrets.json
+
+    # Builds a config from the raw secrets.json dict. Parsing happens once, consumers use attribute access.
+    @staticmethod
+    def parse(raw: dict):
+        config = PumpConfig()
+        config.present = tuple([field[0] for field in FIELDS if raw.get(field[0]) is not None])
+        for name, field_type, default, minimum, maximum in FIELDS:
+            if name not in raw or raw[name] is None:
+                continue
+            try:
+                value = PumpConfig.convert(raw[name], field_type)
+                if minimum is not None and value < minimum:
+                    raise ValueError("below minimum " + str(minimum))
+                if maximum is not None and value > maximum:
+                    raise ValueError("above maximum " + str(maximum))
+                setattr(config, name, value)
+            except (ValueError, TypeError) as e:
+                config.errors.append("%s=%s: %s" % (name, raw[name], str(e)))
+        return config
+
+    @staticmethod
+    def convert(value, field_type):
+        if field_type is bool:
+            if isinstance(value, str):
+                if value.lower() in ("true", "1", "yes", "on"):
+                    return True
+                if value.lower() in ("false", "0", "no", "off"):
+                    return False
+                raise ValueError("not a boolean")
+            return bool(value)
+        if field_type is dict:
+            if not isinstance(value, dict):
+                raise TypeError("not an object")
+            return value
+        if field_type is list:
+            if not isinstance(value, list):
+                raise TypeError("not a list")
+            return value
+        if field_type is str:
+            return str(value)
+        if isinstance(value, bool):
+            raise TypeError("not a number")
+        return field_type(value)
+
+    # Every field, or only the given names
+    def as_dict(self, names=None):
+        values = {}
+        for field in FIELDS:
+            if names is None or field[0] in names:
+                values[field[0]] = getattr(self, field[0])
+        return values
+
+    # Names of the fields that differ from other
+    def changed_fields(self, other):
+        changed = []
+        for field in FIELDS:
+            if getattr(self, field[0]) != getattr(other, field[0]):
+                changed.append(field[0])
+        return changed
+
 
 class Properties:
 
     def __init__(self, debug: Debug):
         self.debug = debug
         self.defaults = {}
+        self.config = PumpConfig()
+        self.listeners = []
+        # Values pushed by the remote, layered over secrets.json. Lost on reboot, the remote pushes them again.
+        self.remote_values = {}
+        self.remote_version = 0
         self.read_defaults()
 
     def read_defaults(self):
+        self.config = self.read_config()
+        if self.config is None:
+            print("WARNING: Using default values.")
+            self.config = PumpConfig()
+        # Plain dict of the values set in secrets.json, sent as-is in the startup notification
+        self.defaults = self.config.as_dict(self.config.present)
+
+        self.debug.print_debug("properties","read_defaults:\n seconds_to_wait_for_pumping_verification[%s],\n seconds_between_pumping_status_to_remote[%s],\n component_id[%s]",
+                               self.config.seconds_to_wait_for_pumping_verification, self.config.seconds_between_pumping_status_to_remote, self.config.component_id)
+
+        return self.defaults
+
+    def read_config(self):
         try:
             # Reads json file and creates if json file doesn't exist
-            with open('secrets.json', ) as f:
-                self.defaults = json.load(f)
+            with open(SECRETS_FILE, ) as f:
+                raw = json.load(f)
+            raw.update(self.remote_values)
         except Exception as e:
             # print ("Let's just ignore all exceptions, like this one: %s" % str(e))
-            print("WARNING: Didn't read secrets.json, using default values. Error: %s" % str(e))
-            self.defaults = {
-                "debug_sleep_time": 6,
-                "display_interval": 5,
-                "seconds_to_wait_for_pumping_verification": 30,
-                "seconds_between_pumping_status_to_remote": 300,
-                "component_id": "1"
-            }
+            print("WARNING: Didn't read secrets.json. Error: %s" % str(e))
             # Can't write to the feather file system
             # with open('defaults.json', 'w', encoding='utf-8') as f:
             #     json.dump(self.defaults, f, ensure_ascii=False, indent=4)
+            return None
 
-        self.debug.print_debug("properties","read_defaults:\n seconds_to_wait_for_pumping_verification[%s],\n seconds_between_pumping_status_to_remote[%s],\n component_id[%s]" %
-                               (self.defaults["seconds_to_wait_for_pumping_verification"], self.defaults["seconds_between_pumping_status_to_remote"], self.defaults["component_id"]))
+        config = PumpConfig.parse(raw)
+        for error in config.errors:
+            print("WARNING: Invalid value in secrets.json, using default. %s" % error)
+        return config
 
-        return self.defaults
+    # Called as listener(config, changed_field_names) after a reload changed something
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Re-reads secrets.json without restarting the loop.
+    # The new config is fully parsed and validated before it replaces the current one in a single assignment,
+    # so the loop never sees a half updated config. Returns the names of the fields that changed.
+    def reload(self):
+        new_config = self.read_config()
+        if new_config is None:
+            # Probably caught the file half written, keep what we have
+            print("WARNING: Keeping current values.")
+            return []
+        return self.replace_config(new_config)
+
+    # Applies a versioned config patch from the remote: {"version": 7, "values": {"sleep_time": 2, ...}}
+    # Only REMOTE_FIELDS can be patched. The patch is all or nothing: if any value is invalid nothing changes.
+    # Re-sending the current version is a no-op, an older version is rejected.
+    # Returns (applied, errors)
+    def apply_remote_patch(self, patch):
+        try:
+            version = int(patch["version"])
+            values = patch.get("values", {})
+            if not isinstance(values, dict):
+                raise TypeError("values is not an object")
+        except Exception as e:
+            return False, ["bad patch: " + str(e)]
+        if version == self.remote_version:
+            # Our ack got lost, nothing to do but ack again
+            return True, []
+        if version < self.remote_version:
+            return False, ["version %d is older than current %d" % (version, self.remote_version)]
+
+        errors = []
+        for name in values:
+            if name not in REMOTE_FIELDS:
+                errors.append(name + ": not remotely configurable")
+        raw = self.config.as_dict(self.config.present)
+        raw.update(values)
+        new_config = PumpConfig.parse(raw)
+        errors.extend(new_config.errors)
+        if errors:
+            self.debug.print_warning("properties", "config version %d rejected: %s", version, lambda: ",".join(errors))
+            return False, errors
+
+        self.remote_values.update(values)
+        self.remote_version = version
+        self.replace_config(new_config)
+        self.debug.print_info("properties", "config version %d applied", version)
+        return True, errors
+
+    def replace_config(self, new_config: PumpConfig):
+        changed = new_config.changed_fields(self.config)
+        if not changed:
+            return changed
 
+        self.config = new_config
+        self.defaults = new_config.as_dict(new_config.present)
+        for name in changed:
+            if name in RESTART_FIELDS:
+                self.debug.print_warning("properties", "%s changed, restart to apply", name)
+        self.debug.print_info("properties", "config changed: %s", lambda: ",".join(changed))
+        for listener in self.listeners:
+            listener(new_config, changed)
+        return changed
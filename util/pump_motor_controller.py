@@ -1,6 +1,9 @@
+import time
+
 import board
 import digitalio
 from util.debug import Debug
+from util.time_series_log import PUMP_OFF, PUMP_ON
 
 
 class PumpMotorController:
@@ -10,13 +13,28 @@ class PumpMotorController:
         self.relay.direction = digitalio.Direction.OUTPUT
         self.running = False
         self.relay.value = False
+        self.history = None
+        self.history_subject = 0
+        self.on_at = None
+
+    # Records every pump on/off (with the run time) in the history log as subject
+    def attach_history(self, history, subject: int):
+        self.history = history
+        self.history_subject = subject
 
+    # pump_on/pump_off get called every tick, only an actual change is logged above debug level
     def pump_on(self):
+        self.debug.log(self.debug.DEBUG if self.running else self.debug.INFO, "pump", "Pump ON")
+        if not self.running:
+            self.on_at = time.monotonic()
+            if self.history is not None:
+                self.history.record(PUMP_ON, self.history_subject, 0)
         self.running = True
-        self.debug.print_debug("pump", "Pump ON")
         self.relay.value = True
 
     def pump_off(self):
+        self.debug.log(self.debug.INFO if self.running else self.debug.DEBUG, "pump", "Pump OFF")
+        if self.running and self.history is not None:
+            self.history.record(PUMP_OFF, self.history_subject, time.monotonic() - self.on_at)
         self.running = False
-        self.debug.print_debug("pump", "Pump OFF")
         self.relay.value = False
@@ -3,18 +3,38 @@ import displayio
 import terminalio
 
 from adafruit_display_text import label
-from adafruit_bitmap_font import bitmap_font
-import adafruit_displayio_sh1107
 
 from util.common import CommonFunctions
 from util.debug import Debug
 from util.properties import Properties
 from util.remote_event_notifier import RemoteEventNotifier
+from util.sensor_fusion import SensorFusion
 
 from util.water_level import WaterLevelReader
 
 BORDER = 2
 
+# Status screen lines (color, y). The labels are created once and only their text changes on a refresh,
+# so the periodic status refresh doesn't allocate a new screen every display_interval (only the strings it shows).
+STATUS_LINES = ((0xfffb96, 11), (0xfa7e1e, 34), (0x74d600, 57), (0x8b9dc3, 80), (0xFFFFFF, 104), (0xFFFFFF, 126))
+STATUS_LINES_I2C = ((0xFFFFFF, 7), (0xFFFFFF, 17), (0xFFFFFF, 27), (0xFFFFFF, 37), (0xFFFFFF, 47), (0xFFFFFF, 57))
+
+
+# Only touches the label when the text changed, setting text re-renders the glyphs
+def set_label_text(text_area, text: str):
+    if text_area.text != text:
+        text_area.text = text
+
+
+# "T dry - B +WET+" from the fused readings the state machine runs on, a "?" marks an estimate for a faulty float
+def water_levels_text(fusion: SensorFusion):
+    bottom_has_water, top_has_water = fusion.fused
+    top = len(fusion.readers) - 1
+    return (fusion.readers[top].name[0:1] + " " + (WaterLevelReader.WET if top_has_water else WaterLevelReader.DRY) +
+            ("?" if fusion.faulty[top] else "") + " - " +
+            fusion.readers[0].name[0:1] + " " + (WaterLevelReader.WET if bottom_has_water else WaterLevelReader.DRY) +
+            ("?" if fusion.faulty[0] else ""))
+
 # ***********************************************************************************************
 # PumpingDisplay
 # ***********************************************************************************************
@@ -24,6 +44,8 @@ class PumpingDisplay:
         self.properties = properties
 
         self.display = board.DISPLAY
+        self.status_group = None
+        self.status_labels = []
 
     def initialize_display(self, border:bool):
         # Start the display context,
@@ -56,9 +78,7 @@ class PumpingDisplay:
         return main_group
 
     def display_status(self, address, pump_state:str, remote_notifier: RemoteEventNotifier, program_start, pump_start,
-                       water_level_readers: list[WaterLevelReader]):
-
-        main_group = self.initialize_display(False)
+                       fusion: SensorFusion):
 
         start_elapsed = CommonFunctions.format_elapsed_ms(program_start)
         pump_elapsed = CommonFunctions.format_elapsed_ms(pump_start)
@@ -71,42 +91,34 @@ class PumpingDisplay:
         http_status = "#%sC:%sE#:%d" % (
             "{:,}".format(remote_notifier.http.transaction_count), http,remote_notifier.http.error_count)
 
-        self.debug.print_debug("display","pump_state " + pump_state+
-                               " levels " + water_level_readers[1].print_water_state() + " - " +
-                               water_level_readers[0].print_water_state())
-        self.debug.print_debug("display","http_status " + http_status)
-        self.debug.print_debug("display","start_elapsed " + start_elapsed)
-        self.debug.print_debug("display","pump_elapsed " + pump_elapsed)
+        water_level_status_display = water_levels_text(fusion)
+        self.debug.print_debug("display","pump_state %s levels %s", pump_state, water_level_status_display)
+        self.debug.print_debug("display","http_status %s", http_status)
+        self.debug.print_debug("display","start_elapsed %s", start_elapsed)
+        self.debug.print_debug("display","pump_elapsed %s", pump_elapsed)
 
         if address is None:
             address = "None"
 
-        text_area = label.Label(terminalio.FONT, scale=2, text="Addr: " + address, color=0xfffb96, x=8, y=11) # 0xfeda75
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, scale=2, text="State: " + pump_state, color=0xfa7e1e, x=8, y=34)
-        main_group.append(text_area)
-
-        water_level_status_display = (water_level_readers[1].print_water_state() + " - " +
-                                      water_level_readers[0].print_water_state())
-        text_area = label.Label(terminalio.FONT, scale=2, text=water_level_status_display, color=0x74d600, x=8, y=57)
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, scale=2, text=http_status, color=0x8b9dc3, x=8, y=80)
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, scale=2, text="Start: " + start_elapsed,
-                                color=0xFFFFFF, x=8, y=104)
-        main_group.append(text_area)
+        if self.status_group is None:
+            self.status_group = self.initialize_display(False)
+            for color, y in STATUS_LINES:
+                text_area = label.Label(terminalio.FONT, scale=2, text=" ", color=color, x=8, y=y)
+                self.status_labels.append(text_area)
+                self.status_group.append(text_area)
 
-        text_area = label.Label(terminalio.FONT, scale=2, text="Pump: " + pump_elapsed,
-                                color=0xFFFFFF, x=8, y=126)
-        main_group.append(text_area)
+        set_label_text(self.status_labels[0], "Addr: " + address)
+        set_label_text(self.status_labels[1], "State: " + pump_state)
+        set_label_text(self.status_labels[2], water_level_status_display)
+        set_label_text(self.status_labels[3], http_status)
+        set_label_text(self.status_labels[4], "Start: " + start_elapsed)
+        set_label_text(self.status_labels[5], "Pump: " + pump_elapsed)
 
-        self.display.root_group = main_group
+        if self.display.root_group is not self.status_group:
+            self.display.root_group = self.status_group
 
     def display_remote(self, action):
-        self.debug.print_debug("display","**** display_remote: action " + action)
+        self.debug.print_debug("display","**** display_remote: action %s", action)
 
         main_group = self.initialize_display(True)
 
@@ -122,7 +134,7 @@ class PumpingDisplay:
         self.display.root_group = main_group
 
     def display_messages(self, messages: list[str]):
-        self.debug.print_debug("display","**** display_message_page"+",".join(messages))
+        self.debug.print_debug("display","**** display_message_page%s", lambda: ",".join(messages))
 
         main_group = self.initialize_display(True)
 
@@ -140,7 +152,7 @@ class PumpingDisplay:
 
         self.display.show(main_group)
     def display_error(self, messages: list[str]):
-        self.debug.print_debug("display","**** display_error "+",".join(messages))
+        self.debug.print_debug("display","**** display_error %s", lambda: ",".join(messages))
 
         main_group = self.initialize_display(True)
 
@@ -173,7 +185,11 @@ class PumpingDisplay_i2c:
         # i2c = board.STEMMA_I2C()  # For using the built-in STEMMA QT connector on a microcontroller
         display_bus = displayio.I2CDisplay(i2c, device_address=0x3C)
 
+        # Only the i2c display needs the SH1107 driver, don't pay for the import on the spi boards
+        import adafruit_displayio_sh1107
         self.display = adafruit_displayio_sh1107.SH1107(display_bus, width=self.width, height=self.height, rotation=0)
+        self.status_group = None
+        self.status_labels = []
 
     def initialize_display(self):
         try:
@@ -203,9 +219,7 @@ class PumpingDisplay_i2c:
         return main_group
 
     def display_status(self, address, pump_state:str, remote_notifier: RemoteEventNotifier, program_start, pump_start,
-                       water_level_readers: list[WaterLevelReader]):
-
-        main_group = self.initialize_display()
+                       fusion: SensorFusion):
 
         start_elapsed = CommonFunctions.format_elapsed_ms(program_start)
         pump_elapsed = CommonFunctions.format_elapsed_ms(pump_start)
@@ -218,42 +232,34 @@ class PumpingDisplay_i2c:
         http_status = "#%sC:%sE#:%d" % (
             "{:,}".format(remote_notifier.http.transaction_count), http,remote_notifier.http.error_count)
 
-        self.debug.print_debug("display","pump_state " + pump_state+
-                               " levels " + water_level_readers[1].print_water_state() + " - " +
-                               water_level_readers[0].print_water_state())
-        self.debug.print_debug("display","http_status " + http_status)
-        self.debug.print_debug("display","start_elapsed " + start_elapsed)
-        self.debug.print_debug("display","pump_elapsed " + pump_elapsed)
+        water_level_status_display = water_levels_text(fusion)
+        self.debug.print_debug("display","pump_state %s levels %s", pump_state, water_level_status_display)
+        self.debug.print_debug("display","http_status %s", http_status)
+        self.debug.print_debug("display","start_elapsed %s", start_elapsed)
+        self.debug.print_debug("display","pump_elapsed %s", pump_elapsed)
 
         if address is None:
             address = "None"
 
-        text_area = label.Label(terminalio.FONT, text="Addr: " + address, color=0xFFFFFF, x=8, y=7)
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, text="State: " + pump_state, color=0xFFFFFF, x=8, y=17)
-        main_group.append(text_area)
+        if self.status_group is None:
+            self.status_group = self.initialize_display()
+            for color, y in STATUS_LINES_I2C:
+                text_area = label.Label(terminalio.FONT, text=" ", color=color, x=8, y=y)
+                self.status_labels.append(text_area)
+                self.status_group.append(text_area)
 
-        water_level_status_display = (water_level_readers[1].print_water_state() + " - " +
-                                      water_level_readers[0].print_water_state())
-        text_area = label.Label(terminalio.FONT, text=water_level_status_display, color=0xFFFFFF, x=8, y=27)
-        main_group.append(text_area)
+        set_label_text(self.status_labels[0], "Addr: " + address)
+        set_label_text(self.status_labels[1], "State: " + pump_state)
+        set_label_text(self.status_labels[2], water_level_status_display)
+        set_label_text(self.status_labels[3], http_status)
+        set_label_text(self.status_labels[4], "Start: " + start_elapsed)
+        set_label_text(self.status_labels[5], "Pump: " + pump_elapsed)
 
-        text_area = label.Label(terminalio.FONT, text=http_status, color=0xFFFFFF, x=8, y=37)
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, text="Start: " + start_elapsed,
-                                color=0xFFFFFF, x=8, y=47)
-        main_group.append(text_area)
-
-        text_area = label.Label(terminalio.FONT, text="Pump: " + pump_elapsed,
-                                color=0xFFFFFF, x=8, y=57)
-        main_group.append(text_area)
-
-        self.display.show(main_group)
+        if self.display.root_group is not self.status_group:
+            self.display.show(self.status_group)
 
     def display_remote(self, action):
-        self.debug.print_debug("display","**** display_remote: action " + action)
+        self.debug.print_debug("display","**** display_remote: action %s", action)
 
         main_group = self.initialize_display()
 
@@ -286,7 +292,7 @@ class PumpingDisplay_i2c:
         self.display.show(main_group)
 
     def display_error(self, error):
-        self.debug.print_debug("display","**** display_error: " + error)
+        self.debug.print_debug("display","**** display_error: %s", error)
 
         main_group = self.initialize_display()
 
@@ -0,0 +1,154 @@
+import time
+
+import wifi
+
+from util.debug import Debug
+
+LEASE_SECONDS = 3600  # The address DHCP gave is set directly for this long, later a wake asks DHCP again
+
+# Association kinds
+FULL = 0  # Scan all channels, then DHCP
+FAST = 1  # Straight to the cached access point and channel
+KINDS = ("full", "fast")
+
+
+# Powers the radio down while every station is idle and nothing was sent for radio_idle_seconds (0 keeps it on),
+# the next request connects again. The idle traffic is one status handshake every few minutes, the radio doesn't
+# have to stay associated in between. While powered down the metrics server and the MQTT cmd feed don't answer.
+#
+# Every association goes through associate(). After a full one the access point (BSSID, channel) and the DHCP
+# address are kept, the next one connects to that access point without a scan, and sets the address instead of
+# asking DHCP while it is younger than LEASE_SECONDS. A fast association that fails falls back to a full one.
+class RadioPower:
+    def __init__(self, http, debug: Debug):
+        self.http = http
+        self.debug = debug
+        self.asleep = False
+        self.bssid = None
+        self.channel = None
+        self.address = None  # (ipv4, netmask, gateway, dns) from DHCP
+        self.leased_at = None
+        self.static = False  # The address was set, DHCP is stopped
+        now = time.monotonic()
+        self.last_traffic = now
+        self.started = now
+        self.on_since = now
+        self.on_seconds = 0
+        self.sleeps = 0
+        self.fallbacks = 0
+        self.stats = [[0, 0, 0], [0, 0, 0]]  # per kind [count, total ms, max ms]
+
+    # Every request, gone through or not
+    def traffic(self):
+        self.last_traffic = time.monotonic()
+
+    # Called every loop, busy while a station isn't idle or something is waiting to be sent
+    def tick(self, busy: bool):
+        if self.asleep:
+            if busy:
+                # One association and ping, like a bring_up_network step. If it fails the radio is still asleep
+                # and the next loop tries again, rather than holding this one up with check_connection's retries.
+                self.debug.print_info("radio", "Busy, waking the radio")
+                self.http.connect(1)
+            return
+        idle = self.http.properties.config.radio_idle_seconds
+        if idle == 0 or busy or self.http.need_to_connect or not self.http.last_http_status_success():
+            return
+        now = time.monotonic()
+        if now - self.last_traffic < idle:
+            return
+        self.debug.print_info("radio", "Idle %d s, powering the radio down", lambda: int(now - self.last_traffic))
+        self.http.power_down_radio()
+        self.asleep = True
+        self.sleeps += 1
+        self.on_seconds += now - self.on_since
+
+    # In place of wifi.radio.connect(), powers the radio up if needed. Raises what a full connect raises.
+    def associate(self, ssid: str, password: str):
+        start = time.monotonic()
+        if not wifi.radio.enabled:
+            wifi.radio.enabled = True
+        if self.bssid is not None:
+            try:
+                if self.address is not None and start - self.leased_at < LEASE_SECONDS:
+                    wifi.radio.set_ipv4_address(ipv4=self.address[0], netmask=self.address[1],
+                                                gateway=self.address[2], ipv4_dns=self.address[3])
+                    self.static = True
+                else:
+                    self.use_dhcp()
+                wifi.radio.connect(ssid, password, channel=self.channel, bssid=self.bssid)
+                self.awake(start)
+                self.record(FAST, start)
+                if not self.static:
+                    self.remember()  # A new lease
+                return
+            except Exception as e:
+                self.fallbacks += 1
+                self.debug.print_warning("radio", "Fast association failed, scanning: %s", str(e))
+                self.forget()
+        wifi.radio.connect(ssid, password)
+        self.awake(start)
+        self.record(FULL, start)  # With a failed fast try, that is part of it
+        self.remember()
+
+    # Asleep until an association goes through, a failed wake is tried again from tick()
+    def awake(self, start):
+        if self.asleep:
+            self.asleep = False
+            self.on_since = start
+
+    # The access point and the address of the association that just went through
+    def remember(self):
+        try:
+            ap = wifi.radio.ap_info
+            if ap is None:
+                return
+            self.bssid = bytes(ap.bssid)
+            self.channel = ap.channel
+            self.address = (wifi.radio.ipv4_address, wifi.radio.ipv4_subnet, wifi.radio.ipv4_gateway,
+                            wifi.radio.ipv4_dns)
+            self.leased_at = time.monotonic()
+        except Exception as e:
+            self.debug.print_warning("radio", "Can't keep the access point: %s", str(e))
+            self.forget()
+
+    # The next association scans and asks DHCP, e.g. after a reconnect with the credentials read again
+    def forget(self):
+        self.bssid = None
+        self.channel = None
+        self.address = None
+        self.leased_at = None
+        self.use_dhcp()
+
+    def use_dhcp(self):
+        if self.static:
+            wifi.radio.start_dhcp()
+            self.static = False
+
+    def record(self, kind: int, start):
+        ms = int((time.monotonic() - start) * 1000)
+        stats = self.stats[kind]
+        stats[0] += 1
+        stats[1] += ms
+        stats[2] = max(stats[2], ms)
+        self.debug.print_debug("radio", "%s association %d ms", KINDS[kind], ms)
+
+    def on_seconds_per_day(self):
+        now = time.monotonic()
+        on = self.on_seconds + (0 if self.asleep else now - self.on_since)
+        elapsed = now - self.started
+        return int(on * 86400 / elapsed) if elapsed > 0 else 0
+
+    # {"asleep", "sleeps", "fallbacks", "on_per_day" s, kind: [count, mean ms, max ms]}
+    def summary(self):
+        summary = {"asleep": self.asleep, "sleeps": self.sleeps, "fallbacks": self.fallbacks,
+                   "on_per_day": self.on_seconds_per_day()}
+        for i in range(len(KINDS)):
+            stats = self.stats[i]
+            summary[KINDS[i]] = [stats[0], stats[1] // stats[0] if stats[0] else 0, stats[2]]
+        return summary
+
+    # [(labels, value)] of one summary column per association kind, for the MetricsServer
+    def metric_values(self, column: int):
+        summary = self.summary()
+        return [('kind="%s"' % KINDS[i], summary[KINDS[i]][column]) for i in range(len(KINDS))]
@@ -3,86 +3,214 @@ import gc
 import json
 from util.debug import Debug
 from util.http_functions import HttpFunctions
+from util.log_uploader import DEFERRED, LogUploader
+from util.outbound_queue import BULK, CONTROL, OutboundQueue, ok
 from util.properties import Properties
 
+# One notifier per station. Stations on the same board share the connection (http) and the debug log upload,
+# each keeps its own event id and tags its posts with its station name (see for_station).
 class RemoteEventNotifier:
-    def __init__(self, properties: Properties, debug: Debug):
-        self.http = HttpFunctions(properties, debug)
+    def __init__(self, properties: Properties, debug: Debug, station: str = None, http: HttpFunctions = None,
+                 log_uploader: LogUploader = None, outbound: OutboundQueue = None):
+        self.properties = properties
         self.debug = debug
+        self.http = http if http is not None else self.create_transport()
+        self.station = station
+        self.event_id = "None"
+        self.minted = False  # event_id was minted on the device for a pumping cycle, the remote's doesn't replace it
+        if log_uploader is None:
+            log_uploader = LogUploader(self.http, debug, properties.config.debug_log_chunk_size)
+        self.log_uploader = log_uploader
+        if outbound is None:
+            outbound = OutboundQueue(debug)
+            outbound.bulk_depth = lambda: len(debug.remote_lines)
+        self.outbound = outbound  # Shared by the stations like the connection
+
+    # "transport" in secrets.json: "http" (default) or "mqtt"
+    def create_transport(self):
+        transport = self.properties.config.transport.lower()
+        if transport == "mqtt":
+            # Only boards on mqtt load it
+            from util.mqtt_functions import MqttFunctions
+            return MqttFunctions(self.properties, self.debug)
+        if transport != "http":
+            self.debug.print_warning("remote", "Unknown transport %s, using http", transport)
+        return HttpFunctions(self.properties, self.debug)
+
+    # Notifier for another station on the same board
+    def for_station(self, station: str):
+        return RemoteEventNotifier(self.properties, self.debug, station, self.http, self.log_uploader, self.outbound)
+
+    # Puts this station's event id on the shared connection for the post, and keeps the one the remote returns
+    def select(self):
+        self.http.station = self.station
+        self.http.event_id = self.event_id
+
+    # Goes through the outbound queue: control first (a queued one before a new one), status within its rate limit.
+    # Returns None when the post was held back.
+    def action_post(self, api_action: str, pump_state: str, misc_status):
+        priority, retry = self.outbound.classify(api_action)
+        if priority == CONTROL:
+            self.outbound.send_retries(self.http)
+        elif not self.outbound.allow(priority):
+            self.debug.print_debug("remote", "%s deferred, over its rate", api_action)
+            self.http.remote_cmd = None
+            return None
+        seq = self.http.next_sequence()
+        if retry and (self.outbound.retries or not self.http.last_http_status_success()):
+            # Behind the ones already queued, or until the connection is back
+            self.outbound.queue_retry(self, api_action, pump_state, misc_status, seq)
+            return None
+        response = self.post(api_action, pump_state, misc_status, seq=seq)
+        if ok(response):
+            self.outbound.sent(priority)
+        elif retry:
+            self.outbound.queue_retry(self, api_action, pump_state, misc_status, seq)
+        return response
+
+    # Posts right away. event_id and seq are for a queued notification, which goes out with the id it was made for
+    # and the sequence number of its first try.
+    def post(self, api_action: str, pump_state: str, misc_status, event_id=None, seq=None):
+        self.select()
+        if event_id is not None:
+            self.http.event_id = event_id
+        self.http.request_seq = seq if seq is not None else self.http.next_sequence()
+        response = self.http.do_action_post(api_action, pump_state, misc_status)
+        self.http.request_seq = None
+        if event_id is None and not self.minted:
+            self.event_id = self.http.event_id
+        return response
+
+    # The pumping cycle's id, minted on the device (see get_pumping_id). The remote adopts it, or maps it to its own
+    # if it answers with another one, the posts keep carrying this one until reset_id.
+    def begin_event(self, event_id: str):
+        self.event_id = event_id
+        self.minted = True
+        self.debug.print_info("remote", "Event id %s", event_id)
+
+    # Called every loop: sends the queued control notifications once the connection is back
+    def send_queued(self):
+        if self.outbound.retries:
+            self.outbound.send_retries(self.http)
+
+    # A reply the remote pushed for this station outside a request (mqtt). Takes its event id and config patch,
+    # returns the cmd or None.
+    def take_pushed_cmd(self):
+        reply = self.http.pushed.pop(self.station, None)
+        if reply is None:
+            return None
+        if "eventId" in reply and not self.minted:
+            self.event_id = reply["eventId"]
+        if reply.get("config") is not None:
+            self.http.remote_config = reply["config"]
+        return reply.get("cmd")
+
+    # Called every loop after the stations' notifications: sends at most one error report, not while control
+    # notifications are queued or the connection is down
+    def send_errors(self):
+        if not self.outbound.retries and self.http.last_http_status_success():
+            self.http.send_next_error()
+
+    # Nothing waiting to be sent: no queued control notification, no error report
+    def quiet(self):
+        return not self.outbound.retries and self.http.errors.pending() == 0
+
+    def error_post(self, action, error=None):
+        self.select()
+        return self.http.do_error_post(action, error)
+
+    def reset_id(self):
+        self.select()
+        self.http.reset_id()
+        self.event_id = self.http.event_id
+        self.minted = False
 
     def send_startup_notification(self, misc_status: json):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_startup_notification")
-            return self.http.do_action_post("startup_notification", "startup", misc_status)
+            return self.action_post("startup_notification", "startup", misc_status)
 
     def send_status_handshake(self, pump_state: str, misc_status: json):
         if self.http.last_http_status_success():
-            self.debug.print_debug("remote","status_handshake " + str(pump_state))
-            return self.http.do_action_post("status_handshake", pump_state, misc_status)
+            self.debug.print_debug("remote","status_handshake %s", pump_state)
+            return self.action_post("status_handshake", pump_state, misc_status)
 
     def send_unknown_status(self, pump_state: str):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_unknown_status")
-            return self.http.do_action_post("send_unknown_status", pump_state, "None")
+            return self.action_post("send_unknown_status", pump_state, "None")
         else:
             return None
 
     def send_pumping_canceled_ack(self, pump_state: str):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_pumping_canceled_ack")
-            return self.http.do_action_post("pumping_canceled_ack", pump_state, "None")
+            return self.action_post("pumping_canceled_ack", pump_state, "None")
         else:
             return None
 
     def send_start_pumping_ack(self, pump_state: str):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_start_pumping_ack")
-            return self.http.do_action_post("start_pumping_ack", pump_state, "None")
+            return self.action_post("start_pumping_ack", pump_state, "None")
         else:
             return None
 
     def send_stop_pumping_ack(self, pump_state: str):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_stop_pumping_ack")
-            return self.http.do_action_post("stop_pumping_ack", pump_state, "None")
+            return self.action_post("stop_pumping_ack", pump_state, "None")
         else:
             return None
 
     def send_ready_to_pump(self, pump_state: str):
-        # This is the point in the lifecyle where an event id is assigned.
-        # We only go forward once we get the event id from the server
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","send_ready_to_pump")
-            return self.http.do_action_post("ready_to_pump", pump_state, "None")
+            return self.action_post("ready_to_pump", pump_state, "None")
         else:
             return None
 
+    # The start of a pumping cycle, its event id is already minted. Queued, sent with the next queued control
+    # notifications (send_queued), so the tick that could start the pump doesn't wait on it.
+    def queue_ready_to_pump(self, pump_state: str):
+        self.debug.print_debug("remote","queue_ready_to_pump")
+        self.outbound.queue_retry(self, "ready_to_pump", pump_state, "None", self.http.next_sequence())
+
+    # Queued when the connection is down, see OutboundQueue
     def pump_event(self, pump_state: str, misc_status: json):
-        if self.http.last_http_status_success():
-            self.debug.print_debug("remote","pump_event")
-            return self.http.do_action_post("pump_event", pump_state, misc_status)
-        else:
-            return None
+        self.debug.print_debug("remote","pump_event")
+        return self.action_post("pump_event", pump_state, misc_status)
 
     def pumping_confirmed(self, pump_state: str):
         if self.http.last_http_status_success():
             self.debug.print_debug("remote","pumping_confirmed")
-            return self.http.do_action_post("pumping_confirmed", pump_state, "None")
+            return self.action_post("pumping_confirmed", pump_state, "None")
         else:
             return None
 
+    # Queued when the connection is down, see OutboundQueue
     def pumping_timout(self, pump_state: str, misc_status: json):
-        if self.http.last_http_status_success():
-            self.debug.print_debug("remote","pumping_timeout")
-            return self.http.do_action_post("pumping_timeout", pump_state, misc_status)
-        else:
-            return None
+        self.debug.print_debug("remote","pumping_timeout")
+        return self.action_post("pumping_timeout", pump_state, misc_status)
 
     def missed_pumping_verification(self, pump_state: str):
         self.debug.print_debug("remote","missed_pumping_verification")
-        return self.http.do_action_post("missed_pumping_verification", pump_state, "None")
+        return self.action_post("missed_pumping_verification", pump_state, "None")
+
+    def send_config_ack(self, pump_state: str, version, applied: bool, errors: list[str]):
+        self.debug.print_debug("remote","send_config_ack %s", version)
+        return self.action_post("config_ack", pump_state,
+                                {"configVersion": version, "applied": str(applied), "errors": errors})
 
-    def send_debug_logs_to_remote(self):
+    # busy (a pump running) holds the upload back, so is a queued control notification and the bulk rate limit
+    def send_debug_logs_to_remote(self, busy: bool = False):
         #  self.debug.print_debug("remote","\n***** send_logs_to_remote. Number of log lines: "+str(len(self.debug.get_remote_lines()))+"\n")
-        self.http.do_debug_log_post(self.debug.get_remote_lines())
-        self.debug.clear_remote_lines()
+        # Lines are only freed once the remote has them, otherwise they are sent again next time.
+        chunks_sent = self.log_uploader.chunks_sent
+        self.outbound.bulk_taken = 0
+        response = self.log_uploader.upload(lambda size: self.outbound.allow_bulk(size, busy))
+        if response is not DEFERRED and not ok(response):
+            self.outbound.bulk_failed()
+        if self.log_uploader.chunks_sent > chunks_sent:
+            self.outbound.sent(BULK, self.log_uploader.chunks_sent - chunks_sent)
+        return response
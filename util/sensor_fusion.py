@@ -0,0 +1,176 @@
+from util.fill_rate_model import FillRateModel, now_ms
+
+HEALTHY = 100
+FAULTY_BELOW = 50  # A sensor under this score is not trusted
+TRUSTED_AT = 80  # and only trusted again once back up to this
+DISAGREEMENT_PENALTY = 20  # Higher float wet over a lower dry one
+TIMING_PENALTY = 60  # Float didn't move although the fill/drain model says it should have
+RECOVERY = 10  # Every consistent change of state
+STUCK_FACTOR = 1.5  # How far past the expected fill/drain time before a float is suspected
+DEFAULT_FILL_SECONDS = 600  # Used before the model has seen a fill
+DEFAULT_DRAIN_SECONDS = 60  # Used before the model has seen a drain
+
+
+# Combines the water level readers (ordered bottom to top, digital or analog) into the bottom/top readings the
+# controller runs on, and keeps a health score per reader.
+#
+# Evidence against a reader:
+#   - disagreement: a higher float is wet while a lower one is dry. The reader that hasn't changed state for
+#     longer is blamed, a stuck float is the one that stopped moving while the others kept cycling.
+#   - timing: with the pump off the bottom float has been wet STUCK_FACTOR times the usual fill time and the
+#     top never tripped (top stuck off), or the pump ran STUCK_FACTOR times the usual drain time and the bottom
+#     never went dry (bottom stuck on).
+# A consistent change of state earns the score back. A reader below FAULTY_BELOW is replaced by a virtual
+# reading from the fill rate model, so the pump keeps cycling on the remaining sensor:
+#   - no bottom: wet while the pump has run less than the usual drain time, otherwise follows the top float
+#   - no top: trips once the bottom float has been wet for the usual fill time
+class SensorFusion:
+    def __init__(self, readers: list, fill_model: FillRateModel):
+        self.readers = readers
+        self.fill_model = fill_model
+        count = len(readers)
+        self.health = [HEALTHY] * count
+        self.faulty = [False] * count
+        self.raw = [None] * count
+        self.changed_at = [None] * count
+        self.disagreements = [0] * count
+        self.pump_running = False
+        self.pump_changed_at = None
+        self.fused = (False, False)
+        self.fault_changed = False  # Set when a reader became faulty or recovered, the controller reports it
+        self.changed = 0  # Bit per reader whose raw reading changed in the last read
+
+    # Call once per tick, every call counts as evidence. Returns (bottom_has_water, top_has_water),
+    # also kept in self.fused for anything else that needs the readings within the tick
+    def read(self, pump_running: bool):
+        # Integer ms throughout, the float arithmetic of time.monotonic() allocates on every tick
+        now = now_ms()
+
+        if pump_running != self.pump_running or self.pump_changed_at is None:
+            self.pump_running = pump_running
+            self.pump_changed_at = now
+
+        changed = 0
+        for i in range(len(self.readers)):
+            value = self.readers[i].water_present()
+            if value != self.raw[i]:
+                if self.raw[i] is not None:
+                    changed |= 1 << i
+                self.changed_at[i] = now
+                self.raw[i] = value
+        for i in range(len(self.readers)):
+            if changed & (1 << i) and not self.inconsistent(i):
+                self.adjust(i, RECOVERY)
+
+        self.changed = changed
+        self.check_disagreement()
+        self.check_timing(now)
+        bottom = self.fused_bottom(now)
+        top = self.fused_top(now)
+        if bottom != self.fused[0] or top != self.fused[1]:
+            # Only a change allocates a new tuple
+            self.fused = (bottom, top)
+        return self.fused
+
+    # (bottom_has_water, top_has_water) from a fresh reading that isn't counted as evidence, for a check that polls
+    # faster than once per tick (the manual pump button)
+    def peek(self):
+        now = now_ms()
+        raw = self.raw
+        self.raw = [reader.water_present() for reader in self.readers]
+        try:
+            return self.fused_bottom(now), self.fused_top(now)
+        finally:
+            self.raw = raw
+
+    # Is reader i on the wrong side of any other reader (wet above a dry one, or dry below a wet one)
+    def inconsistent(self, i):
+        for j in range(len(self.readers)):
+            if j == i or self.faulty[j]:
+                continue
+            if (j < i and self.raw[i] and not self.raw[j]) or (j > i and self.raw[j] and not self.raw[i]):
+                return True
+        return False
+
+    def check_disagreement(self):
+        for upper in range(1, len(self.readers)):
+            for lower in range(upper):
+                if self.raw[upper] and not self.raw[lower] and not self.faulty[upper] and not self.faulty[lower]:
+                    # The one that stopped moving first is the suspect
+                    blamed = upper if self.changed_at[upper] <= self.changed_at[lower] else lower
+                    self.disagreements[blamed] += 1
+                    self.adjust(blamed, -DISAGREEMENT_PENALTY)
+
+    def check_timing(self, now):
+        bottom = 0
+        top = len(self.readers) - 1
+        if not self.pump_running and not self.faulty[bottom] and not self.faulty[top] and \
+                self.raw[bottom] and not self.raw[top]:
+            if now - self.changed_at[bottom] > self.fill_ms() * STUCK_FACTOR and self.changed_at[top] <= self.changed_at[bottom]:
+                self.adjust(top, -TIMING_PENALTY)
+        if self.pump_running and not self.faulty[bottom] and self.raw[bottom]:
+            if now - max(self.pump_changed_at, self.changed_at[bottom]) > self.drain_ms() * STUCK_FACTOR:
+                self.adjust(bottom, -TIMING_PENALTY)
+
+    def adjust(self, i, amount):
+        self.health[i] = max(0, min(HEALTHY, self.health[i] + amount))
+        faulty = self.health[i] < FAULTY_BELOW if not self.faulty[i] else self.health[i] < TRUSTED_AT
+        if faulty != self.faulty[i]:
+            self.faulty[i] = faulty
+            self.fault_changed = True
+
+    def fill_ms(self):
+        return int((self.fill_model.fill_seconds or DEFAULT_FILL_SECONDS) * 1000)
+
+    def drain_ms(self):
+        return int((self.fill_model.drain_seconds or DEFAULT_DRAIN_SECONDS) * 1000)
+
+    # Reading of the first trusted reader in indexes, None if none of them is trusted
+    def trusted(self, indexes):
+        for i in indexes:
+            if not self.faulty[i]:
+                return self.raw[i]
+        return None
+
+    def fused_bottom(self, now):
+        bottom = 0
+        if not self.faulty[bottom]:
+            return self.raw[bottom]
+        if self.pump_running:
+            return now - self.pump_changed_at < self.drain_ms()
+        # Next sensor up that still works
+        value = self.trusted(range(1, len(self.readers)))
+        return self.raw[bottom] if value is None else value
+
+    def fused_top(self, now):
+        top = len(self.readers) - 1
+        if not self.faulty[top]:
+            return self.raw[top]
+        if self.pump_running:
+            return False
+        bottom_wet = self.fused_bottom(now)
+        if self.faulty[0]:
+            # Neither end is trusted, nothing better than the raw readings
+            return self.raw[top]
+        return bottom_wet and now - self.changed_at[0] >= self.fill_ms()
+
+    def all_healthy(self):
+        return True not in self.faulty
+
+    # Name of each faulty reader with "stuck_on"/"stuck_off"
+    def faults(self):
+        result = []
+        for i in range(len(self.readers)):
+            if self.faulty[i]:
+                result.append(self.readers[i].name + (" stuck_on" if self.raw[i] else " stuck_off"))
+        return result
+
+    # Sent in the status object: {name: [health, "ok" | "stuck_on" | "stuck_off", disagreements]}
+    def summary(self):
+        sensors = {}
+        for i in range(len(self.readers)):
+            state = "ok"
+            if self.faulty[i]:
+                state = "stuck_on" if self.raw[i] else "stuck_off"
+            sensors[self.readers[i].name] = [self.health[i], state, self.disagreements[i]]
+        return sensors
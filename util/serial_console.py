@@ -0,0 +1,44 @@
+import sys
+
+import supervisor
+
+MAX_LINE = 80
+
+
+# Line based commands typed on the USB serial console, e.g. "profile".
+# poll() is called every loop and never blocks, it only reads the bytes that are already waiting.
+class SerialConsole:
+    def __init__(self):
+        self.commands = {}
+        self.line = ""
+
+    # handler(args) gets the words after the command and returns the text to print (or None)
+    def register(self, command: str, handler, help_text: str = ""):
+        self.commands[command] = (handler, help_text)
+
+    def poll(self):
+        available = supervisor.runtime.serial_bytes_available
+        if not available:
+            return
+        self.line += sys.stdin.read(available)
+        while "\n" in self.line or "\r" in self.line:
+            end = min([i for i in (self.line.find("\n"), self.line.find("\r")) if i >= 0])
+            command_line = self.line[:end].strip()
+            self.line = self.line[end + 1:]
+            if command_line:
+                self.run(command_line)
+        if len(self.line) > MAX_LINE:
+            self.line = ""
+
+    def run(self, command_line: str):
+        words = command_line.split()
+        command = self.commands.get(words[0])
+        if command is None:
+            print("commands: " + ", ".join(["%s %s" % (name, self.commands[name][1]) for name in self.commands]))
+            return
+        try:
+            output = command[0](words[1:])
+        except Exception as e:
+            output = "%s failed: %s" % (words[0], str(e))
+        if output is not None:
+            print(output)
@@ -28,6 +28,12 @@ class Timer:
         running_time = int(time()) - self.start_time
         return running_time > self.max_seconds
 
+    # Seconds left before is_timed_out(), None when not timing
+    def get_remaining(self):
+        if self.start_time is None or self.max_seconds is None:
+            return None
+        return self.max_seconds - (int(time()) - self.start_time)
+
     def get_elapsed(self):
         if self.start_time is None:
             return "Not timing"
@@ -0,0 +1,132 @@
+import time
+from array import array
+
+WINDOW = 64  # Samples kept per phase, percentiles are over the last WINDOW ticks
+
+# Phases of one main loop tick, in the order code.py marks them
+TICK_PHASES = ("startup", "buttons", "debug_check", "log_flush", "check_state", "network", "display", "notify", "ping",
+               "metrics", "radio", "env", "gc", "sleep", "tick")
+
+
+# time.monotonic() is a float, on the board it loses ms resolution after a few hours of uptime
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+# Rolling window of the last size samples (microseconds) of one phase.
+# Samples go into a preallocated array, percentiles are only computed when somebody asks for them.
+class RollingHistogram:
+    def __init__(self, size: int = WINDOW):
+        self.samples = array("L", [0] * size)
+        self.size = size
+        self.index = 0
+        self.count = 0  # Total samples since reset, the window holds min(count, size) of them
+
+    def add(self, value_us: int):
+        if value_us < 0:
+            value_us = 0
+        elif value_us > 0xFFFFFFFF:
+            value_us = 0xFFFFFFFF
+        self.samples[self.index] = value_us
+        self.index = (self.index + 1) % self.size
+        self.count += 1
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+
+    # [count, min, p50, p99, max] in microseconds, None when there are no samples yet
+    def summary(self):
+        filled = min(self.count, self.size)
+        if filled == 0:
+            return None
+        window = sorted(self.samples[:filled])
+        return [self.count, window[0], window[(filled - 1) // 2], window[(filled - 1) * 99 // 100], window[-1]]
+
+
+# Times the phases of each main loop tick.
+# code.py calls begin_tick() at the top of the loop and mark(phase) at the end of each phase, every mark records
+# the time since the previous mark, so a phase costs one clock read. end_tick() records the whole tick.
+# The one-off boot steps are kept as plain ms values (see code.py boot_timings and HttpFunctions.boot_timings).
+# With a MemoryMonitor the heap is sampled at the same marks.
+class TickProfiler:
+    def __init__(self, phases=TICK_PHASES, window: int = WINDOW, memory=None):
+        self.window = window
+        self.memory = memory
+        self.histograms = {}
+        self.phase_order = []  # CircuitPython dicts don't keep insertion order
+        for phase in phases:
+            self.histograms[phase] = RollingHistogram(window)
+            self.phase_order.append(phase)
+        self.boot = {}
+        self.tick_start = None
+        self.last_mark = None
+
+    def begin_tick(self):
+        self.tick_start = now_us()
+        self.last_mark = self.tick_start
+        if self.memory is not None:
+            self.memory.begin_tick()
+
+    def mark(self, phase: str):
+        now = now_us()
+        if self.last_mark is not None:
+            self.record(phase, now - self.last_mark)
+        self.last_mark = now
+        if self.memory is not None:
+            self.memory.mark(phase)
+
+    def end_tick(self):
+        if self.tick_start is not None:
+            self.record("tick", now_us() - self.tick_start)
+        self.tick_start = None
+        self.last_mark = None
+
+    def record(self, phase: str, value_us: int):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = RollingHistogram(self.window)
+            self.histograms[phase] = histogram
+            self.phase_order.append(phase)
+        histogram.add(value_us)
+
+    def set_boot_timings(self, boot_timings: dict):
+        self.boot = boot_timings
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    # {phase: [count, min, p50, p99, max]} in ms, sent in the status object
+    def summary(self):
+        phases = {}
+        for phase in self.phase_order:
+            values = self.histograms[phase].summary()
+            if values is not None:
+                phases[phase] = [values[0]] + [round(value / 1000, 1) for value in values[1:]]
+        return {"boot_ms": self.boot, "tick_ms": phases}
+
+    # [(labels, ms)] of p50, p99 and max per phase, for the MetricsServer
+    def metric_values(self):
+        values = []
+        for phase in self.phase_order:
+            summary = self.histograms[phase].summary()
+            if summary is None:
+                continue
+            for quantile, index in (("0.5", 2), ("0.99", 3), ("1", 4)):
+                values.append(('phase="%s",quantile="%s"' % (phase, quantile), summary[index] / 1000))
+        return values
+
+    # Table for the serial console
+    def format_table(self):
+        lines = ["%-12s %7s %9s %9s %9s %9s" % ("phase(ms)", "count", "min", "p50", "p99", "max")]
+        phases = self.summary()["tick_ms"]
+        for phase in self.phase_order:
+            if phase not in phases:
+                continue
+            values = phases[phase]
+            lines.append("%-12s %7d %9.1f %9.1f %9.1f %9.1f" % (phase, values[0], values[1], values[2], values[3],
+                                                              values[4]))
+        for step, ms in self.boot.items():
+            lines.append("boot %-16s %6d" % (step, ms))
+        return "\n".join(lines)
@@ -0,0 +1,339 @@
+import struct
+import time
+
+# One file, split into a raw region and an hourly rollup region. Each region is a ring of PAGE_SIZE pages:
+#   page header  "<2sHI"  magic, records in the page, page sequence number (the newest page has the highest)
+#   record       "<IBBh"  log time (s), kind, subject, value
+# The page being filled is kept in RAM and written back at most every flush_seconds (and when it fills up),
+# so a flush is one page write and one file sync whatever the record rate. A reboot loses at most the records
+# since the last flush.
+PAGE_SIZE = 512
+PAGE_HEADER = "<2sHI"
+PAGE_HEADER_SIZE = 8
+RECORD = "<IBBh"
+RECORD_SIZE = 8
+RECORDS_PER_PAGE = (PAGE_SIZE - PAGE_HEADER_SIZE) // RECORD_SIZE
+MAGIC = b"TS"
+
+HISTORY_FILE = "history.bin"
+RAW_PAGES = 64  # 32 KB, ~4000 records
+ROLLUP_PAGES = 32  # 16 KB, ~4000 hourly totals
+RAM_RAW_PAGES = 8  # When CIRCUITPY is read-only the log is kept in RAM only, smaller
+RAM_ROLLUP_PAGES = 4
+FLUSH_SECONDS = 1800
+HOUR = 3600
+VALUE_MAX = 32767
+
+# Record kinds. subject is the station index (SENSOR: station * 16 + sensor index, HTTP: 0)
+STATE = 1  # value: index in PumpingController.STATES
+SENSOR = 2  # value: 1 wet, 0 dry
+PUMP_ON = 3
+PUMP_OFF = 4  # value: run seconds
+HTTP = 5  # value: status code, 0 when the request failed
+# Hourly totals, written to the rollup region when the hour is over. time is the start of the hour.
+HOUR_PUMPS = 16
+HOUR_RUN = 17  # run seconds
+HOUR_HTTP = 18
+HOUR_HTTP_FAILED = 19
+KIND_NAMES = {STATE: "state", SENSOR: "sensor", PUMP_ON: "pump_on", PUMP_OFF: "pump_off", HTTP: "http",
+              HOUR_PUMPS: "hour_pumps", HOUR_RUN: "hour_run", HOUR_HTTP: "hour_http",
+              HOUR_HTTP_FAILED: "hour_http_failed"}
+
+
+# A ring of pages at offset in the storage (an open file, or a bytearray when there is no writable file)
+class PageRing:
+    def __init__(self, storage, offset: int, pages: int):
+        self.storage = storage
+        self.offset = offset
+        self.pages = pages
+        self.page = bytearray(PAGE_SIZE)  # The page being filled
+        self.scratch = bytearray(PAGE_SIZE)  # Reads of the other pages
+        self.page_index = 0
+        self.sequence = 1
+        self.count = 0
+        self.dirty = False
+        self.page_writes = 0
+        self.load()
+
+    def read_page(self, index: int, buffer: bytearray, size: int = PAGE_SIZE):
+        position = self.offset + index * PAGE_SIZE
+        if isinstance(self.storage, bytearray):
+            buffer[0:size] = self.storage[position:position + size]
+        else:
+            self.storage.seek(position)
+            self.storage.readinto(memoryview(buffer)[0:size])
+
+    def write_page(self, index: int, buffer: bytearray):
+        position = self.offset + index * PAGE_SIZE
+        if isinstance(self.storage, bytearray):
+            self.storage[position:position + PAGE_SIZE] = buffer
+        else:
+            self.storage.seek(position)
+            self.storage.write(buffer)
+        self.page_writes += 1
+
+    # (count, sequence) of page index, None if it was never written
+    def page_header(self, index: int):
+        self.read_page(index, self.scratch, PAGE_HEADER_SIZE)
+        magic, count, sequence = struct.unpack_from(PAGE_HEADER, self.scratch, 0)
+        if magic != MAGIC or count > RECORDS_PER_PAGE:
+            return None
+        return count, sequence
+
+    # Continues in the newest page
+    def load(self):
+        newest = None
+        for index in range(self.pages):
+            header = self.page_header(index)
+            if header is not None and (newest is None or header[1] > newest[2]):
+                newest = (index, header[0], header[1])
+        if newest is None:
+            return
+        self.page_index, self.count, self.sequence = newest
+        self.read_page(self.page_index, self.page)
+        if self.count == RECORDS_PER_PAGE:
+            self.next_page()
+
+    def next_page(self):
+        self.page_index = (self.page_index + 1) % self.pages
+        self.sequence += 1
+        self.count = 0
+        for i in range(PAGE_SIZE):
+            self.page[i] = 0
+
+    # Returns True when the page filled up and was written
+    def append(self, at: int, kind: int, subject: int, value: int):
+        struct.pack_into(RECORD, self.page, PAGE_HEADER_SIZE + self.count * RECORD_SIZE, at, kind, subject, value)
+        self.count += 1
+        self.dirty = True
+        if self.count < RECORDS_PER_PAGE:
+            return False
+        self.flush()
+        self.next_page()
+        return True
+
+    def flush(self):
+        if not self.dirty:
+            return False
+        struct.pack_into(PAGE_HEADER, self.page, 0, MAGIC, self.count, self.sequence)
+        self.write_page(self.page_index, self.page)
+        self.dirty = False
+        return True
+
+    # Yields (time, kind, subject, value) oldest first, at or after since
+    def records(self, since: int = 0):
+        order = []
+        for index in range(self.pages):
+            if index == self.page_index:
+                continue
+            header = self.page_header(index)
+            if header is not None:
+                order.append((header[1], index))
+        order.sort()
+        for sequence, index in order:
+            self.read_page(index, self.scratch)
+            count = struct.unpack_from(PAGE_HEADER, self.scratch, 0)[1]
+            for record in self.page_records(self.scratch, count, since):
+                yield record
+        for record in self.page_records(self.page, self.count, since):
+            yield record
+
+    @staticmethod
+    def page_records(page, count, since):
+        for i in range(count):
+            record = struct.unpack_from(RECORD, page, PAGE_HEADER_SIZE + i * RECORD_SIZE)
+            if record[0] >= since:
+                yield record
+
+    # Time of the newest record, None when empty
+    def last_time(self):
+        if self.count > 0:
+            return struct.unpack_from(RECORD, self.page, PAGE_HEADER_SIZE + (self.count - 1) * RECORD_SIZE)[0]
+        previous = (self.page_index - 1) % self.pages
+        header = self.page_header(previous)
+        if header is None or header[0] == 0:
+            return None
+        self.read_page(previous, self.scratch)
+        return struct.unpack_from(RECORD, self.scratch, PAGE_HEADER_SIZE + (header[0] - 1) * RECORD_SIZE)[0]
+
+
+# Compact history of what the pumps did: state transitions, float edges, pump on/off with run time and HTTP
+# outcomes, in fixed width records, plus hourly totals that outlive the raw records.
+#
+# The board has no real time clock, so the log time is powered-on seconds, continued from the newest record
+# after a reboot. "Per hour" and "last 24 h" are in powered-on time.
+# On the board the file can only be written when boot.py remounted CIRCUITPY writable for the code
+# (storage.remount("/", readonly=False)), otherwise the log runs in RAM and is lost on reboot.
+class TimeSeriesLog:
+    def __init__(self, path: str = HISTORY_FILE, raw_pages: int = RAW_PAGES, rollup_pages: int = ROLLUP_PAGES,
+                 flush_seconds: int = FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.persistent = True
+        storage = self.open(path, (raw_pages + rollup_pages) * PAGE_SIZE)
+        if storage is None:
+            self.persistent = False
+            raw_pages = min(raw_pages, RAM_RAW_PAGES)
+            rollup_pages = min(rollup_pages, RAM_ROLLUP_PAGES)
+            storage = bytearray((raw_pages + rollup_pages) * PAGE_SIZE)
+        self.storage = storage
+        self.raw = PageRing(storage, 0, raw_pages)
+        self.rollup = PageRing(storage, raw_pages * PAGE_SIZE, rollup_pages)
+        self.syncs = 0
+
+        last = max(self.raw.last_time() or 0, self.rollup.last_time() or 0)
+        self.base = last + 1 - int(time.monotonic())
+        self.started = self.now()
+        self.hour = self.started // HOUR
+        self.hour_totals = {}  # kind * 256 + subject: total for the current hour
+        self.unflushed_since = None
+
+    # The history file opened for update, created the first time (or started over when the page counts changed).
+    # None when the filesystem is read-only.
+    @staticmethod
+    def open(path: str, size: int):
+        try:
+            storage = open(path, "r+b")
+            storage.seek(0, 2)
+            if storage.tell() == size:
+                return storage
+            storage.close()
+        except OSError:
+            pass
+        try:
+            storage = open(path, "w+b")
+            zeros = bytearray(PAGE_SIZE)
+            for _ in range(size // PAGE_SIZE):
+                storage.write(zeros)
+            storage.flush()
+            return storage
+        except OSError:
+            return None
+
+    def now(self):
+        return self.base + int(time.monotonic())
+
+    def record(self, kind: int, subject: int, value: int):
+        at = self.now()
+        self.roll_hour(at)
+        value = max(-VALUE_MAX, min(VALUE_MAX, int(value)))
+        if self.raw.append(at, kind, subject, value):
+            self.sync()
+        if self.unflushed_since is None:
+            self.unflushed_since = at
+        if kind == PUMP_OFF:
+            self.add_total(HOUR_PUMPS, subject, 1)
+            self.add_total(HOUR_RUN, subject, value)
+        elif kind == HTTP:
+            self.add_total(HOUR_HTTP, 0, 1)
+            if value < 200 or value > 299:
+                self.add_total(HOUR_HTTP_FAILED, 0, 1)
+
+    def add_total(self, kind: int, subject: int, amount: int):
+        key = kind * 256 + subject
+        self.hour_totals[key] = self.hour_totals.get(key, 0) + amount
+
+    # Writes the totals of the hour that just ended to the rollup region
+    def roll_hour(self, at: int):
+        hour = at // HOUR
+        if hour == self.hour:
+            return
+        for key, total in self.hour_totals.items():
+            if self.rollup.append(self.hour * HOUR, key // 256, key % 256, min(VALUE_MAX, total)):
+                self.sync()
+        if self.hour_totals and self.unflushed_since is None:
+            self.unflushed_since = at
+        self.hour_totals = {}
+        self.hour = hour
+
+    # Called every loop, cheap unless a flush is due
+    def tick(self):
+        at = self.now()
+        self.roll_hour(at)
+        if self.unflushed_since is not None and at - self.unflushed_since >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        raw = self.raw.flush()
+        rollup = self.rollup.flush()
+        if raw or rollup:
+            self.sync()
+        self.unflushed_since = None
+
+    def sync(self):
+        if not isinstance(self.storage, bytearray):
+            self.storage.flush()
+            self.syncs += 1
+        self.unflushed_since = None
+
+    # ***********************
+    # Queries
+    # ***********************
+
+    # {kind: total} of the hourly kinds over the last hours, the current hour included. subject None is all.
+    def totals(self, hours: int = 24, subject: int = None):
+        since = self.now() - hours * HOUR
+        totals = {HOUR_PUMPS: 0, HOUR_RUN: 0, HOUR_HTTP: 0, HOUR_HTTP_FAILED: 0}
+        for at, kind, record_subject, value in self.rollup.records(since - HOUR + 1):
+            if kind in totals and self.matches(kind, record_subject, subject):
+                totals[kind] += value
+        for key, total in self.hour_totals.items():
+            if self.matches(key // 256, key % 256, subject):
+                totals[key // 256] += total
+        return totals
+
+    # HTTP totals are for the whole board, they count for every station
+    @staticmethod
+    def matches(kind: int, record_subject: int, subject: int):
+        return subject is None or record_subject == subject or kind == HOUR_HTTP or kind == HOUR_HTTP_FAILED
+
+    # Seconds of history inside the window, so a freshly started log isn't averaged over hours it didn't see
+    def covered_seconds(self, hours: int):
+        oldest = self.started
+        for record in self.rollup.records():
+            oldest = min(oldest, record[0])
+            break
+        return max(60, min(hours * HOUR, self.now() - oldest))
+
+    def pumps_per_hour(self, hours: int = 24, subject: int = None):
+        return self.totals(hours, subject)[HOUR_PUMPS] * HOUR / self.covered_seconds(hours)
+
+    def mean_run_seconds(self, hours: int = 24, subject: int = None):
+        totals = self.totals(hours, subject)
+        if totals[HOUR_PUMPS] == 0:
+            return None
+        return totals[HOUR_RUN] / totals[HOUR_PUMPS]
+
+    def http_failure_rate(self, hours: int = 24):
+        totals = self.totals(hours)
+        if totals[HOUR_HTTP] == 0:
+            return None
+        return totals[HOUR_HTTP_FAILED] / totals[HOUR_HTTP]
+
+    # Raw records at or after since (log time), oldest first, for the serial console
+    def records(self, since: int = 0):
+        return self.raw.records(since)
+
+    # Sent in the status object
+    def summary(self, subject: int = None, hours: int = 24):
+        totals = self.totals(hours, subject)
+        covered = self.covered_seconds(hours)
+        return {
+            "pumps_per_h": round(totals[HOUR_PUMPS] * HOUR / covered, 2),
+            "mean_run_s": None if totals[HOUR_PUMPS] == 0 else round(totals[HOUR_RUN] / totals[HOUR_PUMPS], 1),
+            "http_fail": None if totals[HOUR_HTTP] == 0 else round(totals[HOUR_HTTP_FAILED] / totals[HOUR_HTTP], 3),
+            "hours": round(covered / HOUR, 1),
+            "persistent": self.persistent
+        }
+
+    def format_table(self, hours: int = 24):
+        lines = ["history %s, log time %ds, %d syncs" % ("on flash" if self.persistent else "in RAM only", self.now(),
+                                                         self.syncs)]
+        summary = self.summary(None, hours)
+        lines.append("last %dh: %s pumps/h, mean run %s s, http failures %s" %
+                     (hours, summary["pumps_per_h"], summary["mean_run_s"], summary["http_fail"]))
+        recent = []
+        for record in self.records(self.now() - 600):
+            recent.append("%8d %-9s %3d %6d" % (record[0], KIND_NAMES.get(record[1], record[1]), record[2],
+                                                record[3]))
+        lines.extend(recent[-20:])
+        return "\n".join(lines)
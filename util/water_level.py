@@ -1,3 +1,6 @@
+import time
+from array import array
+
 import board
 import digitalio
 import analogio
@@ -8,6 +11,12 @@ from util.properties import Properties
 LOW_VALUE = 36000
 EMPTY_VALUE = 11000
 
+# Analog sampling defaults, each can be overridden per sensor in secrets.json water_levels (see WaterLevelReaderAnalog)
+SAMPLES = 9  # ADC reads per enable cycle
+SETTLE_MS = 0  # Blocking wait after powering the sensor, the default reads right away like the previous reader did
+TRIM = 2  # Reads dropped at each end for the trimmed mean
+MAX_AGE = 0.15  # Seconds a filtered reading is reused, shorter than the shortest loop sleep so it's one per tick
+
 
 class WaterLevelReader:
     DRY = "dry"
@@ -46,6 +55,13 @@ class WaterLevelReaderAnalog:
     DRY = "dry"
     WET = "wet"
 
+    # water_levels[name] in secrets.json is either the dry threshold (raw ADC value) or
+    #     {"dry": 11000, "samples": 9, "settle_ms": 0, "filter": "median" | "trimmed", "trim": 2,
+    #      "calibration": [[raw, level], ...], "top_level": 120}
+    # settle_ms is only for a sensor measured to need it, it's a sleep in the loop on every reading.
+    # calibration is a piecewise linear curve from the filtered raw value to a level in whatever unit the points
+    # use (e.g. mm or %), it's what get_level() reports. The wet/dry decision stays on the filtered raw value.
+    # top_level is the calibrated level where the top float trips, it lets the fill model predict the trip.
     def __init__(self, name, properties: Properties, enable_pin: board.pin, water_level_pin: board.pin,
                  debug: Debug):
         self.name = name
@@ -57,36 +73,117 @@ class WaterLevelReaderAnalog:
         self.water_enable.switch_to_output()
         self.water_level_sensor = analogio.AnalogIn(water_level_pin)
 
-        self.empty_value = properties.defaults["water_levels"][name]
+        setting = properties.config.water_levels[name]
+        if not isinstance(setting, dict):
+            setting = {"dry": setting}
+        self.empty_value = setting["dry"]
         self.debug = debug
         # self.dry_level = EMPTY_VALUE
         self.dry_level = self.empty_value
         self.wet_level = None
         # self.wet_level = LOW_VALUE
 
+        self.samples = array("H", [0] * max(1, int(setting.get("samples", SAMPLES))))
+        self.settle_seconds = setting.get("settle_ms", SETTLE_MS) / 1000
+        self.use_median = setting.get("filter", "trimmed") == "median"
+        self.trim = min(int(setting.get("trim", TRIM)), (len(self.samples) - 1) // 2)
+        self.calibration = sorted(setting.get("calibration", []))
+        self.top_level = setting.get("top_level")
+        self.level = None
+        self.read_time = None
+
+        # Sensor power accounting
+        self.enable_cycles = 0
+        self.power_on_ns = 0
+
     # Allows the outside to easily tweak the on/off level triggers if/when defaults don't work for a give sensor
     def set_dry_wet(self, dry: int, wet: int):
         self.dry_level = dry
         self.wet_level = wet
 
-    def get_water_level(self):
+    # Powers the sensor once, takes all the reads into the preallocated array and powers it off again
+    def sample(self):
+        start = time.monotonic_ns()
         self.water_enable.value = True
-        millivolts = int(self.water_level_sensor.value * (self.water_level_sensor.reference_voltage * 1000 / 65535))
-        self.water_level = self.water_level_sensor.value
-        self.debug.print_debug("water_level","milli volts "+str(millivolts))
-        self.debug.print_debug("water_level","water_level "+str(self.water_level))
+        if self.settle_seconds > 0:
+            time.sleep(self.settle_seconds)
+        samples = self.samples
+        for i in range(len(samples)):
+            samples[i] = self.water_level_sensor.value
         self.water_enable.value = False
+        self.power_on_ns += time.monotonic_ns() - start
+        self.enable_cycles += 1
+
+    # Insertion sort in place, the array is only a handful of values and this doesn't allocate
+    def sort_samples(self):
+        samples = self.samples
+        for i in range(1, len(samples)):
+            value = samples[i]
+            j = i - 1
+            while j >= 0 and samples[j] > value:
+                samples[j + 1] = samples[j]
+                j -= 1
+            samples[j + 1] = value
+
+    def filter_samples(self):
+        self.sort_samples()
+        samples = self.samples
+        count = len(samples)
+        if self.use_median:
+            middle = count // 2
+            if count % 2:
+                return samples[middle]
+            return (samples[middle - 1] + samples[middle]) // 2
+        total = 0
+        for i in range(self.trim, count - self.trim):
+            total += samples[i]
+        return total // (count - 2 * self.trim)
+
+    def calibrate(self, raw: int):
+        points = self.calibration
+        if not points:
+            return raw
+        if raw <= points[0][0]:
+            return points[0][1]
+        for i in range(1, len(points)):
+            if raw <= points[i][0]:
+                raw_low, level_low = points[i - 1]
+                raw_high, level_high = points[i]
+                return level_low + (level_high - level_low) * (raw - raw_low) / (raw_high - raw_low)
+        return points[-1][1]
+
+    # Filtered raw ADC value. Reused for MAX_AGE seconds, so all the state queries within one tick
+    # (state action, display, status object) share a single enable cycle.
+    def get_water_level(self):
+        now = time.monotonic()
+        if self.read_time is not None and 0 <= now - self.read_time < MAX_AGE:
+            return self.water_level
+        self.sample()
+        self.water_level = self.filter_samples()
+        self.level = self.calibrate(self.water_level)
+        self.read_time = now
+        self.debug.print_debug("water_level","milli volts %d", lambda: int(
+            self.water_level * (self.water_level_sensor.reference_voltage * 1000 / 65535)))
+        self.debug.print_debug("water_level","water_level %s level %s", self.water_level, self.level)
         return self.water_level
 
+    # Calibrated continuous level
+    def get_level(self):
+        self.get_water_level()
+        return self.level
+
+    # Forget the cached reading, the next query powers the sensor again
+    def invalidate(self):
+        self.read_time = None
+
     def get_water_state(self):
         water_state = self.WET
         level = self.get_water_level()
         # self.debug.print_debug("water_level","Before getting water state "+str(level))
         if level >= self.dry_level:
             water_state = self.DRY
-        self.debug.print_debug("water_level","get_water_state: "+
-            self.name + " level value [" + str(self.empty_value) + "/" + str(self.water_level) + "] state " + str(
-                water_state))
+        self.debug.print_debug("water_level","get_water_state: %s level value [%s/%s] state %s",
+                               self.name, self.empty_value, self.water_level, water_state)
         # self.debug.print_debug("water_level","After getting water state "+water_state)
         return water_state
 
@@ -96,7 +193,6 @@ class WaterLevelReaderAnalog:
 
     def print_water_state(self):
         current_state = str(self.get_water_state())
-        self.debug.print_debug(
-            self.name + " level value [" + str(self.empty_value) + "/" + str(self.water_level) + "] state " + str(
-                current_state))
+        self.debug.print_debug("water_level","%s level value [%s/%s] state %s",
+                               self.name, self.empty_value, self.water_level, current_state)
         return self.name[0:1] + " [" + str(self.empty_value) + "/" + str(self.water_level) + "] " + current_state